@@ -0,0 +1,332 @@
+# access_control/face_client.py
+"""Shared client for the face recognition service.
+
+Every Django view talks to the face service through `get_client()` (sync
+views) or `get_async_client()` (async views). Both give a client with a
+keep-alive connection pool, connect and read timeouts, retries with backoff
+for idempotent calls that could not connect or were turned away with
+502/503/504, and a circuit breaker, shared by the whole process, that fails
+fast while the service is down.
+"""
+import asyncio
+import threading
+import time
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from . import instrumentation
+
+# Gateway-style statuses that mean "try again", not "your request was wrong"
+RETRY_STATUSES = {502, 503, 504}
+# A longer Retry-After is passed back to the caller instead of holding the worker
+MAX_RETRY_AFTER = 5  # seconds
+
+
+def _is_load_shed(response):
+    """A 503 with Retry-After is the face service turning work away, not failing."""
+    return response.status_code == 503 and 'Retry-After' in response.headers
+
+
+def _retry_delay(response, backoff, attempt):
+    """Returns how long to wait before retrying `response`, or None if it should not be retried."""
+    retry_after = response.headers.get('Retry-After', '')
+    if not retry_after.isdigit():
+        return backoff * 2 ** attempt
+    return float(retry_after) if int(retry_after) <= MAX_RETRY_AFTER else None
+
+
+class FaceServiceUnavailable(requests.exceptions.ConnectionError):
+    """Raised without touching the network while the circuit breaker is open."""
+
+
+# Everything a face-service call can raise, from either client
+FACE_SERVICE_ERRORS = (requests.exceptions.RequestException, httpx.HTTPError)
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures.
+
+    While open, calls are refused until `reset_timeout` seconds have passed;
+    then a single trial call is let through, and its outcome closes the
+    breaker again or re-opens it.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_in_flight or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """Ends a call that says nothing about the service (e.g. a cancelled one) without counting it either way."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class FaceServiceClient:
+    def __init__(self, base_url, timeout=(3.05, 30), retries=2, backoff=0.5, pool_size=10, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker(failure_threshold=5, reset_timeout=30)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            settings.FACE_SERVICE_URL,
+            timeout=settings.FACE_SERVICE_TIMEOUT,
+            retries=settings.FACE_SERVICE_RETRIES,
+            backoff=settings.FACE_SERVICE_BACKOFF,
+            pool_size=settings.FACE_SERVICE_POOL_SIZE,
+            breaker=_get_breaker(),
+        )
+
+    def request(self, method, path, idempotent=False, **kwargs):
+        """Sends one request, retrying connect errors and 502/503/504 if `idempotent`.
+
+        Read timeouts are never retried: the service may still be running the
+        inference, and retrying would hold the worker for several read
+        timeouts. Returns the final Response (callers decide what a 4xx means)
+        or raises a requests.RequestException once retries are exhausted.
+        """
+        started = time.perf_counter()
+        try:
+            return self._send(method, path, idempotent, **kwargs)
+        finally:
+            instrumentation.record_face_call(time.perf_counter() - started)
+
+    def _send(self, method, path, idempotent, **kwargs):
+        if not self.breaker.allow():
+            raise FaceServiceUnavailable("The face service is unavailable (circuit open).")
+
+        attempts = 1 + (self.retries if idempotent else 0)
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            try:
+                response = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+            except requests.exceptions.ConnectionError:  # ConnectTimeout included
+                self.breaker.record_failure()
+                if last_attempt:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+            except requests.exceptions.RequestException:  # read timeouts, broken responses
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                # Otherwise a half-open breaker would wait for this trial forever
+                self.breaker.release()
+                raise
+
+            if response.status_code not in RETRY_STATUSES or _is_load_shed(response):
+                # A service busy enough to shed load is still up
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                delay = _retry_delay(response, self.backoff, attempt)
+                if delay is not None:
+                    time.sleep(delay)
+                    continue
+            return response
+
+    # --- Face service API ---
+
+    def verify(self, user_id, files):
+        # Verification only reads the gallery, so it is safe to retry
+        return self.request('POST', f"/verify/{user_id}", idempotent=True, files=files)
+
+    def recognize(self, files):
+        return self.request('POST', "/recognize", idempotent=True, files=files)
+
+    def enroll_poses(self, user_id, files):
+        # Enrollment replaces the user's templates as a whole, so repeating it is harmless
+        return self.request('POST', f"/enroll/{user_id}/poses", idempotent=True, files=files)
+
+    def replace_user(self, user_id, files):
+        return self.request('PUT', f"/users/{user_id}", idempotent=True, files=files)
+
+    def remove_user(self, user_id):
+        return self.request('DELETE', f"/users/{user_id}", idempotent=True)
+
+
+class AsyncFaceServiceClient:
+    """The async counterpart of FaceServiceClient, built on httpx.
+
+    An httpx.AsyncClient's connections belong to the event loop that opened
+    them. Given a `loop`, every call runs on that loop whichever loop awaits
+    it, so one client can serve the short-lived loops async_to_sync starts
+    for each request under WSGI as well as the ASGI server's loop.
+    """
+
+    def __init__(self, base_url, timeout=(3.05, 30), retries=2, backoff=0.5, pool_size=10, breaker=None, loop=None):
+        self.loop = loop
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker(failure_threshold=5, reset_timeout=30)
+        connect_timeout, read_timeout = timeout
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip('/'),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    @classmethod
+    def from_settings(cls, loop=None):
+        return cls(
+            settings.FACE_SERVICE_URL,
+            timeout=settings.FACE_SERVICE_TIMEOUT,
+            retries=settings.FACE_SERVICE_RETRIES,
+            backoff=settings.FACE_SERVICE_BACKOFF,
+            pool_size=settings.FACE_SERVICE_POOL_SIZE,
+            breaker=_get_breaker(),
+            loop=loop,
+        )
+
+    async def request(self, method, path, idempotent=False, **kwargs):
+        """Same contract as FaceServiceClient.request, returning an httpx.Response."""
+        started = time.perf_counter()
+        try:
+            if self.loop is None or self.loop is asyncio.get_running_loop():
+                return await self._send(method, path, idempotent, **kwargs)
+            # Cancelling the caller cancels the call on self.loop as well
+            return await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(self._send(method, path, idempotent, **kwargs), self.loop)
+            )
+        finally:
+            instrumentation.record_face_call(time.perf_counter() - started)
+
+    async def _send(self, method, path, idempotent, **kwargs):
+        if not self.breaker.allow():
+            raise FaceServiceUnavailable("The face service is unavailable (circuit open).")
+
+        attempts = 1 + (self.retries if idempotent else 0)
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            try:
+                response = await self.client.request(method, path, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                self.breaker.record_failure()
+                if last_attempt:
+                    raise
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+                continue
+            except httpx.HTTPError:  # read timeouts, broken responses
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                # Cancelled, e.g. by an ASGI client going away; see FaceServiceClient._send
+                self.breaker.release()
+                raise
+
+            if response.status_code not in RETRY_STATUSES or _is_load_shed(response):
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                delay = _retry_delay(response, self.backoff, attempt)
+                if delay is not None:
+                    await asyncio.sleep(delay)
+                    continue
+            return response
+
+    async def verify(self, user_id, files):
+        return await self.request('POST', f"/verify/{user_id}", idempotent=True, files=files)
+
+    async def recognize(self, files):
+        return await self.request('POST', "/recognize", idempotent=True, files=files)
+
+    async def enroll_poses(self, user_id, files):
+        return await self.request('POST', f"/enroll/{user_id}/poses", idempotent=True, files=files)
+
+    async def replace_user(self, user_id, files):
+        return await self.request('PUT', f"/users/{user_id}", idempotent=True, files=files)
+
+    async def remove_user(self, user_id):
+        return await self.request('DELETE', f"/users/{user_id}", idempotent=True)
+
+
+_client = None
+_client_lock = threading.Lock()
+_async_client = None
+_async_loop = None
+_breaker = None
+
+
+def _get_breaker():
+    global _breaker
+    if _breaker is None:
+        _breaker = CircuitBreaker(settings.FACE_SERVICE_BREAKER_THRESHOLD, settings.FACE_SERVICE_BREAKER_RESET)
+    return _breaker
+
+
+def get_client():
+    """Returns the process-wide FaceServiceClient, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = FaceServiceClient.from_settings()
+    return _client
+
+
+def _get_async_loop():
+    """Returns the event loop the async client's connections live on, running in a daemon thread."""
+    global _async_loop
+    if _async_loop is None:
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name='face-client', daemon=True).start()
+        _async_loop = loop
+    return _async_loop
+
+
+def get_async_client():
+    """Returns the process-wide AsyncFaceServiceClient, creating it on first use.
+
+    Its connections stay on one long-lived loop of its own. A client per
+    calling loop would leak one connection pool per request under WSGI,
+    where async_to_sync runs every async view on a new loop that is then
+    thrown away.
+    """
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                _async_client = AsyncFaceServiceClient.from_settings(loop=_get_async_loop())
+    return _async_client
@@ -0,0 +1,147 @@
+# access_control/instrumentation.py
+"""Per-request performance measurements and the per-view aggregates built from them.
+
+RequestMetricsMiddleware puts a RequestMetrics in `current` for every
+sampled request. The database wrapper below and the face-service client add
+to it, so anything running inside that request (including async views and
+their sync_to_async threads, which inherit the context) is counted. When a
+request is not sampled, `current` is None and the hooks do nothing.
+"""
+import contextvars
+import re
+import threading
+import time
+from collections import Counter
+
+current = contextvars.ContextVar('request_metrics', default=None)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\bIN \((?:%s|\?)(?:, ?(?:%s|\?))*\)", re.IGNORECASE)
+
+
+def fingerprint(sql):
+    """Reduces a query to its shape, so the same query with other parameters matches."""
+    sql = _LITERALS.sub('?', sql)
+    return _IN_LISTS.sub('IN (...)', sql)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.queries = Counter()
+        self.face_calls = 0
+        self.face_time = 0.0
+
+    def repeated_queries(self, threshold):
+        """Query shapes run at least `threshold` times: the usual sign of an N+1."""
+        return [(shape, count) for shape, count in self.queries.most_common() if count >= threshold]
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper; installed on every connection by the middleware."""
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.sql_time += time.perf_counter() - started
+        metrics.sql_count += 1
+        metrics.queries[fingerprint(sql)] += 1
+
+
+def record_face_call(seconds):
+    metrics = current.get()
+    if metrics is not None:
+        metrics.face_calls += 1
+        metrics.face_time += seconds
+
+
+class Histogram:
+    """Cumulative histogram, safe to update from several threads."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+
+    def observe(self, value):
+        with self._lock:
+            self._count += 1
+            self._sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+            else:
+                self._counts[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            buckets, running = {}, 0
+            for bound, count in zip(self.buckets + ("+Inf",), self._counts):
+                running += count
+                buckets[str(bound)] = running
+            return {"count": self._count, "sum": round(self._sum, 6), "buckets": buckets}
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class ViewStats:
+    """Histograms for one view: wall time for every request, the rest for sampled ones."""
+
+    def __init__(self):
+        self.wall_time = Histogram(LATENCY_BUCKETS)
+        self.sql_time = Histogram(LATENCY_BUCKETS)
+        self.sql_count = Histogram(QUERY_BUCKETS)
+        self.face_time = Histogram(LATENCY_BUCKETS)
+        self._lock = threading.Lock()
+        self.repeated_queries = Counter()
+
+    def observe(self, seconds, metrics, repeated):
+        self.wall_time.observe(seconds)
+        if metrics is None:
+            return
+        self.sql_time.observe(metrics.sql_time)
+        self.sql_count.observe(metrics.sql_count)
+        if metrics.face_calls:
+            self.face_time.observe(metrics.face_time)
+        if repeated:
+            with self._lock:
+                self.repeated_queries.update(shape for shape, _ in repeated)
+
+    def snapshot(self):
+        with self._lock:
+            repeated = [{'query': shape, 'requests': count} for shape, count in self.repeated_queries.most_common(10)]
+        return {
+            'wall_time': self.wall_time.snapshot(),
+            'sql_time': self.sql_time.snapshot(),
+            'sql_count': self.sql_count.snapshot(),
+            'face_time': self.face_time.snapshot(),
+            'repeated_queries': repeated,
+        }
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def observe(view_name, seconds, metrics, repeated):
+    stats = _stats.get(view_name)
+    if stats is None:
+        with _stats_lock:
+            stats = _stats.setdefault(view_name, ViewStats())
+    stats.observe(seconds, metrics, repeated)
+
+
+def snapshot():
+    """Aggregates for this process, by view name."""
+    with _stats_lock:
+        views = dict(_stats)
+    return {name: stats.snapshot() for name, stats in sorted(views.items())}
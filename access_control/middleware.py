@@ -0,0 +1,89 @@
+# access_control/middleware.py
+import json
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+from . import instrumentation
+
+slow_request_logger = logging.getLogger('access_control.slow_requests')
+
+
+class RequestMetricsMiddleware:
+    """Measures every request and feeds the per-view histograms in access_control.instrumentation.
+
+    Wall time is taken for all requests. For the REQUEST_METRICS_SAMPLE_RATE
+    share that is sampled, SQL query count and time, repeated query shapes
+    and face-service time are recorded too. Requests slower than
+    SLOW_REQUEST_MS are written to the 'access_control.slow_requests' logger
+    as one JSON object each.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token, started = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            self._finish(token)
+        self._record(request, response, metrics, started)
+        return response
+
+    async def __acall__(self, request):
+        metrics, token, started = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            self._finish(token)
+        self._record(request, response, metrics, started)
+        return response
+
+    def _start(self):
+        metrics = None
+        if random.random() < settings.REQUEST_METRICS_SAMPLE_RATE:
+            metrics = instrumentation.RequestMetrics()
+            for connection in connections.all():
+                if instrumentation.record_query not in connection.execute_wrappers:
+                    connection.execute_wrappers.append(instrumentation.record_query)
+        return metrics, instrumentation.current.set(metrics), time.perf_counter()
+
+    def _finish(self, token):
+        instrumentation.current.reset(token)
+
+    def _record(self, request, response, metrics, started):
+        seconds = time.perf_counter() - started
+        match = request.resolver_match
+        view_name = (match.view_name if match else None) or 'unresolved'
+        repeated = metrics.repeated_queries(settings.REQUEST_METRICS_REPEATED_QUERY_THRESHOLD) if metrics else []
+        instrumentation.observe(view_name, seconds, metrics, repeated)
+
+        if seconds * 1000 >= settings.SLOW_REQUEST_MS:
+            entry = {
+                'view': view_name,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'ms': round(seconds * 1000, 1),
+                'sampled': metrics is not None,
+            }
+            if metrics is not None:
+                entry.update({
+                    'sql_count': metrics.sql_count,
+                    'sql_ms': round(metrics.sql_time * 1000, 1),
+                    'face_calls': metrics.face_calls,
+                    'face_ms': round(metrics.face_time * 1000, 1),
+                    'repeated_queries': [{'query': shape, 'count': count} for shape, count in repeated],
+                })
+            slow_request_logger.warning(json.dumps(entry))
@@ -51,6 +51,7 @@ INSTALLED_APPS = [
     'users',
     'logs',
     'sites',
+    'dashboard',
 ]
 
 # Use our custom user model
@@ -68,6 +69,30 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 # URL for the face recognition service
 # Run this service on a different port, e.g., 8001
 FACE_SERVICE_URL = 'http://127.0.0.1:8001'
+# Client settings for access_control/face_client.py
+FACE_SERVICE_TIMEOUT = (3.05, 30)  # (connect, read) seconds
+FACE_SERVICE_RETRIES = 2  # extra attempts for idempotent calls
+FACE_SERVICE_BACKOFF = 0.5  # seconds, doubled on every retry
+FACE_SERVICE_POOL_SIZE = 10  # keep-alive connections per Django process
+FACE_SERVICE_BREAKER_THRESHOLD = 5  # consecutive failures before failing fast
+FACE_SERVICE_BREAKER_RESET = 30  # seconds before a trial call is let through
+
+# Caches. The dashboard data (dashboard/cache.py) uses its own alias so it can be
+# moved to a shared backend on its own. Replace its BACKEND with
+# 'django.core.cache.backends.filebased.FileBasedCache' (LOCATION: a directory) or
+# 'django.core.cache.backends.redis.RedisCache' (LOCATION: 'redis://127.0.0.1:6379',
+# needs the redis package; any Redis-compatible server works) to share it between processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'dashboard': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'dashboard',
+        'TIMEOUT': 300,  # also bounds how stale the rolling 24 h / 7 d / 30 d ranges can get
+    },
+}
+DASHBOARD_CACHE_ALIAS = 'dashboard'
 
 # For development, you can use SQLite (easier setup)
 DATABASES = {
@@ -90,6 +115,8 @@ DATABASES = {
 # }
 
 MIDDLEWARE = [
+    # First, so its timings cover the whole middleware stack
+    'access_control.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -99,6 +126,30 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Request instrumentation (access_control/middleware.py); histograms at /metrics/requests/ for staff
+REQUEST_METRICS_SAMPLE_RATE = 1.0  # share of requests whose SQL and face-service time are measured
+REQUEST_METRICS_REPEATED_QUERY_THRESHOLD = 5  # same query shape this often in one request = likely N+1
+SLOW_REQUEST_MS = 1000  # requests at least this slow go to the 'access_control.slow_requests' log
+
+# Audit exports of the access logs (logs/export.py)
+LOG_EXPORT_CHUNK_SIZE = 2000  # rows fetched per round trip; memory use stays flat however many rows are exported
+
+# Retention of the access logs (logs/archive.py, run by the archive_access_logs command)
+LOG_RETENTION_DAYS = 365  # Completed and Denied logs older than this move to the archive table; must exceed 31
+LOG_ARCHIVE_BATCH_SIZE = 500  # logs moved per transaction, so no transaction holds its locks for long
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # One JSON object per slow request
+        'access_control.slow_requests': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
 ROOT_URLCONF = 'access_control.urls'
 
 
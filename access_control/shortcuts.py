@@ -0,0 +1,7 @@
+# access_control/shortcuts.py
+"""Async counterparts of django.shortcuts, for the apps' async views."""
+from asgiref.sync import sync_to_async
+from django.shortcuts import render
+
+# Template rendering touches the ORM (e.g. request.user in base.html), so async views render in a thread
+arender = sync_to_async(render)
@@ -0,0 +1,58 @@
+# access_control/testing.py
+"""Test helpers shared by the apps' test suites."""
+import shutil
+import tempfile
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .instrumentation import fingerprint
+
+
+class TempMediaRootMixin:
+    """Points MEDIA_ROOT at a temporary directory for the whole test class, so uploaded photos never land in the project."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        media_override.enable()
+        cls.addClassCleanup(media_override.disable)
+
+
+class QueryBudgetMixin:
+    """Checks that a view's query count is fixed as its tables grow.
+
+    assertQueryBudget() grows the data through the test's own seed function
+    to each of SIZES rows, requests the view at every size and fails if the
+    view runs more than `budget` queries, or a different number of queries
+    at different sizes: the shape of an N+1.
+    """
+    SIZES = (10, 1_000, 10_000)
+
+    def assertQueryBudget(self, url, budget, seed, client=None):
+        client = client or self.client
+        counts, shapes, seeded = {}, {}, 0
+        for size in self.SIZES:
+            seed(size - seeded)
+            seeded = size
+            # A cached dashboard would hide the queries we want to count
+            caches[settings.DASHBOARD_CACHE_ALIAS].clear()
+            with CaptureQueriesContext(connection) as captured:
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200, f"GET {url} with {size} rows")
+            counts[size] = len(captured)
+            shapes[size] = Counter(fingerprint(query['sql']) for query in captured.captured_queries)
+
+        largest = self.SIZES[-1]
+        repeated = '\n'.join(f"  {count} x {shape}" for shape, count in shapes[largest].most_common(3))
+        self.assertLessEqual(max(counts.values()), budget,
+                             f"GET {url} went over its budget of {budget} queries: {counts}\n{repeated}")
+        self.assertEqual(len(set(counts.values())), 1,
+                         f"GET {url} runs more queries as the data grows: {counts}\n{repeated}")
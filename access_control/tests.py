@@ -0,0 +1,232 @@
+import asyncio
+from unittest import mock
+
+import httpx
+import requests
+from django.test import SimpleTestCase
+
+from . import face_client
+from .face_client import AsyncFaceServiceClient, CircuitBreaker, FaceServiceClient, FaceServiceUnavailable
+
+
+def sync_response(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return response
+
+
+class CircuitBreakerTest(SimpleTestCase):
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch.object(face_client.time, 'monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.is_open)
+
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.is_open)
+        self.assertFalse(self.breaker.allow())
+
+    def test_lets_one_trial_through_after_the_reset_timeout(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.now += 30
+
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())  # only one trial at a time
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.allow())  # re-opened for another reset_timeout
+
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertFalse(self.breaker.is_open)
+        self.assertTrue(self.breaker.allow())
+
+
+class FaceServiceClientTest(SimpleTestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+        self.client = FaceServiceClient('http://face', retries=2, backoff=0.5, breaker=self.breaker)
+        patcher = mock.patch.object(face_client.time, 'sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def respond(self, *outcomes):
+        return mock.patch.object(self.client.session, 'request', side_effect=outcomes)
+
+    def test_connect_errors_are_retried_with_backoff(self):
+        with self.respond(requests.exceptions.ConnectTimeout(), requests.exceptions.ConnectionError(), sync_response(200)) as send:
+            response = self.client.verify(1, files={})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(send.call_count, 3)
+        self.assertEqual([call.args[0] for call in self.sleep.call_args_list], [0.5, 1.0])
+        self.assertFalse(self.breaker.is_open)
+
+    def test_read_timeouts_are_not_retried(self):
+        with self.respond(requests.exceptions.ReadTimeout(), sync_response(200)) as send:
+            with self.assertRaises(requests.exceptions.ReadTimeout):
+                self.client.verify(1, files={})
+
+        self.assertEqual(send.call_count, 1)
+        self.sleep.assert_not_called()
+        self.assertEqual(self.breaker._failures, 1)
+
+    def test_gateway_errors_are_retried_until_attempts_run_out(self):
+        with self.respond(*[sync_response(502)] * 3) as send:
+            response = self.client.recognize(files={})
+
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(send.call_count, 3)
+        self.assertEqual(self.breaker._failures, 3)
+
+    def test_load_shedding_honours_retry_after_without_tripping_the_breaker(self):
+        busy = sync_response(503, {'Retry-After': '2'})
+        with self.respond(busy, busy, sync_response(200)):
+            self.assertEqual(self.client.verify(1, files={}).status_code, 200)
+
+        self.assertEqual([call.args[0] for call in self.sleep.call_args_list], [2.0, 2.0])
+        self.assertEqual(self.breaker._failures, 0)
+
+    def test_long_retry_after_is_returned_to_the_caller(self):
+        with self.respond(sync_response(503, {'Retry-After': '120'}), sync_response(200)) as send:
+            self.assertEqual(self.client.verify(1, files={}).status_code, 503)
+
+        self.assertEqual(send.call_count, 1)
+        self.sleep.assert_not_called()
+
+    def test_broken_responses_count_as_failures(self):
+        for _ in range(5):
+            self.breaker.record_failure()
+        self.breaker._opened_at -= 30  # half-open: the next call is the trial
+        with self.respond(requests.exceptions.ChunkedEncodingError()):
+            with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                self.client.verify(1, files={})
+        self.assertTrue(self.breaker.is_open)
+        self.assertFalse(self.breaker._trial_in_flight)
+
+    def test_non_idempotent_calls_are_not_retried(self):
+        with self.respond(requests.exceptions.ConnectionError(), sync_response(200)) as send:
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self.client.request('POST', '/enroll/1', files={})
+        self.assertEqual(send.call_count, 1)
+
+    def test_open_breaker_fails_fast(self):
+        with self.respond(*[requests.exceptions.ConnectionError()] * 6) as send:
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self.client.verify(1, files={})
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self.client.verify(1, files={})
+            self.assertTrue(self.breaker.is_open)
+            with self.assertRaises(FaceServiceUnavailable):
+                self.client.verify(1, files={})
+        self.assertEqual(send.call_count, 6)
+
+
+class AsyncFaceServiceClientTest(SimpleTestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+        self.client = AsyncFaceServiceClient('http://face', retries=2, backoff=0.5, breaker=self.breaker)
+        patcher = mock.patch.object(face_client.asyncio, 'sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def respond(self, *outcomes):
+        outcomes = iter(outcomes)
+        self.calls = 0
+
+        def handler(request):
+            self.calls += 1
+            outcome = next(outcomes)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        self.client.client = httpx.AsyncClient(base_url='http://face', transport=httpx.MockTransport(handler))
+
+    async def test_connect_errors_are_retried_with_backoff(self):
+        self.respond(httpx.ConnectError('refused'), httpx.ConnectTimeout('slow'), httpx.Response(200))
+
+        response = await self.client.verify(1, files={'file': b'jpeg'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.calls, 3)
+        self.assertEqual([call.args[0] for call in self.sleep.call_args_list], [0.5, 1.0])
+
+    async def test_read_timeouts_are_not_retried(self):
+        self.respond(httpx.ReadTimeout('slow'), httpx.Response(200))
+
+        with self.assertRaises(httpx.ReadTimeout):
+            await self.client.verify(1, files={'file': b'jpeg'})
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.breaker._failures, 1)
+
+    async def test_load_shedding_does_not_trip_the_breaker(self):
+        self.respond(*[httpx.Response(503, headers={'Retry-After': '1'})] * 3)
+
+        response = await self.client.recognize(files={'file': b'jpeg'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.calls, 3)
+        self.assertEqual(self.breaker._failures, 0)
+        self.assertFalse(self.breaker.is_open)
+
+    async def test_cancelled_trial_lets_a_new_trial_through(self):
+        now = [100.0]
+        started = asyncio.Event()
+
+        async def handler(request):
+            started.set()
+            await asyncio.Event().wait()  # never answers
+
+        self.client.client = httpx.AsyncClient(base_url='http://face', transport=httpx.MockTransport(handler))
+        with mock.patch.object(face_client.time, 'monotonic', side_effect=lambda: now[0]):
+            for _ in range(5):
+                self.breaker.record_failure()
+            now[0] += 30
+            # The client disconnects while the half-open breaker's trial call is waiting
+            trial = asyncio.ensure_future(self.client.verify(1, files={'file': b'jpeg'}))
+            await started.wait()
+            trial.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await trial
+
+            self.assertTrue(self.breaker.is_open)
+            self.assertTrue(self.breaker.allow())
+
+    async def test_gateway_errors_count_as_failures(self):
+        self.respond(httpx.Response(504), httpx.Response(503), httpx.Response(200))
+
+        self.assertEqual((await self.client.verify(1, files={'file': b'jpeg'})).status_code, 200)
+        self.assertEqual([call.args[0] for call in self.sleep.call_args_list], [0.5, 1.0])
+        self.assertEqual(self.breaker._failures, 0)  # reset by the final success
+
+
+class SharedAsyncClientTest(SimpleTestCase):
+    def test_one_client_serves_every_calling_loop(self):
+        handled_on = []
+
+        def handler(request):
+            handled_on.append(asyncio.get_running_loop())
+            return httpx.Response(200)
+
+        async def check_in():
+            client = face_client.get_async_client()
+            client.client = httpx.AsyncClient(base_url='http://face', transport=httpx.MockTransport(handler))
+            await client.verify(1, files={'file': b'jpeg'})
+            return client
+
+        with mock.patch.object(face_client, '_async_client', None):
+            # async_to_sync under WSGI runs each request on a loop of its own, like these
+            clients = [asyncio.run(check_in()), asyncio.run(check_in())]
+
+        self.assertIs(clients[0], clients[1])
+        self.assertEqual(handled_on, [face_client._get_async_loop()] * 2)
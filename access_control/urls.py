@@ -18,6 +18,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from . import views
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -25,6 +26,7 @@ urlpatterns = [
     path("logs/", include("logs.urls")),
     path("", include("sites.urls")), # Makes the 'sites' app the homepage
     path("dashboard/", include("dashboard.urls")),
+    path("metrics/requests/", views.request_metrics, name="request_metrics"),
 ]
 
 if settings.DEBUG:
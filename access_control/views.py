@@ -0,0 +1,14 @@
+# access_control/views.py
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied
+from django.http import JsonResponse
+
+from . import instrumentation
+
+
+@login_required
+def request_metrics(request):
+    """Per-view latency, SQL and face-service histograms for this server process."""
+    if not request.user.is_staff:
+        raise PermissionDenied
+    return JsonResponse({'views': instrumentation.snapshot()})
@@ -0,0 +1,70 @@
+# dashboard/cache.py
+"""Caching for dashboard data, invalidated by a version number.
+
+Every entry key includes the current data version. Writes to access logs
+or sites bump the version (see dashboard/signals.py), so older entries
+are never read again and expire on their own. Until the next write, a
+repeated dashboard hit is served without any SQL for the dashboard data.
+
+The cache is the 'dashboard' alias in CACHES. With the default local
+memory backend each process has its own version, so a write only
+invalidates the process that handled it and the others catch up when
+their entries time out. A file or Redis backend shares the version
+between all processes.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+VERSION_KEY = 'dashboard:version'
+
+
+def get_cache():
+    return caches[settings.DASHBOARD_CACHE_ALIAS]
+
+
+def current_version():
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from the clock rather than 1, so that losing the version key
+        # can't bring an old version and its stale entries back
+        version = time.time_ns()
+        cache.add(VERSION_KEY, version, timeout=None)
+        version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def bump_version():
+    """Invalidates every cached dashboard entry."""
+    cache = get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def user_scope(user):
+    """The part of a cache key that depends on who is asking.
+
+    Every signed-in user currently sees the same dashboard data. If the
+    dashboard starts showing users different data, this must return a
+    different value for each group.
+    """
+    return 'all'
+
+
+def cached(kind, filters, user, compute, *extra):
+    """Returns compute() for this kind of data, filter combination and user scope, caching the result."""
+    key = ':'.join(str(part) for part in (
+        'dashboard', current_version(), kind, user_scope(user),
+        filters['time_filter'], filters['status'], filters['site'],
+        filters['date_from'], filters['date_to'], *extra,
+    ))
+    cache = get_cache()
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value)
+    return value
@@ -0,0 +1,89 @@
+# dashboard/charts.py
+"""Time-series data for the dashboard charts, aggregated in the database."""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from logs.filters import apply_filters, start_of_range
+from logs.models import ArchivedAccessLog, ServerRoomAccessLog
+from logs.rollups import TIMED, VISIT_DURATION, visits_by
+
+# Bucket name -> the first day of the bucket a request day falls in; hours are finer than the rollup
+BUCKETS = {
+    'hour': None,
+    'day': lambda day: day,
+    'week': lambda day: day - timedelta(days=day.weekday()),
+    'month': lambda day: day.replace(day=1),
+}
+# Bucket used when the request doesn't ask for one, by time_filter
+DEFAULT_BUCKETS = {'day': 'hour', 'week': 'day', 'month': 'day', 'all': 'month'}
+
+
+def read_bucket(params, filters):
+    bucket = params.get('bucket', '')
+    return bucket if bucket in BUCKETS else DEFAULT_BUCKETS[filters['time_filter']]
+
+
+def _hourly_totals(filters):
+    """Returns ({hour: (visits, timed, duration)}, {(hour, category): visits}) from the log tables."""
+    trunc = TruncHour('request_timestamp', tzinfo=timezone.get_default_timezone())
+    # Logs are kept longer than the longest rolling range (logs.archive.cutoff),
+    # so only the other ranges can reach archived ones
+    models = [ServerRoomAccessLog] if start_of_range(filters['time_filter']) else [ServerRoomAccessLog, ArchivedAccessLog]
+
+    totals, by_category = {}, {}
+    for model in models:
+        logs = apply_filters(model.objects.all(), filters).annotate(bucket=trunc).order_by()
+        for row in logs.values('bucket', 'category__name').annotate(visits=Count('id'), timed=Count('id', filter=TIMED),
+                                                                      duration=Sum(VISIT_DURATION, filter=TIMED)):
+            _add(totals, by_category, row['bucket'], row['category__name'], (row['visits'], row['timed'], row['duration']))
+    return totals, by_category
+
+
+def _daily_totals(filters, bucket):
+    """Like _hourly_totals, but from DailyAccessRollup: day, week or month buckets cost the same."""
+    tz = timezone.get_default_timezone()
+    bucket_start = BUCKETS[bucket]
+    totals, by_category = {}, {}
+    for (day, category), visits in visits_by(filters, ['day', 'category__name']).items():
+        label = timezone.make_aware(datetime.combine(bucket_start(day), time.min), tz)
+        _add(totals, by_category, label, category, visits)
+    return totals, by_category
+
+
+def _add(totals, by_category, label, category, visits):
+    count, timed, duration = visits
+    total_count, total_timed, total_duration = totals.get(label, (0, 0, timedelta()))
+    totals[label] = (total_count + count, total_timed + timed, total_duration + (duration or timedelta()))
+    key = (label, category or 'Uncategorized')
+    by_category[key] = by_category.get(key, 0) + count
+
+
+def chart_data(filters, bucket):
+    """Returns visit counts, average visit length and category mix per time bucket.
+
+    Logs are bucketed by request_timestamp in the project time zone. Day,
+    week and month buckets are read from DailyAccessRollup, which covers
+    archived logs too; hour buckets from the logs themselves. Each series
+    lines up with `labels`; buckets without any logs are left out.
+    """
+    totals, by_category = _hourly_totals(filters) if bucket == 'hour' else _daily_totals(filters, bucket)
+
+    labels = sorted(totals)
+    positions = {label: i for i, label in enumerate(labels)}
+    categories = {}
+    for (label, name), count in by_category.items():
+        categories.setdefault(name, [0] * len(labels))[positions[label]] = count
+
+    return {
+        'bucket': bucket,
+        'labels': [label.isoformat() for label in labels],
+        'visits': [totals[label][0] for label in labels],
+        'avg_duration_minutes': [
+            round(totals[label][2].total_seconds() / 60 / totals[label][1], 1) if totals[label][1] else None
+            for label in labels
+        ],
+        'categories': dict(sorted(categories.items())),
+    }
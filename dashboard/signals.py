@@ -0,0 +1,20 @@
+# dashboard/signals.py
+"""Invalidates the dashboard cache whenever the data behind it changes.
+
+QuerySet.update() and bulk_create() skip these handlers; code that writes
+logs or sites that way must call dashboard.cache.bump_version() itself.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from logs.models import ServerRoomAccessLog
+from sites.models import ServerLocation
+from .cache import bump_version
+
+
+@receiver([post_save, post_delete], sender=ServerRoomAccessLog)
+@receiver([post_save, post_delete], sender=ServerLocation)
+def invalidate_dashboard(sender, **kwargs):
+    # Bump once the write is committed, so a concurrent reader can't cache the old data under the new version
+    transaction.on_commit(bump_version)
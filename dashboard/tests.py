@@ -1,3 +1,112 @@
-from django.test import TestCase
+import itertools
+from datetime import datetime, time, timedelta
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from access_control.testing import QueryBudgetMixin
+from .charts import BUCKETS, chart_data
+from logs import rollups
+from logs.filters import apply_filters, read_filters
+from logs.models import ActivityCategory, ServerRoomAccessLog
+from sites.models import ServerLocation
+from users.models import CustomUser
+
+
+class DashboardQueryBudgetTest(QueryBudgetMixin, TestCase):
+    """The dashboard reads counts from the rollup and pages its log table, so its query count doesn't depend on the number of logs."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.pic = CustomUser.objects.create_user(username='pic', password='password123', is_staff=True)
+        cls.vendors = [CustomUser.objects.create_user(username=f'vendor{i}', password='password123') for i in range(3)]
+        cls.sites = [ServerLocation.objects.create(name=f'Site {i}', address='Jl. Gedebage', pic=cls.pic) for i in range(2)]
+        cls.categories = [ActivityCategory.objects.create(name=name) for name in ('Maintenance', 'Installation')]
+
+    def setUp(self):
+        self.client.force_login(self.pic)
+
+    def seed(self, count):
+        statuses = itertools.cycle(['Pending', 'Approved', 'Completed', 'Denied'])
+        now = timezone.now()
+        ServerRoomAccessLog.objects.bulk_create([
+            ServerRoomAccessLog(user=self.vendors[i % 3], location=self.sites[i % 2], category=self.categories[i % 2],
+                                notes='Maintenance', status=next(statuses), request_timestamp=now - timedelta(minutes=i),
+                                entry_timestamp=now - timedelta(minutes=i), exit_timestamp=now - timedelta(minutes=i - 30))
+            for i in range(count)
+        ], batch_size=1000)
+        rollups.rebuild()
+
+    def test_dashboard_view(self):
+        self.assertQueryBudget(reverse('dashboard') + '?time_filter=month', 6, self.seed)
+
+    def test_dashboard_logs(self):
+        self.assertQueryBudget(reverse('dashboard_logs') + '?format=json', 3, self.seed)
+
+    def test_chart_data(self):
+        self.assertQueryBudget(reverse('dashboard_chart_data') + '?time_filter=week', 4, self.seed)
+
+
+@override_settings(TIME_ZONE='Asia/Jakarta')
+class ChartDataTest(TestCase):
+    """Charts read from the rollup must match bucketing the raw logs by local request time."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vendor = CustomUser.objects.create_user(username='vendor', password='password123')
+        cls.sites = [ServerLocation.objects.create(name=f'Site {i}', address='Jl. Gedebage') for i in range(2)]
+        categories = [ActivityCategory.objects.create(name=name) for name in ('Maintenance', 'Installation')] + [None]
+        statuses = itertools.cycle(['Pending', 'Approved', 'Checked-In', 'Completed', 'Denied'])
+        now = timezone.now()
+        for i in range(120):
+            # Every 7h13m, so logs land on both sides of local and UTC midnight
+            requested = now - timedelta(minutes=433 * i + 7)
+            status = next(statuses)
+            log = ServerRoomAccessLog(user=vendor, location=cls.sites[i % 2], category=categories[i % 3],
+                                      notes='Maintenance', status=status, request_timestamp=requested)
+            if status in ('Checked-In', 'Completed'):
+                log.entry_timestamp = requested + timedelta(minutes=10)
+            if status == 'Completed':
+                log.exit_timestamp = log.entry_timestamp + timedelta(minutes=20 + i)
+            log.save()  # through the signal handlers that maintain the rollup
+
+    def expected(self, filters, bucket):
+        tz = timezone.get_default_timezone()
+        totals, categories = {}, {}
+        for log in apply_filters(ServerRoomAccessLog.objects.select_related('category'), filters):
+            day = timezone.localtime(log.request_timestamp, tz).date()
+            label = timezone.make_aware(datetime.combine(BUCKETS[bucket](day), time.min), tz).isoformat()
+            visits, durations = totals.setdefault(label, [0, []])
+            totals[label][0] = visits + 1
+            if log.entry_timestamp and log.exit_timestamp:
+                durations.append((log.exit_timestamp - log.entry_timestamp).total_seconds() / 60)
+            by_label = categories.setdefault(log.category.name if log.category else 'Uncategorized', {})
+            by_label[label] = by_label.get(label, 0) + 1
+        labels = sorted(totals)
+        return {
+            'bucket': bucket,
+            'labels': labels,
+            'visits': [totals[label][0] for label in labels],
+            'avg_duration_minutes': [
+                round(sum(totals[label][1]) / len(totals[label][1]), 1) if totals[label][1] else None for label in labels
+            ],
+            'categories': {name: [counts.get(label, 0) for label in labels] for name, counts in sorted(categories.items())},
+        }
+
+    def test_matches_raw_counts(self):
+        for time_filter, bucket, extra in itertools.product(
+                ['all', 'month', 'week'], ['day', 'week', 'month'],
+                [{}, {'status': 'Completed'}, {'site': str(self.sites[1].id)}]):
+            filters = read_filters({'time_filter': time_filter, **extra})
+            with self.subTest(time_filter=time_filter, bucket=bucket, **extra):
+                self.assertEqual(chart_data(filters, bucket), self.expected(filters, bucket))
+
+    def test_date_range(self):
+        today = timezone.localdate()
+        filters = read_filters({'date_from': (today - timedelta(days=20)).isoformat(), 'date_to': (today - timedelta(days=5)).isoformat()})
+        self.assertEqual(chart_data(filters, 'day'), self.expected(filters, 'day'))
+
+    def test_hourly_buckets_are_read_from_the_logs(self):
+        data = chart_data(read_filters({'time_filter': 'day'}), 'hour')
+        self.assertEqual(sum(data['visits']), apply_filters(ServerRoomAccessLog.objects.all(), read_filters({'time_filter': 'day'})).count())
@@ -4,4 +4,6 @@ from . import views
 
 urlpatterns = [
     path('', views.dashboard_view, name='dashboard'),
+    path('logs/', views.dashboard_logs, name='dashboard_logs'),
+    path('charts/', views.get_chart_data, name='dashboard_chart_data'),
 ]
\ No newline at end of file
@@ -1,80 +1,119 @@
 # dashboard/views.py
+from collections import Counter
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count
+from django.http import HttpResponseBadRequest, JsonResponse
+from logs.filters import apply_filters, read_filters
 from logs.models import ServerRoomAccessLog
+from logs.pagination import InvalidCursor, paginate, read_page_size
+from logs.rollups import count_by
 from sites.models import ServerLocation
-from datetime import date, timedelta
-from django.utils import timezone
-import json # Make sure json is imported
+from .cache import cached
+from .charts import chart_data, read_bucket
 
-@login_required
-def dashboard_view(request):
-    # --- Date Filters ---
-    time_filter = request.GET.get('time_filter', 'all')
-    end_date = timezone.now()
-    if time_filter == 'day':
-        start_date = end_date - timedelta(days=1)
-    elif time_filter == 'week':
-        start_date = end_date - timedelta(weeks=1)
-    elif time_filter == 'month':
-        start_date = end_date - timedelta(days=30)
-    else: # 'all'
-        start_date = None
-
-    # --- Other Filters ---
-    status_filter = request.GET.get('status', '')
-    site_filter = request.GET.get('site', '')
-
-    logs = ServerRoomAccessLog.objects.select_related('user', 'location', 'category').all()
-
-    if start_date:
-        logs = logs.filter(request_timestamp__gte=start_date)
-    if status_filter:
-        logs = logs.filter(status=status_filter)
-    if site_filter:
-        logs = logs.filter(location__id=site_filter)
 
+def _filtered_logs(request):
+    filters = read_filters(request.GET)
+    return apply_filters(ServerRoomAccessLog.objects.all(), filters), filters
+
+
+def _dashboard_data(logs, filters):
     # --- Calculate KPIs and Chart Data ---
-    all_logs_count = logs.count()
-    checked_in_count = logs.filter(status='Checked-In').count()
-    completed_count = logs.filter(status='Completed').count()
-    denied_count = logs.filter(status='Denied').count()
-    visits_by_site = list(logs.values('location__name').annotate(count=Count('id')).order_by('-count'))
-    visits_by_category = list(logs.values('category__name').annotate(count=Count('id')).order_by('-count'))
+    # Everything comes from one grouped read of the daily rollup, whatever the time range
+    counts = count_by(filters, ['status', 'location__name', 'category__name'])
+    by_status, by_site, by_category = Counter(), Counter(), Counter()
+    for (status, site_name, category_name), count in counts.items():
+        by_status[status] += count
+        by_site[site_name] += count
+        by_category[category_name] += count
 
-    sites_for_map = ServerLocation.objects.exclude(latitude__isnull=True, longitude__isnull=True)
+    all_sites = list(ServerLocation.objects.only('id', 'name', 'latitude', 'longitude'))
+
+    # Only the first page of the log table is rendered; the rest is fetched from dashboard_logs.
+    # The rows only carry the columns the table shows, which also keeps them small in the cache.
+    log_rows, next_cursor = paginate(
+        logs.select_related('user', 'location')
+        .only('request_timestamp', 'status', 'user__first_name', 'user__last_name', 'location__name')
+    )
+
+    return {
+        'log_rows': log_rows,
+        'next_cursor': next_cursor,
+        'all_sites': all_sites,
+        'all_logs_count': by_status.total(),
+        'checked_in_count': by_status['Checked-In'],
+        'completed_count': by_status['Completed'],
+        'denied_count': by_status['Denied'],
 
-    context = {
-        'all_logs': logs.order_by('-request_timestamp'),
-        'all_sites': ServerLocation.objects.all(),
-        'all_logs_count': all_logs_count,
-        'checked_in_count': checked_in_count,
-        'completed_count': completed_count,
-        'denied_count': denied_count,
-        
         # --- PASS THE PYTHON OBJECTS DIRECTLY ---
-        'visits_by_site_data': visits_by_site,
-        'visits_by_category_data': visits_by_category,
+        'visits_by_site_data': [{'location__name': name, 'count': count} for name, count in by_site.most_common()],
+        'visits_by_category_data': [{'category__name': name, 'count': count} for name, count in by_category.most_common()],
         'sites_json': [
-            {'name': site.name, 'lat': site.latitude, 'lon': site.longitude} 
-            for site in sites_for_map
+            {'name': site.name, 'lat': site.latitude, 'lon': site.longitude}
+            for site in all_sites
+            if site.latitude is not None and site.longitude is not None
         ],
         # ----------------------------------------
-        
-        'site_filter': site_filter,
-        'status_filter': status_filter,
-        'time_filter': time_filter,
+    }
+
+
+@login_required
+def dashboard_view(request):
+    logs, filters = _filtered_logs(request)
+    context = {
+        **cached('context', filters, request.user, lambda: _dashboard_data(logs, filters)),
+        'site_filter': filters['site'],
+        'status_filter': filters['status'],
+        'time_filter': filters['time_filter'],
     }
     return render(request, 'dashboard/dashboard.html', context)
 
+
+@login_required
+def dashboard_logs(request):
+    """One page of the dashboard's log table, as JSON (?format=json) or as table rows.
+
+    Takes the same filters as dashboard_view plus `cursor` and `page_size`.
+    The HTML fragment carries the next page's cursor in the X-Next-Cursor header.
+    """
+    logs, _ = _filtered_logs(request)
+    try:
+        log_rows, next_cursor = paginate(
+            logs.select_related('user', 'location'),
+            cursor=request.GET.get('cursor'),
+            page_size=read_page_size(request.GET),
+        )
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor.")
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'results': [
+                {
+                    'id': log.id,
+                    'user': log.user.get_full_name(),
+                    'site': log.location.name,
+                    'status': log.status,
+                    'status_display': log.get_status_display(),
+                    'request_timestamp': log.request_timestamp.isoformat(),
+                }
+                for log in log_rows
+            ],
+            'next_cursor': next_cursor,
+        })
+
+    response = render(request, 'dashboard/_log_rows.html', {'log_rows': log_rows})
+    response['X-Next-Cursor'] = next_cursor or ''
+    return response
+
+
 @login_required
 def get_chart_data(request):
-    # This view will be called by JavaScript to get updated chart data
-    # ... (Logic to filter and aggregate data based on request.GET parameters) ...
-    
-    data = {
-        'performance': { 'labels': ['Mon', 'Tue', 'Wed'], 'values': [10, 20, 15] },
-        'jobTypes': { 'labels': ['Maintenance', 'Install'], 'values': [25, 10] }
-    }
-    return JsonResponse(data)
\ No newline at end of file
+    """Chart series for the dashboard as JSON, for the same filters as dashboard_view.
+
+    `bucket` (hour, day, week or month) sets the time resolution. Results are
+    cached per filter combination until the next write to logs or sites.
+    """
+    filters = read_filters(request.GET)
+    bucket = read_bucket(request.GET, filters)
+    return JsonResponse(cached('charts', filters, request.user, lambda: chart_data(filters, bucket), bucket))
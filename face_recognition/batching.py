@@ -0,0 +1,89 @@
+import asyncio
+
+from inference import PoolSaturated
+
+
+class MicroBatcher:
+    """Coalesces concurrent requests into one batched call on the inference pool.
+
+    The first request to arrive opens a window of `window_ms`; everything that
+    arrives before it closes (up to `max_batch` items) is handed to
+    `process_batch` together, and each caller gets back its own result.
+    `process_batch` takes a list of inputs and returns a list of the same
+    length whose items are either results or exceptions for that caller.
+    """
+
+    def __init__(self, pool, process_batch, window_ms, max_batch, max_queue):
+        self.pool = pool
+        self.process_batch = process_batch
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.batches = 0
+        self.batched_items = 0
+        self._queue = None
+        self._task = None
+        # The event loop only keeps weak references to tasks; hold on to
+        # running dispatches so they can't be garbage collected mid-batch
+        self._dispatching = set()
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._collect())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, item):
+        if self._queue.qsize() >= self.max_queue:
+            raise PoolSaturated()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Dispatch without waiting so the next window can fill while this batch runs
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatching.add(task)
+            task.add_done_callback(self._dispatching.discard)
+
+    async def _dispatch(self, batch):
+        self.batches += 1
+        self.batched_items += len(batch)
+        try:
+            results = await self.pool.run(self.process_batch, [item for item, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue  # the caller went away
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def metrics(self):
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_batch": self.max_batch,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "mean_batch_size": self.batched_items / self.batches if self.batches else 0.0,
+        }
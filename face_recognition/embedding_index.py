@@ -0,0 +1,165 @@
+import threading
+
+import numpy as np
+
+
+def normalize(embedding) -> np.ndarray:
+    """Returns the embedding as a unit-length float32 vector."""
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class EmbeddingIndex:
+    """Keeps every enrolled face embedding in one NumPy matrix.
+
+    Rows are L2-normalized, so the cosine distance to a probe is a single
+    matrix-vector product. Searches read an immutable (user_ids, matrix, rows,
+    dead) snapshot and never take the lock; writers publish a new one.
+
+    The matrix is a view of a preallocated buffer. New templates are written
+    past the end of the published rows, and replaced or removed ones are only
+    marked dead, so a gallery change costs time in the rows it touches rather
+    than the size of the gallery. Once dead rows make up half the buffer it is
+    compacted into a fresh one.
+    """
+
+    def __init__(self, dim=512, capacity=1024):
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._reset(capacity)
+
+    def __len__(self):
+        user_ids, _, _, dead = self._snapshot
+        return len(user_ids) - len(dead)
+
+    def __contains__(self, user_id):
+        return str(user_id) in self._snapshot[2]
+
+    def add(self, user_id, label, embedding):
+        """Adds or replaces one template (e.g. "front.png") for a user."""
+        self.apply({(user_id, label): embedding})
+
+    def apply(self, templates=None, remove_users=()):
+        """Applies one gallery change atomically: drop `remove_users`, then add `templates`.
+
+        Concurrent searches see either the old gallery or the new one, never a mix.
+        """
+        additions = [(str(user_id), label, normalize(embedding)) for (user_id, label), embedding in (templates or {}).items()]
+        with self._lock:
+            dead = set(self._dead)
+            changed = set()
+            for user_id in {str(user_id) for user_id in remove_users}:
+                labels = self._labels.pop(user_id, None)
+                if labels:
+                    dead.update(labels.values())
+                    changed.add(user_id)
+            self._reserve(len(additions))
+            for user_id, label, vector in additions:
+                labels = self._labels.setdefault(user_id, {})
+                if label in labels:
+                    dead.add(labels[label])
+                # Rows past self._size are in no published snapshot, so writing them is safe
+                self._buffer[self._size] = vector
+                self._user_ids[self._size] = user_id
+                labels[label] = self._size
+                self._size += 1
+                changed.add(user_id)
+            self._dead = dead
+            if len(dead) * 2 > len(self._buffer):
+                self._compact()
+                self._publish()
+            else:
+                self._publish(changed)
+
+    def load(self, templates):
+        """Replaces the whole index with {(user_id, label): embedding}."""
+        normalized = {(str(user_id), label): normalize(embedding) for (user_id, label), embedding in templates.items()}
+        with self._lock:
+            self._reset(max(len(normalized), 1024))
+            for row, ((user_id, label), vector) in enumerate(normalized.items()):
+                self._buffer[row] = vector
+                self._user_ids[row] = user_id
+                self._labels.setdefault(user_id, {})[label] = row
+            self._size = len(normalized)
+            self._publish()
+
+    def search(self, embedding, threshold):
+        """Returns the ids of users with a template within `threshold`, nearest first."""
+        user_ids, matrix, _, dead = self._snapshot
+        if len(user_ids) == len(dead):
+            return []
+        distances = 1.0 - matrix @ normalize(embedding)
+        distances[dead] = np.inf
+        order = np.argsort(distances)
+        matched = []
+        for row in order:
+            if distances[row] > threshold:
+                break
+            if user_ids[row] not in matched:
+                matched.append(user_ids[row])
+        return matched
+
+    def distance_to(self, user_id, embedding):
+        """Returns the smallest distance between the probe and one user's templates.
+
+        Only that user's rows are compared, so the cost does not depend on the
+        size of the gallery. Returns None if the user has no templates.
+        """
+        _, matrix, rows, _ = self._snapshot
+        user_rows = rows.get(str(user_id))
+        if user_rows is None:
+            return None
+        return float(np.min(1.0 - matrix[user_rows] @ normalize(embedding)))
+
+    # --- Called with self._lock held ---
+
+    def _reset(self, capacity):
+        self._buffer = np.empty((capacity, self.dim), dtype=np.float32)
+        self._user_ids = np.empty(capacity, dtype=object)
+        self._size = 0
+        self._labels = {}  # user_id -> {label: row}
+        self._dead = set()
+        self._rows = {}
+        self._publish()
+
+    def _reserve(self, count):
+        """Makes room for `count` more rows, copying into a buffer twice the size if needed."""
+        if self._size + count <= len(self._buffer):
+            return
+        capacity = max(2 * len(self._buffer), self._size + count)
+        buffer = np.empty((capacity, self.dim), dtype=np.float32)
+        buffer[:self._size] = self._buffer[:self._size]
+        user_ids = np.empty(capacity, dtype=object)
+        user_ids[:self._size] = self._user_ids[:self._size]
+        self._buffer, self._user_ids = buffer, user_ids
+
+    def _compact(self):
+        """Copies the live rows into a fresh buffer; earlier snapshots keep the old one."""
+        live = np.array(sorted(row for labels in self._labels.values() for row in labels.values()), dtype=np.intp)
+        capacity = max(2 * len(live), 1024)
+        buffer = np.empty((capacity, self.dim), dtype=np.float32)
+        buffer[:len(live)] = self._buffer[live]
+        user_ids = np.empty(capacity, dtype=object)
+        user_ids[:len(live)] = self._user_ids[live]
+        new_row = {int(old): new for new, old in enumerate(live)}
+        for labels in self._labels.values():
+            for label, row in labels.items():
+                labels[label] = new_row[row]
+        self._buffer, self._user_ids, self._size, self._dead = buffer, user_ids, len(live), set()
+
+    def _publish(self, changed=None):
+        """Swaps in a snapshot of the first self._size rows; only `changed` users' row lists are rebuilt."""
+        if changed is None:
+            self._rows = {}
+            changed = self._labels
+        else:
+            self._rows = dict(self._rows)
+        for user_id in changed:
+            labels = self._labels.get(user_id)
+            if labels:
+                self._rows[user_id] = np.array(sorted(labels.values()), dtype=np.intp)
+            else:
+                self._rows.pop(user_id, None)
+        dead = np.array(sorted(self._dead), dtype=np.intp)
+        self._snapshot = (self._user_ids[:self._size], self._buffer[:self._size], self._rows, dead)
@@ -0,0 +1,206 @@
+import fcntl
+import io
+import json
+import os
+import threading
+import zipfile
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+FORMAT_VERSION = 1
+MANIFEST = "MANIFEST.json"
+
+
+def _atomic_write(path, data: bytes):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class GalleryStore:
+    """Append-only store of face embeddings on disk.
+
+    Each write adds a shard: a float32 `.npy` matrix plus a JSON id table
+    listing the (user_id, label) of every row and any users the shard removes.
+    MANIFEST.json names the live shards in write order; replaying them in that
+    order gives the current gallery, so a later row for the same
+    (user_id, label) replaces an earlier one. Shards are memory-mapped on load
+    and never modified in place; `compact()` folds them back into one shard.
+
+    Writers hold an flock on the gallery directory, so several service
+    workers can share one store.
+    """
+
+    def __init__(self, path, model_name, dim=512):
+        self.path = path
+        self.model_name = model_name
+        self.dim = dim
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._manifest_mtime = None
+        self._manifest = self._read_manifest()
+
+    def _read_manifest(self):
+        manifest_path = os.path.join(self.path, MANIFEST)
+        if not os.path.exists(manifest_path):
+            return {"format_version": FORMAT_VERSION, "model": self.model_name, "dim": self.dim, "next_shard": 1, "shards": []}
+        self._manifest_mtime = os.stat(manifest_path).st_mtime_ns
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported gallery format {manifest.get('format_version')} in {self.path}")
+        if manifest.get("model") != self.model_name or manifest.get("dim") != self.dim:
+            raise ValueError(f"Gallery in {self.path} was built with {manifest.get('model')}, not {self.model_name}")
+        return manifest
+
+    def _write_manifest(self, manifest):
+        _atomic_write(os.path.join(self.path, MANIFEST), json.dumps(manifest, indent=2).encode())
+        self._manifest = manifest
+        self._manifest_mtime = os.stat(os.path.join(self.path, MANIFEST)).st_mtime_ns
+
+    @contextmanager
+    def _write_lock(self):
+        """Serializes writers across threads and processes, then picks up their latest manifest."""
+        with self._lock, open(os.path.join(self.path, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._manifest = self._read_manifest()
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @property
+    def shards(self):
+        return list(self._manifest["shards"])
+
+    @property
+    def shard_count(self):
+        return len(self._manifest["shards"])
+
+    def reload_manifest(self, force=False):
+        """Re-reads MANIFEST.json if another writer changed it; returns True if it did."""
+        manifest_path = os.path.join(self.path, MANIFEST)
+        try:
+            mtime = os.stat(manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._manifest_mtime and not force:
+            return False
+        self._manifest = self._read_manifest()
+        return True
+
+    def read_shards(self, shards):
+        """Yields (removed_user_ids, {(user_id, label): embedding}) for each shard, in order."""
+        for shard in shards:
+            matrix = np.load(os.path.join(self.path, f"{shard}.npy"), mmap_mode="r")
+            with open(os.path.join(self.path, f"{shard}.ids.json")) as f:
+                table = json.load(f)
+            if isinstance(table, list):
+                table = {"remove_users": [], "rows": table}
+            templates = {(user_id, label): matrix[row] for row, (user_id, label) in enumerate(table["rows"])}
+            yield table["remove_users"], templates
+
+    def load(self):
+        """Returns {(user_id, label): embedding} for every live template."""
+        templates = {}
+        for remove_users, shard_templates in self.read_shards(self._manifest["shards"]):
+            remove_users = set(remove_users)
+            if remove_users:
+                templates = {key: value for key, value in templates.items() if key[0] not in remove_users}
+            templates.update(shard_templates)
+        return templates
+
+    def append(self, templates, remove_users=()):
+        """Persists {(user_id, label): embedding} as a new shard.
+
+        Users listed in `remove_users` lose all their earlier templates in the
+        same shard, so replacing a user's templates is a single atomic write.
+        """
+        if not templates and not remove_users:
+            return
+        with self._write_lock():
+            manifest = dict(self._manifest)
+            shard = f"shard-{manifest['next_shard']:06d}"
+            self._write_shard(shard, templates, remove_users)
+            manifest["next_shard"] += 1
+            manifest["shards"] = manifest["shards"] + [shard]
+            self._write_manifest(manifest)
+
+    def compact(self):
+        """Rewrites all live templates into one shard and drops the old ones."""
+        with self._write_lock():
+            old_shards = self._manifest["shards"]
+            if len(old_shards) <= 1:
+                return
+            templates = self.load()
+            manifest = dict(self._manifest)
+            shard = f"shard-{manifest['next_shard']:06d}"
+            self._write_shard(shard, templates)
+            manifest["next_shard"] += 1
+            manifest["shards"] = [shard]
+            self._write_manifest(manifest)
+            for old_shard in old_shards:
+                for suffix in (".npy", ".ids.json"):
+                    os.remove(os.path.join(self.path, f"{old_shard}{suffix}"))
+
+    def _write_shard(self, shard, templates, remove_users=()):
+        keys = list(templates)
+        matrix = np.stack([np.asarray(templates[key], dtype=np.float32).ravel() for key in keys]) if keys else np.empty((0, self.dim), dtype=np.float32)
+        buffer = io.BytesIO()
+        np.save(buffer, matrix)
+        table = {
+            "remove_users": [str(user_id) for user_id in remove_users],
+            "rows": [[str(user_id), label] for user_id, label in keys],
+        }
+        _atomic_write(os.path.join(self.path, f"{shard}.npy"), buffer.getvalue())
+        _atomic_write(os.path.join(self.path, f"{shard}.ids.json"), json.dumps(table).encode())
+
+
+class ImageArchive:
+    """Optional archive of enrollment photos, one JPEG-compressed zip per user.
+
+    The photos are not needed for search; they are kept so the gallery can be
+    re-embedded if the model ever changes.
+    """
+
+    def __init__(self, path, quality=90):
+        self.path = path
+        self.quality = quality
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def save(self, user_id, images, replace=False):
+        """Stores {label: BGR image} for a user.
+
+        Photos with the same label are overwritten; with `replace` the user's
+        other photos are dropped as well.
+        """
+        entries = {}
+        for label, image in images.items():
+            ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if ok:
+                entries[f"{os.path.splitext(label)[0]}.jpg"] = encoded.tobytes()
+
+        archive_path = os.path.join(self.path, f"{user_id}.zip")
+        with self._lock:
+            if os.path.exists(archive_path) and not replace:
+                with zipfile.ZipFile(archive_path) as existing:
+                    for name in existing.namelist():
+                        entries.setdefault(name, existing.read(name))
+            buffer = io.BytesIO()
+            # JPEG data is already compressed, so the zip only stores it
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+                for name, data in entries.items():
+                    archive.writestr(name, data)
+            _atomic_write(archive_path, buffer.getvalue())
+
+    def remove(self, user_id):
+        with self._lock:
+            archive_path = os.path.join(self.path, f"{user_id}.zip")
+            if os.path.exists(archive_path):
+                os.remove(archive_path)
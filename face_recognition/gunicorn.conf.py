@@ -0,0 +1,17 @@
+# face_recognition/gunicorn.conf.py
+# Run from this directory with:  gunicorn -c gunicorn.conf.py service:app
+import os
+
+# Import the app (and load the Facenet512 weights) once in the master, then fork
+# the workers so they share the weights copy-on-write. Loading the weights starts
+# TensorFlow's threads in the master and they do not survive the fork; each worker
+# runs its own warm-up inference, and FACE_PRELOAD=0 turns preloading off if a
+# TensorFlow build deadlocks after forking (see preload_model()).
+os.environ.setdefault("FACE_PRELOAD", "1")
+preload_app = True
+
+bind = os.environ.get("FACE_BIND", "127.0.0.1:8001")
+workers = int(os.environ.get("FACE_WORKERS", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Warm-up and gallery loading happen before a worker accepts requests
+timeout = 120
@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PoolSaturated(Exception):
+    """Raised when the inference queue is full and a request must be shed."""
+
+
+class Histogram:
+    """Cumulative latency histogram in seconds, safe to update from worker threads."""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.BUCKETS) + 1)
+        self._count = 0
+        self._sum = 0.0
+
+    def observe(self, seconds):
+        with self._lock:
+            self._count += 1
+            self._sum += seconds
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    self._counts[i] += 1
+                    break
+            else:
+                self._counts[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            buckets, running = {}, 0
+            for bound, count in zip(self.BUCKETS + ("+Inf",), self._counts):
+                running += count
+                buckets[str(bound)] = running
+            return {"count": self._count, "sum": self._sum, "buckets": buckets}
+
+
+class InferencePool:
+    """Runs blocking inference off the event loop with a bounded backlog.
+
+    At most `max_workers` jobs run at once and at most `max_queue` more may
+    wait for a worker; anything beyond that raises PoolSaturated immediately
+    instead of growing latency without bound. A thread pool is used so all
+    workers share the one loaded model; TensorFlow and OpenCV release the GIL
+    while they compute.
+    """
+
+    def __init__(self, max_workers, max_queue):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._pending = 0  # queued + running; only touched from the event loop
+        self._rejected = 0
+        self.queue_wait = Histogram()
+        self.inference_time = Histogram()
+
+    async def run(self, fn, *args):
+        if self._pending >= self.max_workers + self.max_queue:
+            self._rejected += 1
+            raise PoolSaturated()
+        self._pending += 1
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            self.queue_wait.observe(started - submitted)
+            try:
+                return fn(*args)
+            finally:
+                self.inference_time.observe(time.perf_counter() - started)
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, timed)
+        finally:
+            self._pending -= 1
+
+    def metrics(self):
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "rejected": self._rejected,
+            "queue_wait_seconds": self.queue_wait.snapshot(),
+            "inference_seconds": self.inference_time.snapshot(),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -1,69 +1,391 @@
+import asyncio
+import fcntl
 import os
+import shutil
+import threading
+from contextlib import asynccontextmanager
 import cv2
 import numpy as np
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from typing import List
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi.responses import JSONResponse
 from deepface import DeepFace
+from embedding_index import EmbeddingIndex
+from gallery_store import GalleryStore, ImageArchive
+from inference import InferencePool, PoolSaturated
+from batching import MicroBatcher
 
 # Create a directory to store face embeddings
 DB_PATH = os.path.join(os.getcwd(), "face_db")
 os.makedirs(DB_PATH, exist_ok=True)
 
-app = FastAPI()
+MODEL_NAME = 'Facenet512'
+# DeepFace's default cosine threshold for Facenet512
+DISTANCE_THRESHOLD = float(os.environ.get("FACE_DISTANCE_THRESHOLD", "0.30"))
+
+# Embeddings are persisted in face_db/gallery; enrollment photos optionally go to face_db/archive
+GALLERY_PATH = os.path.join(DB_PATH, "gallery")
+ARCHIVE_PATH = os.path.join(DB_PATH, "archive")
+ARCHIVE_IMAGES = os.environ.get("FACE_ARCHIVE_IMAGES", "1") == "1"
+# Fold the gallery back into one shard at startup once this many shards have accumulated
+COMPACT_AFTER_SHARDS = int(os.environ.get("FACE_GALLERY_COMPACT_AFTER", "64"))
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+# Left in an image folder that was imported but kept because there is no archive
+IMPORTED_MARKER = ".imported"
+# Larger uploads are downscaled right after decoding
+MAX_IMAGE_SIDE = int(os.environ.get("FACE_MAX_IMAGE_SIDE", "1280"))
+
+# Inference runs on a bounded pool so a slow forward pass never blocks the event loop.
+# Requests beyond workers + queue are rejected with 503 instead of queueing indefinitely.
+INFERENCE_WORKERS = int(os.environ.get("FACE_INFERENCE_WORKERS", "2"))
+INFERENCE_QUEUE = int(os.environ.get("FACE_INFERENCE_QUEUE", "16"))
+RETRY_AFTER_SECONDS = int(os.environ.get("FACE_RETRY_AFTER", "2"))
+# Probes for /recognize and /verify arriving within this window are embedded in one forward pass
+BATCH_WINDOW_MS = float(os.environ.get("FACE_BATCH_WINDOW_MS", "15"))
+BATCH_MAX_SIZE = int(os.environ.get("FACE_BATCH_MAX_SIZE", "16"))
+# Load the model weights while the module is imported, e.g. in a gunicorn master started with
+# --preload (see gunicorn.conf.py), so forked workers share them copy-on-write
+PRELOAD_ON_IMPORT = os.environ.get("FACE_PRELOAD", "0") == "1"
+# How often each worker checks the gallery store for changes made by other workers
+INDEX_SYNC_INTERVAL = float(os.environ.get("FACE_INDEX_SYNC_INTERVAL", "1.0"))
+
+store = GalleryStore(GALLERY_PATH, MODEL_NAME)
+archive = ImageArchive(ARCHIVE_PATH) if ARCHIVE_IMAGES else None
+
+# All enrolled embeddings, held in memory for the lifetime of the process
+index = EmbeddingIndex()
+# Gallery shards already applied to this worker's index
+applied_shards = []
+index_sync_lock = threading.Lock()
+pool = InferencePool(INFERENCE_WORKERS, INFERENCE_QUEUE)
+# Flipped once the model is warm and the gallery is loaded, and back off at shutdown
+ready = False
+
+def sync_index():
+    """Brings the in-memory index up to date with the gallery store.
+
+    Every gallery change, from this worker or another one sharing the store,
+    is a new shard. Only shards not yet applied are read, and each is applied
+    as one atomic snapshot swap; a full reload is only needed after a compaction.
+    This reads from disk, so it never runs on the event loop: writes call it on
+    the inference pool and keep_index_synced() on a thread.
+    """
+    global applied_shards
+    with index_sync_lock:
+        store.reload_manifest()
+        shards = store.shards
+        if shards == applied_shards:
+            return
+        try:
+            if applied_shards and shards[:len(applied_shards)] == applied_shards:
+                for remove_users, templates in store.read_shards(shards[len(applied_shards):]):
+                    index.apply(templates, remove_users)
+            else:
+                index.load(store.load())
+        except FileNotFoundError:
+            # Another worker compacted the gallery while we were reading it
+            store.reload_manifest(force=True)
+            shards = store.shards
+            index.load(store.load())
+        applied_shards = shards
+
+async def keep_index_synced():
+    """Applies gallery changes made by other workers; endpoints only read the current snapshot."""
+    while True:
+        await asyncio.sleep(INDEX_SYNC_INTERVAL)
+        try:
+            await asyncio.to_thread(sync_index)
+        except Exception as e:
+            print(f"Gallery sync failed: {e}")
+
+def import_image_folders():
+    """Moves face_db/<user_id>/<image> folders (the old on-disk layout) into the gallery store.
+
+    Every worker calls this at startup. An flock on face_db/.import.lock lets
+    the first one do the import while the others wait, and find nothing left
+    to import once they get the lock.
+    """
+    with open(os.path.join(DB_PATH, ".import.lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            _import_image_folders()
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _import_image_folders():
+    for user_id in sorted(os.listdir(DB_PATH)):
+        user_dir = os.path.join(DB_PATH, user_id)
+        if not os.path.isdir(user_dir) or user_dir in (GALLERY_PATH, ARCHIVE_PATH):
+            continue
+        if os.path.exists(os.path.join(user_dir, IMPORTED_MARKER)):
+            continue
+        templates, images = {}, {}
+        for filename in sorted(os.listdir(user_dir)):
+            if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            image = cv2.imread(os.path.join(user_dir, filename))
+            if image is None:
+                continue
+            embeddings = represent(image, enforce_detection=False)
+            if embeddings:
+                templates[(user_id, filename)] = embeddings[0]
+                images[filename] = image
+        store.append(templates)
+        print(f"Imported {len(templates)} face templates for user {user_id}")
+        # Without an archive the folder is the only copy of the photos, so leave it in place
+        if archive is not None:
+            archive.save(user_id, images)
+            shutil.rmtree(user_dir)
+        else:
+            open(os.path.join(user_dir, IMPORTED_MARKER), "w").close()
+
+def preload_model():
+    """Builds Facenet512 and loads its weights without running any inference.
+
+    Building the model initializes TensorFlow, which starts its runtime
+    threads straight away. Threads are not copied into forked workers, and
+    TensorFlow does not support forking once it is initialized; if workers
+    forked from a preloading master hang on their first forward pass in
+    warm_up(), start the service with FACE_PRELOAD=0.
+    """
+    DeepFace.build_model(MODEL_NAME)
+
+def warm_up():
+    """Runs a dummy inference so the detector and model graph are initialized before traffic arrives."""
+    represent_batch([np.zeros((224, 224, 3), dtype=np.uint8)], enforce_detection=False)
+
+@asynccontextmanager
+async def lifespan(app):
+    global ready
+    if not PRELOAD_ON_IMPORT:
+        preload_model()
+    await pool.run(warm_up)
+    await asyncio.to_thread(import_image_folders)
+    if store.shard_count > COMPACT_AFTER_SHARDS:
+        store.compact()
+    await asyncio.to_thread(sync_index)
+    print(f"Loaded {len(index)} face templates from {GALLERY_PATH}")
+    probes.start()
+    syncing = asyncio.create_task(keep_index_synced())
+    ready = True
+    yield
+    ready = False
+    syncing.cancel()
+    await probes.stop()
+    pool.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.exception_handler(PoolSaturated)
+async def pool_saturated_handler(request: Request, exc: PoolSaturated):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Face service is busy, please retry."},
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+    )
+
+def represent(image, enforce_detection):
+    """Returns one Facenet512 embedding per face detected in the image."""
+    results = DeepFace.represent(img_path=image, enforce_detection=enforce_detection, model_name=MODEL_NAME)
+    return [np.asarray(result["embedding"], dtype=np.float32) for result in results]
+
+def represent_batch(images, enforce_detection):
+    """Embeds several images in a single forward pass; returns one list of embeddings per image."""
+    results = DeepFace.represent(img_path=list(images), enforce_detection=enforce_detection, model_name=MODEL_NAME)
+    if len(images) == 1:
+        results = [results]
+    return [[np.asarray(face["embedding"], dtype=np.float32) for face in faces] for faces in results]
 
 def read_imagefile(file) -> np.ndarray:
     """Reads an uploaded image file and returns it as a NumPy array."""
-    contents = np.fromstring(file, np.uint8)
+    contents = np.frombuffer(file, np.uint8)
     img = cv2.imdecode(contents, cv2.IMREAD_COLOR)
     if img is None:
         raise HTTPException(status_code=400, detail="Invalid image file.")
+    # Clients should already send downscaled photos; cap anything larger so detection stays cheap
+    height, width = img.shape[:2]
+    if max(height, width) > MAX_IMAGE_SIDE:
+        scale = MAX_IMAGE_SIDE / max(height, width)
+        img = cv2.resize(img, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
     return img
 
-@app.post("/enroll/{user_id}")
-async def enroll_user(user_id: str, file: UploadFile = File(...)):
-    """Enrolls a user by saving their face representation."""
-    image = read_imagefile(await file.read())
+# --- Blocking work, run on the inference pool ---
+
+def _enroll(user_id, filename, contents):
+    image = read_imagefile(contents)
+    embeddings = represent(image, enforce_detection=True)
+
+    # Persist the embedding itself; the photo is only kept in the optional archive
+    store.append({(user_id, filename): embeddings[0]})
+    if archive is not None:
+        archive.save(user_id, {filename: image})
+    sync_index()
+
+def _embed_enrollment(uploads):
+    """Decodes and embeds enrollment photos in one forward pass; each must contain a face."""
+    images = {filename: read_imagefile(contents) for filename, contents in uploads}
     try:
-        # You can add a check here to ensure a face is detected
-        _ = DeepFace.represent(img_path=image, enforce_detection=True, model_name='Facenet512')
+        embedded = represent_batch(list(images.values()), enforce_detection=True)
+    except ValueError:
+        # The batch fails as a whole; find which photo has no detectable face
+        for filename, image in images.items():
+            try:
+                represent(image, enforce_detection=True)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"Could not process face in {filename}: {e}")
+        raise
+    return images, {filename: faces[0] for filename, faces in zip(images, embedded)}
+
+def _replace_user(user_id, uploads):
+    """Swaps all of a user's templates for the uploaded ones, or changes nothing if any photo fails."""
+    images, embeddings = _embed_enrollment(uploads)
+    store.append({(user_id, filename): embedding for filename, embedding in embeddings.items()}, remove_users=[user_id])
+    if archive is not None:
+        archive.save(user_id, images, replace=True)
+    sync_index()
+
+def _remove_user(user_id):
+    sync_index()
+    if user_id not in index:
+        raise HTTPException(status_code=404, detail=f"No enrolled face templates for user {user_id}.")
+    store.append({}, remove_users=[user_id])
+    if archive is not None:
+        archive.remove(user_id)
+    sync_index()
 
-        user_dir = os.path.join(DB_PATH, str(user_id))
-        os.makedirs(user_dir, exist_ok=True)
+def _embed_probes(batch):
+    """Decodes each probe on its own, then embeds every valid one together."""
+    results, images = [], []
+    for contents in batch:
+        try:
+            images.append(read_imagefile(contents))
+            results.append(None)
+        except HTTPException as e:
+            results.append(e)
+    if images:
+        embedded = iter(represent_batch(images, enforce_detection=False))
+        results = [next(embedded) if result is None else result for result in results]
+    return results
 
-        # --- FIX THIS LINE ---
-        # Use the filename sent from the Django app (e.g., "front.png")
-        file_path = os.path.join(user_dir, file.filename)
-        # ---------------------
+probes = MicroBatcher(pool, _embed_probes, BATCH_WINDOW_MS, BATCH_MAX_SIZE, max_queue=INFERENCE_QUEUE * BATCH_MAX_SIZE)
 
-        cv2.imwrite(file_path, image)
+# --- Endpoints ---
+
+@app.post("/enroll/{user_id}")
+async def enroll_user(user_id: str, file: UploadFile = File(...)):
+    """Enrolls a user by saving their face representation."""
+    contents = await file.read()
+    try:
+        await pool.run(_enroll, user_id, file.filename, contents)
         return {"status": "success", "user_id": user_id, "message": f"Saved {file.filename}."}
 
+    except (HTTPException, PoolSaturated):
+        raise
     except ValueError as e:
         # This happens if DeepFace can't find a face
         raise HTTPException(status_code=400, detail=f"Could not process face in {file.filename}: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
 
+@app.post("/enroll/{user_id}/poses")
+async def enroll_poses(user_id: str, front: UploadFile = File(...), left: UploadFile = File(...), right: UploadFile = File(...)):
+    """Enrolls a user from front, left and right photos sent in one request.
+
+    The three photos are embedded as one batch and committed together: if any
+    of them fails, the user's gallery entry is left exactly as it was.
+    """
+    uploads = [(f"{pose}{os.path.splitext(file.filename or '')[1] or '.png'}", await file.read())
+               for pose, file in (("front", front), ("left", left), ("right", right))]
+    try:
+        await pool.run(_replace_user, user_id, uploads)
+    except (HTTPException, PoolSaturated):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+    return {"status": "success", "user_id": user_id, "templates": [filename for filename, _ in uploads]}
+
 @app.post("/recognize")
 async def recognize_faces(file: UploadFile = File(...)):
     """Recognizes faces in an image against the enrolled database."""
-    image = read_imagefile(await file.read())
+    contents = await file.read()
     try:
-        # DeepFace.find will search for matches in the DB_PATH directory.
-        dfs = DeepFace.find(
-            img_path=image,
-            db_path=DB_PATH,
-            enforce_detection=False, # Try to find faces even if detection is weak
-            model_name='Facenet512',
-            silent=True
-        )
-        
+        # Embed the probe once and compare it against the whole gallery in one pass
+        embeddings = await probes.submit(contents)
         recognized_ids = []
-        if dfs and not dfs[0].empty:
-             # The 'identity' column contains the path to the matched image.
-             # We parse the user_id from this path.
-            recognized_ids = dfs[0]['identity'].apply(lambda x: os.path.basename(os.path.dirname(x))).unique().tolist()
-            
+        for embedding in embeddings:
+            for user_id in index.search(embedding, DISTANCE_THRESHOLD):
+                if user_id not in recognized_ids:
+                    recognized_ids.append(user_id)
+
         return {"recognized_ids": recognized_ids}
+    except (HTTPException, PoolSaturated):
+        raise
     except Exception as e:
         print(f"Recognition crashed with error: {e}")
-        raise HTTPException(status_code=500, detail=f"Recognition error: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Recognition error: {e}")
+
+@app.post("/verify/{user_id}")
+async def verify_user(user_id: str, file: UploadFile = File(...)):
+    """Verifies a probe against the claimed user's enrolled templates only (1:1)."""
+    contents = await file.read()
+    try:
+        embeddings = await probes.submit(contents)
+    except (HTTPException, PoolSaturated):
+        raise
+    except Exception as e:
+        print(f"Verification crashed with error: {e}")
+        raise HTTPException(status_code=500, detail=f"Verification error: {e}")
+
+    if user_id not in index:
+        # The user may have just been enrolled through another worker
+        await asyncio.to_thread(sync_index)
+    distances = [index.distance_to(user_id, embedding) for embedding in embeddings]
+    distances = [distance for distance in distances if distance is not None]
+    if not distances:
+        raise HTTPException(status_code=404, detail=f"No enrolled face templates for user {user_id}.")
+
+    distance = min(distances)
+    return {
+        "user_id": user_id,
+        "verified": distance <= DISTANCE_THRESHOLD,
+        "distance": distance,
+        "threshold": DISTANCE_THRESHOLD,
+    }
+
+@app.put("/users/{user_id}")
+async def replace_user(user_id: str, files: List[UploadFile] = File(...)):
+    """Replaces all of a user's templates (e.g. after an approved face change) in one atomic update."""
+    uploads = [(file.filename, await file.read()) for file in files]
+    try:
+        await pool.run(_replace_user, user_id, uploads)
+    except (HTTPException, PoolSaturated):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+    return {"status": "success", "user_id": user_id, "templates": [filename for filename, _ in uploads]}
+
+@app.delete("/users/{user_id}")
+async def remove_user(user_id: str):
+    """Removes a user and all of their templates from the gallery."""
+    await pool.run(_remove_user, user_id)
+    return {"status": "success", "user_id": user_id}
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving HTTP."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: the model is warm and the gallery is loaded."""
+    if not ready:
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready", "templates": len(index)}
+
+@app.get("/metrics")
+async def metrics():
+    """Queue-wait and inference-time histograms for the inference pool."""
+    return {"inference_pool": pool.metrics(), "batching": probes.metrics(), "templates": len(index)}
+
+if PRELOAD_ON_IMPORT:
+    preload_model()
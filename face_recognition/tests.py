@@ -0,0 +1,402 @@
+# face_recognition/tests.py
+"""Tests for the face service, with DeepFace's represent() stubbed out.
+
+Run from this directory with:  python -m unittest tests
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import cv2
+import numpy as np
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from batching import MicroBatcher
+from embedding_index import EmbeddingIndex
+from gallery_store import GalleryStore
+from inference import InferencePool, PoolSaturated
+
+# service.py creates face_db/ in the working directory when it is imported
+_workdir = tempfile.mkdtemp()
+_cwd = os.getcwd()
+os.chdir(_workdir)
+try:
+    import service
+finally:
+    os.chdir(_cwd)
+
+
+def tearDownModule():
+    shutil.rmtree(_workdir, ignore_errors=True)
+
+
+# --- A stand-in for Facenet512 ---
+# A photo's blue channel picks the one-hot embedding it maps to, so photos with
+# the same shade are the same face (distance 0) and different shades are
+# orthogonal (distance 1). A red channel of 255 means "no face in the photo".
+
+def embedding(shade):
+    vector = np.zeros(512, dtype=np.float32)
+    vector[shade] = 1.0
+    return vector
+
+
+def photo(shade, face=True):
+    image = np.full((8, 8, 3), (shade, 0, 0 if face else 255), dtype=np.uint8)
+    return cv2.imencode(".png", image)[1].tobytes()
+
+
+def fake_represent(image, enforce_detection):
+    if image[0, 0, 2] == 255:
+        if enforce_detection:
+            raise ValueError("Face could not be detected.")
+        return []
+    return [embedding(int(image[0, 0, 0]))]
+
+
+def fake_represent_batch(images, enforce_detection):
+    # Like DeepFace, one photo without a face fails the whole batch
+    return [fake_represent(image, enforce_detection) for image in images]
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class EmbeddingIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = EmbeddingIndex(dim=512, capacity=4)
+
+    def test_search_returns_users_within_threshold_nearest_first(self):
+        near = embedding(1) + 0.2 * embedding(2)
+        self.index.apply({("a", "front"): embedding(1), ("b", "front"): near, ("c", "front"): embedding(3)})
+
+        self.assertEqual(self.index.search(embedding(1), 0.3), ["a", "b"])
+        self.assertEqual(self.index.search(embedding(4), 0.3), [])
+        self.assertEqual(len(self.index), 3)
+
+    def test_distance_to_only_compares_that_users_templates(self):
+        self.index.apply({("a", "front"): embedding(1), ("a", "left"): embedding(2), ("b", "front"): embedding(3)})
+
+        self.assertAlmostEqual(self.index.distance_to("a", embedding(2)), 0.0, places=5)
+        self.assertAlmostEqual(self.index.distance_to("a", embedding(3)), 1.0, places=5)
+        self.assertIsNone(self.index.distance_to("nobody", embedding(1)))
+
+    def test_replacing_and_removing_templates(self):
+        self.index.apply({("a", "front"): embedding(1), ("b", "front"): embedding(2)})
+        self.index.add("a", "front", embedding(5))
+        self.assertEqual(self.index.search(embedding(1), 0.3), [])
+        self.assertEqual(self.index.search(embedding(5), 0.3), ["a"])
+
+        self.index.apply({("b", "left"): embedding(6)}, remove_users=["b"])
+        self.assertAlmostEqual(self.index.distance_to("b", embedding(6)), 0.0, places=5)
+        self.assertAlmostEqual(self.index.distance_to("b", embedding(2)), 1.0, places=5)
+        self.index.apply(remove_users=["a", "b"])
+        self.assertNotIn("a", self.index)
+        self.assertEqual(len(self.index), 0)
+        self.assertEqual(self.index.search(embedding(5), 0.3), [])
+
+    def test_apply_writes_past_the_published_rows(self):
+        self.index.apply({("a", "front"): embedding(1)})
+        buffer = self.index._buffer
+        before = self.index._snapshot
+
+        self.index.apply({("b", "front"): embedding(2)})
+        self.assertIs(self.index._buffer, buffer)
+        # A search that already holds the old snapshot still sees the old gallery
+        self.assertEqual(len(before[0]), 1)
+        self.assertNotIn("b", before[2])
+        self.assertIn("b", self.index)
+
+    def test_compaction_and_growth_keep_the_gallery(self):
+        for step in range(20):
+            self.index.apply({(user, "front"): embedding(step * 5 + i) for i, user in enumerate("abcde")})
+
+        self.assertEqual(len(self.index), 5)
+        self.assertLessEqual(len(self.index._dead) * 2, len(self.index._buffer))
+        for i, user in enumerate("abcde"):
+            self.assertEqual(self.index.search(embedding(95 + i), 0.3), [user])
+
+    def test_load_replaces_everything(self):
+        self.index.apply({("a", "front"): embedding(1)})
+        self.index.load({("b", "front"): embedding(2), (3, "front"): embedding(3)})
+
+        self.assertNotIn("a", self.index)
+        self.assertIn("3", self.index)
+        self.assertEqual(self.index.search(embedding(2), 0.3), ["b"])
+
+
+class GalleryStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.store = GalleryStore(self.path, "Facenet512")
+
+    def assertTemplates(self, templates, expected):
+        self.assertEqual(sorted(templates), sorted(expected))
+        for key, value in expected.items():
+            np.testing.assert_array_equal(templates[key], value)
+
+    def test_replaying_shards_gives_the_current_gallery(self):
+        self.store.append({("1", "front"): embedding(1), ("2", "front"): embedding(2)})
+        self.store.append({("1", "front"): embedding(3), ("1", "left"): embedding(4)})
+        self.store.append({("2", "right"): embedding(5)}, remove_users=["2"])
+
+        self.assertEqual(self.store.shard_count, 3)
+        self.assertTemplates(self.store.load(), {
+            ("1", "front"): embedding(3), ("1", "left"): embedding(4), ("2", "right"): embedding(5),
+        })
+
+    def test_other_writers_are_picked_up_and_compaction_keeps_templates(self):
+        self.store.append({("1", "front"): embedding(1)})
+        other = GalleryStore(self.path, "Facenet512")
+        other.append({("2", "front"): embedding(2)})
+
+        self.assertTrue(self.store.reload_manifest())
+        self.assertFalse(self.store.reload_manifest())
+        self.assertEqual(self.store.shard_count, 2)
+        self.store.compact()
+        self.assertEqual(self.store.shard_count, 1)
+        self.assertTemplates(self.store.load(), {("1", "front"): embedding(1), ("2", "front"): embedding(2)})
+        self.assertEqual(len([name for name in os.listdir(self.path) if name.endswith(".npy")]), 1)
+
+    def test_gallery_from_another_model_is_rejected(self):
+        self.store.append({("1", "front"): embedding(1)})
+        with self.assertRaises(ValueError):
+            GalleryStore(self.path, "ArcFace")
+
+
+class InferencePoolTest(unittest.TestCase):
+    def test_runs_jobs_on_the_pool_threads(self):
+        pool = InferencePool(max_workers=1, max_queue=0)
+        self.addCleanup(pool.shutdown)
+
+        name = run(pool.run(lambda: threading.current_thread().name))
+        self.assertTrue(name.startswith("inference"))
+        self.assertEqual(pool.metrics()["inference_seconds"]["count"], 1)
+        with self.assertRaises(ZeroDivisionError):
+            run(pool.run(lambda: 1 / 0))
+
+    def test_sheds_load_beyond_workers_and_queue(self):
+        pool = InferencePool(max_workers=1, max_queue=1)
+        release = threading.Event()
+        self.addCleanup(pool.shutdown)
+        self.addCleanup(release.set)
+
+        async def flood():
+            jobs = [asyncio.ensure_future(pool.run(release.wait)) for _ in range(2)]
+            await asyncio.sleep(0)
+            with self.assertRaises(PoolSaturated):
+                await pool.run(release.wait)
+            release.set()
+            await asyncio.gather(*jobs)
+
+        run(flood())
+        self.assertEqual(pool.metrics()["rejected"], 1)
+        self.assertEqual(pool.metrics()["pending"], 0)
+
+
+class MicroBatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = InferencePool(max_workers=2, max_queue=4)
+        self.addCleanup(self.pool.shutdown)
+        self.batches = []
+
+    def double(self, items):
+        self.batches.append(list(items))
+        return [ValueError(f"bad {item}") if item < 0 else item * 2 for item in items]
+
+    def batcher(self, process_batch=None, max_batch=8, max_queue=16):
+        return MicroBatcher(self.pool, process_batch or self.double, window_ms=20, max_batch=max_batch, max_queue=max_queue)
+
+    def test_concurrent_requests_share_one_batch(self):
+        async def scenario():
+            batcher = self.batcher()
+            batcher.start()
+            try:
+                return await asyncio.gather(*(batcher.submit(item) for item in (1, 2, 3)))
+            finally:
+                await batcher.stop()
+
+        self.assertEqual(run(scenario()), [2, 4, 6])
+        self.assertEqual(self.batches, [[1, 2, 3]])
+
+    def test_batches_are_capped_at_max_batch(self):
+        async def scenario():
+            batcher = self.batcher(max_batch=2)
+            batcher.start()
+            try:
+                results = await asyncio.gather(*(batcher.submit(item) for item in range(5)))
+                return results, batcher.metrics(), batcher._dispatching
+            finally:
+                await batcher.stop()
+
+        results, metrics, dispatching = run(scenario())
+        self.assertEqual(results, [0, 2, 4, 6, 8])
+        self.assertEqual(metrics["batches"], 3)
+        self.assertEqual(max(len(batch) for batch in self.batches), 2)
+        self.assertEqual(dispatching, set())
+
+    def test_an_item_error_only_fails_its_own_caller(self):
+        async def scenario():
+            batcher = self.batcher()
+            batcher.start()
+            try:
+                return await asyncio.gather(batcher.submit(1), batcher.submit(-1), return_exceptions=True)
+            finally:
+                await batcher.stop()
+
+        ok, failed = run(scenario())
+        self.assertEqual(ok, 2)
+        self.assertIsInstance(failed, ValueError)
+
+    def test_a_failed_batch_fails_every_caller(self):
+        def crash(items):
+            raise RuntimeError("model crashed")
+
+        async def scenario():
+            batcher = self.batcher(crash)
+            batcher.start()
+            try:
+                return await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+            finally:
+                await batcher.stop()
+
+        for result in run(scenario()):
+            self.assertIsInstance(result, RuntimeError)
+
+    def test_a_full_queue_sheds_load(self):
+        async def scenario():
+            batcher = self.batcher(max_queue=1)
+            batcher._queue = asyncio.Queue()  # not started, so nothing drains it
+            waiting = asyncio.ensure_future(batcher.submit(1))
+            await asyncio.sleep(0)
+            try:
+                with self.assertRaises(PoolSaturated):
+                    await batcher.submit(2)
+            finally:
+                waiting.cancel()
+
+        run(scenario())
+
+
+class ServiceTest(unittest.TestCase):
+    """Drives the endpoints through the app's lifespan, with a fresh gallery per test."""
+
+    def setUp(self):
+        self.db_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.db_path)
+        gallery_path = os.path.join(self.db_path, "gallery")
+        pool = InferencePool(max_workers=2, max_queue=4)
+        patches = [
+            mock.patch.multiple(
+                service,
+                DB_PATH=self.db_path,
+                GALLERY_PATH=gallery_path,
+                store=GalleryStore(gallery_path, service.MODEL_NAME),
+                archive=None,
+                index=EmbeddingIndex(),
+                applied_shards=[],
+                pool=pool,
+                probes=MicroBatcher(pool, service._embed_probes, 5, 8, max_queue=32),
+                preload_model=mock.DEFAULT,
+                warm_up=mock.DEFAULT,
+                represent=fake_represent,
+                represent_batch=fake_represent_batch,
+            ),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def client(self):
+        client = TestClient(service.app)
+        client.__enter__()
+        self.addCleanup(client.__exit__, None, None, None)
+        return client
+
+    def enroll(self, client, user_id, shade):
+        files = {pose: (f"{pose}.png", photo(shade + i), "image/png") for i, pose in enumerate(("front", "left", "right"))}
+        return client.post(f"/enroll/{user_id}/poses", files=files)
+
+    def test_enroll_then_verify_and_recognize(self):
+        client = self.client()
+        self.assertEqual(self.enroll(client, "7", 10).status_code, 200)
+        self.assertEqual(client.get("/readyz").json(), {"status": "ready", "templates": 3})
+
+        verified = client.post("/verify/7", files={"file": ("probe.png", photo(11), "image/png")}).json()
+        self.assertTrue(verified["verified"])
+        self.assertAlmostEqual(verified["distance"], 0.0, places=5)
+        self.assertFalse(client.post("/verify/7", files={"file": ("probe.png", photo(50), "image/png")}).json()["verified"])
+        self.assertEqual(client.post("/recognize", files={"file": ("probe.png", photo(12), "image/png")}).json(),
+                         {"recognized_ids": ["7"]})
+
+    def test_verify_unknown_user_and_bad_image(self):
+        client = self.client()
+        response = client.post("/verify/404", files={"file": ("probe.png", photo(1), "image/png")})
+        self.assertEqual(response.status_code, 404)
+        response = client.post("/verify/404", files={"file": ("probe.png", b"not an image", "image/png")})
+        self.assertEqual(response.status_code, 400)
+
+    def test_enrollment_without_a_face_changes_nothing(self):
+        client = self.client()
+        self.enroll(client, "7", 10)
+        files = {"front": ("front.png", photo(20), "image/png"), "left": ("left.png", photo(21, face=False), "image/png"),
+                 "right": ("right.png", photo(22), "image/png")}
+
+        response = client.post("/enroll/7/poses", files=files)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("left.png", response.json()["detail"])
+        self.assertAlmostEqual(service.index.distance_to("7", embedding(10)), 0.0, places=5)
+        self.assertAlmostEqual(service.index.distance_to("7", embedding(20)), 1.0, places=5)
+
+    def test_probe_batch_keeps_per_probe_errors(self):
+        results = service._embed_probes([photo(1), b"not an image", photo(2, face=False)])
+
+        np.testing.assert_array_equal(results[0][0], embedding(1))
+        self.assertIsInstance(results[1], HTTPException)
+        self.assertEqual(results[2], [])
+
+    def test_remove_user(self):
+        client = self.client()
+        self.enroll(client, "7", 10)
+
+        self.assertEqual(client.delete("/users/7").status_code, 200)
+        self.assertNotIn("7", service.index)
+        self.assertEqual(client.delete("/users/7").status_code, 404)
+
+    def test_busy_pool_answers_503_with_retry_after(self):
+        client = self.client()
+        with mock.patch.object(service.probes, "submit", side_effect=PoolSaturated()):
+            response = client.post("/recognize", files={"file": ("probe.png", photo(1), "image/png")})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], str(service.RETRY_AFTER_SECONDS))
+
+    def test_other_workers_changes_are_synced_off_the_request_path(self):
+        client = self.client()
+        GalleryStore(service.GALLERY_PATH, service.MODEL_NAME).append({("8", "front.png"): embedding(30)})
+        self.assertNotIn("8", service.index)
+
+        service.sync_index()
+        self.assertIn("8", service.index)
+        self.assertTrue(client.post("/verify/8", files={"file": ("probe.png", photo(30), "image/png")}).json()["verified"])
+
+    def test_legacy_image_folders_are_imported_once(self):
+        user_dir = os.path.join(self.db_path, "9")
+        os.makedirs(user_dir)
+        with open(os.path.join(user_dir, "front.png"), "wb") as f:
+            f.write(photo(40))
+
+        self.client()
+        self.assertIn("9", service.index)
+        shards = service.store.shard_count
+        service.import_image_folders()
+        self.assertEqual(service.store.shard_count, shards)
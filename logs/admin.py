@@ -1,10 +1,11 @@
 from django.contrib import admin
-from .models import ActivityCategory, ActivitySubCategory, ServerRoomAccessLog
+from .models import ActivityCategory, ActivitySubCategory, ArchivedAccessLog, ServerRoomAccessLog
 
 @admin.register(ServerRoomAccessLog)
 class ServerRoomAccessLogAdmin(admin.ModelAdmin):
     # This creates columns in the list view
     list_display = ('user', 'location', 'status', 'request_timestamp', 'approved_by')
+    list_select_related = ('user', 'location', 'approved_by')
     
     # This adds a filter sidebar
     list_filter = ('status', 'location', 'category')
@@ -21,7 +22,7 @@ class ServerRoomAccessLogAdmin(admin.ModelAdmin):
             'fields': ('user', 'location', 'request_timestamp')
         }),
         ('Activity Details', {
-            'fields': ('category', 'subcategory', 'notes', 'additional_persons', 'non_registered_persons')
+            'fields': ('category', 'detailed_activities', 'notes', 'group_members')
         }),
         ('Workflow & Status', {
             'fields': ('status', 'approved_by', 'entry_timestamp', 'exit_timestamp')
@@ -38,4 +39,22 @@ class ActivityCategoryAdmin(admin.ModelAdmin):
 @admin.register(ActivitySubCategory)
 class ActivitySubCategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'category')
-    list_filter = ('category',)
\ No newline at end of file
+    list_select_related = ('category',)
+    list_filter = ('category',)
+
+@admin.register(ArchivedAccessLog)
+class ArchivedAccessLogAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'location', 'status', 'request_timestamp', 'archived_at')
+    list_select_related = ('user', 'location')
+    list_filter = ('status', 'location')
+    search_fields = ('user__username', 'user__first_name', 'user__last_name', 'notes')
+
+    # Archived logs are an audit record, written only by archive_access_logs
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
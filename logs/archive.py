@@ -0,0 +1,95 @@
+# logs/archive.py
+"""Moves old, finished access logs from ServerRoomAccessLog to ArchivedAccessLog.
+
+Logs are moved in small batches, each in its own short transaction, so
+check-ins and approvals are never held up behind one long-running move.
+Archived logs stay in DailyAccessRollup: the hot rows are deleted with
+plain SQL, which skips the signal handlers that would otherwise take them
+out of the counts (rollups.rebuild() reads both tables for the same
+reason). Their entry photos are deleted once the batch has committed.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .filters import TIME_RANGES
+from .models import ArchivedAccessLog, ServerRoomAccessLog, SiteOccupancy
+
+# Only logs that can't change any more are archived
+ARCHIVED_STATUSES = ('Completed', 'Denied')
+PHOTO_DIR = 'access_photos/check_in'
+
+_FIELDS = [field.attname for field in ArchivedAccessLog._meta.concrete_fields if field.name != 'archived_at']
+
+
+def cutoff(days=None, now=None):
+    """Returns the request_timestamp before which finished logs are archived."""
+    days = settings.LOG_RETENTION_DAYS if days is None else days
+    # Rolling dashboard ranges count their partial first day from the hot table
+    # (rollups.count_by), so everything they can reach must still be there
+    if timedelta(days=days) <= max(TIME_RANGES.values()) + timedelta(days=1):
+        raise ImproperlyConfigured(f"Logs must be kept longer than the longest dashboard time range ({days} days is too short).")
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def archivable(before):
+    return ServerRoomAccessLog.objects.filter(status__in=ARCHIVED_STATUSES, request_timestamp__lt=before)
+
+
+def archive_batch(before, batch_size=None):
+    """Archives up to `batch_size` of the oldest archivable logs; returns how many were moved."""
+    batch_size = batch_size or settings.LOG_ARCHIVE_BATCH_SIZE
+    with transaction.atomic():
+        # Rows another worker has locked are left for the next run
+        ids = list(
+            archivable(before).select_for_update(skip_locked=True)
+            .order_by('request_timestamp', 'id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        rows = list(ServerRoomAccessLog.objects.filter(id__in=ids).values(*_FIELDS, 'entry_photo'))
+        photos = [row.pop('entry_photo') for row in rows]
+        ArchivedAccessLog.objects.bulk_create(
+            [ArchivedAccessLog(**row) for row in rows],
+            ignore_conflicts=True,  # a re-run after a failed delete finds its rows already archived
+        )
+        SiteOccupancy.objects.filter(log_id__in=ids).delete()
+        with connection.cursor() as cursor:
+            table = connection.ops.quote_name(ServerRoomAccessLog._meta.db_table)
+            cursor.execute(f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+        photos = [name for name in photos if name]
+        transaction.on_commit(lambda: delete_photos(photos))
+    return len(ids)
+
+
+def delete_photos(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+def sweep_photos(before):
+    """Deletes check-in photos written before `before` that no access log refers to; returns how many.
+
+    These are left behind by check-ins whose save failed, or by logs
+    deleted without going through archive_batch().
+    """
+    try:
+        _, files = default_storage.listdir(PHOTO_DIR)
+    except FileNotFoundError:
+        return 0
+    # A photo older than `before` can only belong to a log requested before it
+    referenced = set(
+        ServerRoomAccessLog.objects.filter(request_timestamp__lt=before).exclude(entry_photo='')
+        .values_list('entry_photo', flat=True)
+    )
+    deleted = 0
+    for filename in files:
+        name = f"{PHOTO_DIR}/{filename}"
+        if name not in referenced and default_storage.get_modified_time(name) < before:
+            default_storage.delete(name)
+            deleted += 1
+    return deleted
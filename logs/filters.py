@@ -0,0 +1,78 @@
+# logs/filters.py
+"""Query-string filters shared by the views that list access logs."""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import ServerRoomAccessLog
+
+# time_filter values and how far back each one reaches; 'all' has no lower bound
+TIME_RANGES = {
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+    'month': timedelta(days=30),
+}
+STATUSES = {value for value, _ in ServerRoomAccessLog.STATUS_CHOICES}
+
+
+def _read_date(value):
+    try:
+        date = parse_date(value)
+    except ValueError:  # well formed but impossible, like 2024-02-30
+        return ''
+    return date.isoformat() if date else ''
+
+
+def read_filters(params):
+    """Returns the time_filter, status, site and date range filters from a QueryDict.
+
+    Unknown values fall back to "no filter", so a bad query string never
+    turns into a database error. date_from and date_to are inclusive
+    calendar days (YYYY-MM-DD) in the project time zone.
+    """
+    time_filter = params.get('time_filter', 'all')
+    status = params.get('status', '')
+    site = params.get('site', '')
+    return {
+        'time_filter': time_filter if time_filter in TIME_RANGES else 'all',
+        'status': status if status in STATUSES else '',
+        'site': site if site.isdigit() else '',
+        'date_from': _read_date(params.get('date_from', '')),
+        'date_to': _read_date(params.get('date_to', '')),
+    }
+
+
+def start_of_range(time_filter, now=None):
+    """Returns the earliest request_timestamp a time_filter lets through, or None."""
+    if time_filter not in TIME_RANGES:
+        return None
+    return (now or timezone.now()) - TIME_RANGES[time_filter]
+
+
+def date_bounds(filters):
+    """Returns the [start, end) request_timestamp bounds of the date range filters; either may be None."""
+    tz = timezone.get_default_timezone()
+    start = end = None
+    if filters['date_from']:
+        start = timezone.make_aware(datetime.combine(parse_date(filters['date_from']), time.min), tz)
+    if filters['date_to']:
+        end = timezone.make_aware(datetime.combine(parse_date(filters['date_to']) + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def apply_filters(logs, filters, now=None):
+    """Narrows a ServerRoomAccessLog queryset to the filters from `read_filters`."""
+    start_date = start_of_range(filters['time_filter'], now)
+    if start_date:
+        logs = logs.filter(request_timestamp__gte=start_date)
+    date_start, date_end = date_bounds(filters)
+    if date_start:
+        logs = logs.filter(request_timestamp__gte=date_start)
+    if date_end:
+        logs = logs.filter(request_timestamp__lt=date_end)
+    if filters['status']:
+        logs = logs.filter(status=filters['status'])
+    if filters['site']:
+        logs = logs.filter(location_id=filters['site'])
+    return logs
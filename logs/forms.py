@@ -8,8 +8,9 @@ class AccessRequestForm(forms.ModelForm):
         fields = ['location', 'category', 'notes', 'group_members']
 
 class CheckInVerificationForm(forms.ModelForm):
-    # This hidden field will hold the image data as a text string
-    photo_data = forms.CharField(widget=forms.HiddenInput())
+    # The JPEG captured by the browser, uploaded as-is. A FileField rather than an
+    # ImageField so Django passes the bytes through without decoding them.
+    photo = forms.FileField(required=False)
 
     class Meta:
         model = ServerRoomAccessLog
@@ -0,0 +1,49 @@
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.cache import bump_version
+from logs import archive
+
+
+class Command(BaseCommand):
+    help = ('Moves Completed and Denied access logs older than LOG_RETENTION_DAYS to the archive table, '
+            'in short batches, and deletes their entry photos.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Retention in days (default: LOG_RETENTION_DAYS).')
+        parser.add_argument('--batch-size', type=int, help='Logs moved per transaction (default: LOG_ARCHIVE_BATCH_SIZE).')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to wait between batches, to leave room for other writers.')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches; the next run carries on.')
+        parser.add_argument('--sweep-photos', action='store_true',
+                            help='Also delete check-in photos older than the cutoff that no access log refers to.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many logs would be archived.')
+
+    def handle(self, *args, **options):
+        try:
+            before = archive.cutoff(options['days'])
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+        if options['dry_run']:
+            self.stdout.write(f"{archive.archivable(before).count()} logs requested before {before:%Y-%m-%d %H:%M} would be archived.")
+            return
+
+        self.stdout.write(f"Archiving logs requested before {before:%Y-%m-%d %H:%M}...")
+        moved = batches = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            count = archive.archive_batch(before, options['batch_size'])
+            if not count:
+                break
+            moved += count
+            batches += 1
+            self.stdout.write(f"  {moved} logs archived")
+            if options['pause']:
+                time.sleep(options['pause'])
+        if moved:
+            bump_version()
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} logs in {batches} batches."))
+
+        if options['sweep_photos']:
+            self.stdout.write(self.style.SUCCESS(f"Deleted {archive.sweep_photos(before)} unreferenced check-in photos."))
@@ -0,0 +1,173 @@
+import json
+import re
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Q, Sum
+from django.http import QueryDict
+from django.utils import timezone
+
+from logs.filters import apply_filters, read_filters
+from logs.models import DailyAccessRollup, ServerRoomAccessLog
+from logs.rollups import rollup_day
+from users.models import CustomUser
+
+STATUS_WEIGHTS = 'Completed=80,Denied=8,Pending=5,Approved=5,Checked-In=2'
+
+
+class Rollback(Exception):
+    """Raised to undo the seeded rows once the benchmark is done."""
+
+
+def view_queries(pic, user, now):
+    """The queries behind the hot views, as {name: queryset}."""
+    week = read_filters(QueryDict('time_filter=week'))
+    logs = ServerRoomAccessLog.objects.all()
+    newest_first = logs.order_by('-request_timestamp', '-id')
+    queries = {
+        'manage_logs.pending_all': logs.filter(status='Pending').order_by('request_timestamp', 'id')[:51],
+        'manage_logs.pending_pic': logs.filter(status='Pending', location__pic=pic).order_by('request_timestamp', 'id')[:51],
+        'manage_logs.history_pic': logs.filter(location__pic=pic).select_related('user', 'location').order_by('-request_timestamp', '-id')[:51],
+        'access_history': logs.filter(user=user).select_related('location').order_by('-request_timestamp', '-id')[:51],
+        'dashboard.first_page_week': apply_filters(newest_first, week, now)[:51],
+        'dashboard.rollup_month': (
+            DailyAccessRollup.objects.filter(day__gte=rollup_day(now - timedelta(days=30)))
+            .values('status', 'location__name', 'category__name')
+            .annotate(total=Sum('count'))
+            .order_by()
+        ),
+        'dashboard.status_filter_month': apply_filters(logs, read_filters(QueryDict('time_filter=month&status=Denied')), now).order_by('-request_timestamp')[:51],
+    }
+    # Only a table with more than one page has a second page to time
+    page_end = next(iter(newest_first[50:51]), None)
+    if page_end is not None:
+        queries['dashboard.next_page'] = newest_first.filter(
+            Q(request_timestamp__lt=page_end.request_timestamp)
+            | Q(request_timestamp=page_end.request_timestamp, id__lt=page_end.id)
+        )[:51]
+    return queries
+
+
+def plan_shape(plan):
+    # Costs, row estimates and timings change from run to run; the operators and indexes used don't
+    return re.sub(r'\(.*?\)|\d+(\.\d+)?', '', plan)
+
+
+class Command(BaseCommand):
+    help = ('Seeds a large access log table with populate_db, replacing the current data until the run is rolled back, '
+            'and records query plans and timings for the hot view queries.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200_000, help='Access logs to seed.')
+        parser.add_argument('--users', type=int, default=2_000, help='Users to seed.')
+        parser.add_argument('--sites', type=int, default=200, help='Sites to seed.')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the generated data.')
+        parser.add_argument('--no-seed', action='store_true', help='Benchmark the data already in the database.')
+        parser.add_argument('--keep', action='store_true',
+                            help='Commit the seeded data instead of rolling it back; like populate_db, this replaces the current data.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per query.')
+        parser.add_argument('--database', default='default', help='Database alias to benchmark.')
+        parser.add_argument('--output', help='JSON file for the results (default: benchmark-queries-<vendor>.json).')
+        parser.add_argument('--baseline', help='Earlier results to compare against.')
+        parser.add_argument('--threshold', type=float, default=1.5, help='Slowdown against the baseline that counts as a regression.')
+        parser.add_argument('--fail-on-regression', action='store_true', help='Exit with an error if any query regressed.')
+
+    def handle(self, *args, **options):
+        if not options['no_seed'] and options['database'] != 'default':
+            raise CommandError("populate_db seeds the default database; use --no-seed to benchmark another one.")
+        connection = connections[options['database']]
+        results = None
+        try:
+            with transaction.atomic(using=options['database']):
+                if not options['no_seed']:
+                    self.seed(options)
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+                results = self.run_queries(connection, options)
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            self.stdout.write("Rolled back the seeded data.")
+
+        output = options['output'] or f"benchmark-queries-{connection.vendor}.json"
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {output}"))
+
+        if options['baseline']:
+            regressions = self.compare(results, options['baseline'], options['threshold'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"{len(regressions)} queries regressed: {', '.join(regressions)}")
+
+    # --- Seeding ---
+
+    def seed(self, options):
+        # The same generator as populate_db, so benchmarks and local data share one distribution
+        call_command(
+            'populate_db',
+            '--status-weights', STATUS_WEIGHTS,
+            logs=options['rows'],
+            users=options['users'],
+            pics=max(1, options['users'] // 100),
+            sites=options['sites'],
+            days=365,
+            seed=options['seed'],
+            stdout=self.stdout,
+        )
+
+    # --- Measuring ---
+
+    def run_queries(self, connection, options):
+        now = timezone.now()
+        pic = CustomUser.objects.filter(pic_locations__isnull=False).order_by('-id').first()
+        user = ServerRoomAccessLog.objects.order_by('-id').values_list('user', flat=True).first()
+        if pic is None or user is None:
+            raise CommandError("Nothing to benchmark: the database has no logs or no site with a PIC.")
+
+        results = {
+            'vendor': connection.vendor,
+            'rows': ServerRoomAccessLog.objects.count(),
+            'repeat': options['repeat'],
+            'queries': {},
+        }
+        analyze = connection.vendor == 'postgresql'
+        for name, queryset in view_queries(pic, user, now).items():
+            plan = queryset.explain(analyze=True) if analyze else queryset.explain()
+            list(queryset.all())  # warm the cache so the first timed run isn't an outlier
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            results['queries'][name] = {
+                'sql': str(queryset.query),
+                'plan': plan,
+                'min_ms': round(timings[0], 3),
+                'median_ms': round(statistics.median(timings), 3),
+                'p95_ms': round(timings[int(0.95 * (len(timings) - 1))], 3),
+            }
+            self.stdout.write(f"{name:32} median {results['queries'][name]['median_ms']:9.3f} ms")
+        return results
+
+    def compare(self, results, baseline_path, threshold):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = []
+        for name, result in results['queries'].items():
+            before = baseline['queries'].get(name)
+            if before is None:
+                continue
+            ratio = result['median_ms'] / before['median_ms'] if before['median_ms'] else 1.0
+            notes = []
+            if ratio > threshold:
+                notes.append('REGRESSION')
+                regressions.append(name)
+            if plan_shape(result['plan']) != plan_shape(before['plan']):
+                notes.append('plan changed')
+            self.stdout.write(f"{name:32} {before['median_ms']:9.3f} -> {result['median_ms']:9.3f} ms ({ratio:.2f}x) {' '.join(notes)}")
+        return regressions
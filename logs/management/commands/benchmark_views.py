@@ -0,0 +1,373 @@
+import asyncio
+import itertools
+import json
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models.signals import post_save
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from access_control import face_client
+from logs.models import ActivityCategory, ServerRoomAccessLog
+from users.models import CustomUser
+
+ENDPOINTS = ['site_list', 'dashboard_view', 'manage_logs', 'access_history', 'request_access', 'process_check_in']
+# Async views, driven in-process through AsyncClient on one event loop as an ASGI server would run them
+ASYNC_ENDPOINTS = {'process_check_in'}
+PHOTO = b'\xff\xd8\xff\xe0 benchmark photo'
+
+# The SQL run on behalf of the async request being timed; the ORM's sync_to_async calls copy it into their thread
+_request_queries = ContextVar('request_queries', default=None)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+def count_query(execute, sql, params, many, context):
+    queries = _request_queries.get()
+    if queries is not None:
+        queries.append(sql)
+    return execute(sql, params, many, context)
+
+
+class StubFaceService:
+    """A local stand-in for the face service that answers every call after a fixed latency."""
+
+    def __init__(self, latency):
+        latency_s = latency / 1000
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _respond(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                time.sleep(latency_s)
+                user_id = self.path.rstrip('/').rsplit('/', 1)[-1]
+                body = json.dumps({'user_id': user_id, 'verified': True, 'distance': 0.1, 'threshold': 0.3}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_POST = do_PUT = do_DELETE = _respond
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Command(BaseCommand):
+    help = 'Drives the main request paths at a set concurrency and reports latency percentiles, throughput and SQL query counts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help=f"Comma-separated subset of: {', '.join(ENDPOINTS)}.")
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at once.')
+        parser.add_argument('--face-latency-ms', type=float, default=150, help='Latency of the stub face service.')
+        parser.add_argument('--base-url', help='Drive a running server (e.g. http://127.0.0.1:8000) instead of calling Django in-process. '
+                                               'SQL queries are only counted in-process.')
+        parser.add_argument('--populate', type=int, metavar='LOGS', help='Run populate_db with this many logs first (replaces all data).')
+        parser.add_argument('--output', default='benchmark-views.json', help='JSON file for the results.')
+        parser.add_argument('--baseline', help='Earlier results to compare against.')
+
+    def handle(self, *args, **options):
+        endpoints = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+        if options['populate']:
+            call_command('populate_db', logs=options['populate'], users=max(50, options['populate'] // 100),
+                         sites=max(4, options['populate'] // 1000), stdout=self.stdout)
+
+        self.vendor = CustomUser.objects.filter(is_staff=False, access_logs__isnull=False).first()
+        self.pic = CustomUser.objects.filter(is_staff=True, pic_locations__isnull=False).first()
+        if self.vendor is None or self.pic is None:
+            raise CommandError("Seed the database first, e.g. with populate_db or --populate.")
+        self.site = self.pic.pic_locations.first()
+        self.category = ActivityCategory.objects.first()
+        self.created_ids = []
+
+        media_root = tempfile.mkdtemp()
+        results = {
+            'commit': self.git_commit(),
+            'timestamp': timezone.now().isoformat(),
+            'vendor': connection.vendor,
+            'rows': ServerRoomAccessLog.objects.count(),
+            'options': {key: options[key] for key in ('requests', 'concurrency', 'face_latency_ms', 'base_url')},
+            'endpoints': {},
+        }
+        # Only logs this process creates are the run's own; other users may be writing to the same database
+        post_save.connect(self.track_created, sender=ServerRoomAccessLog)
+        try:
+            # The test clients send Host: testserver, as under the test runner
+            with StubFaceService(options['face_latency_ms']) as face_service, \
+                    override_settings(FACE_SERVICE_URL=face_service.url, MEDIA_ROOT=media_root,
+                                      ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                face_client._client = None
+                face_client._async_client = None
+                for name in endpoints:
+                    results['endpoints'][name] = self.run_endpoint(name, options)
+                    self.report(name, results['endpoints'][name])
+        finally:
+            face_client._client = None
+            face_client._async_client = None
+            post_save.disconnect(self.track_created, sender=ServerRoomAccessLog)
+            self.clean_up(options)
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        if options['baseline']:
+            self.compare(results, options['baseline'])
+
+    # --- Requests ---
+
+    def make_request(self, name, i):
+        """Returns (user, method, path, data) for the i-th request to an endpoint."""
+        if name == 'site_list':
+            return self.vendor, 'get', '/', None
+        if name == 'dashboard_view':
+            return self.pic, 'get', '/dashboard/?time_filter=month', None
+        if name == 'manage_logs':
+            return self.pic, 'get', '/logs/manage/', None
+        if name == 'access_history':
+            return self.vendor, 'get', '/logs/history/', None
+        if name == 'request_access':
+            return self.vendor, 'post', '/logs/request/', {
+                'location': self.site.id,
+                'category': self.category.id if self.category else '',
+                'notes': f'Benchmark request {i}',
+                'group_members': '',
+                'detailed_activities': '[]',
+            }
+        if name == 'process_check_in':
+            log = self.check_in_logs[i]
+            return self.vendor, 'post', f'/logs/check-in/{log.id}/', {
+                'photo': SimpleUploadedFile('checkin.jpg', PHOTO, content_type='image/jpeg'),
+            }
+        raise CommandError(f"Unknown endpoint {name}")
+
+    def run_endpoint(self, name, options):
+        if name == 'process_check_in':
+            # Every check-in needs its own approved log; these are removed again in clean_up()
+            self.check_in_logs = [
+                ServerRoomAccessLog.objects.create(user=self.vendor, location=self.site, notes='Benchmark check-in', status='Approved')
+                for _ in range(options['requests'])
+            ]
+
+        if name in ASYNC_ENDPOINTS and not options['base_url']:
+            samples, elapsed = asyncio.run(self.drive_async(name, options))
+        else:
+            samples, elapsed = self.drive_threads(name, options)
+
+        latencies = sorted(sample['ms'] for sample in samples)
+        queries = [sample['queries'] for sample in samples if sample['queries'] is not None]
+        return {
+            'requests': len(samples),
+            'requests_per_second': round(len(samples) / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'mean_queries': round(statistics.mean(queries), 2) if queries else None,
+            'max_queries': max(queries) if queries else None,
+            'statuses': dict(Counter(str(sample['status']) for sample in samples)),
+        }
+
+    def drive_threads(self, name, options):
+        """Sends the requests from `concurrency` threads; returns (samples, elapsed seconds)."""
+        send = self.send_remote if options['base_url'] else self.send_local
+        indexes = itertools.count()
+        index_lock = threading.Lock()
+        samples = []
+
+        def worker():
+            local = threading.local()
+            try:
+                while True:
+                    with index_lock:
+                        i = next(indexes)
+                    if i >= options['requests']:
+                        return
+                    user, method, path, data = self.make_request(name, i)
+                    samples.append(send(local, options, user, method, path, data))
+            finally:
+                # Each thread has its own database connections
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['concurrency'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples, time.perf_counter() - started
+
+    async def drive_async(self, name, options):
+        """Sends the requests from `concurrency` tasks on one event loop; returns (samples, elapsed seconds).
+
+        Driving an async view through the sync Client would time async_to_sync
+        and a thread per request instead of the view.
+        """
+        indexes = iter(range(options['requests']))
+        clients = {}
+        samples = []
+
+        async def worker():
+            # The tasks share one iterator, so each index is sent once
+            for i in indexes:
+                user, method, path, data = self.make_request(name, i)
+                if user.id not in clients:
+                    clients[user.id] = asyncio.ensure_future(self.async_client(user))
+                samples.append(await self.send_async(await clients[user.id], method, path, data))
+
+        # The ORM runs sync_to_async calls on one thread here, with a connection of its own
+        await sync_to_async(lambda: connections['default'].execute_wrappers.append(count_query))()
+        try:
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(options['concurrency'])))
+            return samples, time.perf_counter() - started
+        finally:
+            await sync_to_async(lambda: connections['default'].execute_wrappers.remove(count_query))()
+            await sync_to_async(connections.close_all)()
+
+    async def async_client(self, user):
+        client = AsyncClient(raise_request_exception=False)
+        await client.aforce_login(user)
+        return client
+
+    def send_local(self, local, options, user, method, path, data):
+        clients = local.__dict__.setdefault('clients', {})
+        if user.id not in clients:
+            clients[user.id] = Client(raise_request_exception=False)
+            clients[user.id].force_login(user)
+        client = clients[user.id]
+
+        with CaptureQueriesContext(connections['default']) as captured:
+            started = time.perf_counter()
+            try:
+                status = getattr(client, method)(path, data).status_code
+            except Exception as e:
+                status = type(e).__name__
+            ms = (time.perf_counter() - started) * 1000
+        return {'ms': ms, 'status': status, 'queries': len(captured)}
+
+    async def send_async(self, client, method, path, data):
+        captured = []
+        _request_queries.set(captured)
+        started = time.perf_counter()
+        try:
+            status = (await getattr(client, method)(path, data)).status_code
+        except Exception as e:
+            status = type(e).__name__
+        return {'ms': (time.perf_counter() - started) * 1000, 'status': status, 'queries': len(captured)}
+
+    def send_remote(self, local, options, user, method, path, data):
+        sessions = local.__dict__.setdefault('sessions', {})
+        if user.id not in sessions:
+            sessions[user.id] = self.remote_session(options['base_url'], user)
+        session = sessions[user.id]
+
+        files = {key: (value.name, value.read(), value.content_type) for key, value in (data or {}).items() if hasattr(value, 'read')}
+        fields = {key: value for key, value in (data or {}).items() if key not in files}
+        if method == 'post':
+            fields['csrfmiddlewaretoken'] = session.cookies.get('csrftoken', '')
+        started = time.perf_counter()
+        try:
+            response = session.request(method.upper(), options['base_url'].rstrip('/') + path, data=fields or None,
+                                       files=files or None, allow_redirects=False, timeout=60,
+                                       headers={'Referer': options['base_url']})
+            status = response.status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        return {'ms': (time.perf_counter() - started) * 1000, 'status': status, 'queries': None}
+
+    def remote_session(self, base_url, user):
+        """A requests session already signed in as `user`, through a session created directly in the database."""
+        store = import_module(settings.SESSION_ENGINE).SessionStore()
+        store[SESSION_KEY] = str(user.pk)
+        store[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        store.save()
+        session = requests.Session()
+        session.cookies.set(settings.SESSION_COOKIE_NAME, store.session_key)
+        session.get(base_url.rstrip('/') + '/', timeout=60)  # picks up a CSRF cookie
+        return session
+
+    # --- Reporting ---
+
+    def track_created(self, sender, instance, created, raw, **kwargs):
+        if created and not raw:
+            self.created_ids.append(instance.pk)
+
+    def clean_up(self, options):
+        # Leave the seeded data as it was: drop the logs the run created (through
+        # the ORM, so the rollup and occupancy tables follow)
+        for log in ServerRoomAccessLog.objects.filter(id__in=self.created_ids):
+            log.delete()
+        if options['base_url']:
+            self.stdout.write(self.style.WARNING(
+                f"Logs created by the server at {options['base_url']} (e.g. by request_access) were left in place."
+            ))
+
+    def git_commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def report(self, name, result):
+        queries = '-' if result['mean_queries'] is None else f"{result['mean_queries']:.1f}"
+        self.stdout.write(
+            f"{name:18} {result['requests_per_second']:8.1f} req/s  p50 {result['p50_ms']:8.1f}  "
+            f"p95 {result['p95_ms']:8.1f}  p99 {result['p99_ms']:8.1f} ms  queries {queries}  {result['statuses']}"
+        )
+
+    def compare(self, results, baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        self.stdout.write(f"Compared with {baseline.get('commit') or baseline_path}:")
+        for name, result in results['endpoints'].items():
+            before = baseline['endpoints'].get(name)
+            if before is None:
+                continue
+            self.stdout.write(
+                f"{name:18} p95 {before['p95_ms']:8.1f} -> {result['p95_ms']:8.1f} ms  "
+                f"{before['requests_per_second']:8.1f} -> {result['requests_per_second']:8.1f} req/s  "
+                f"queries {before['mean_queries']} -> {result['mean_queries']}"
+            )
@@ -1,117 +1,275 @@
 import random
-from datetime import datetime, timedelta
-from django.core.management.base import BaseCommand
+import sys
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 from django.utils import timezone
 from users.models import CustomUser
 from sites.models import ServerLocation
-from logs.models import ActivityCategory, ActivitySubCategory, ServerRoomAccessLog
+from logs.models import ActivityCategory, ActivitySubCategory, ArchivedAccessLog, DailyAccessRollup, ServerRoomAccessLog, SiteOccupancy
+from logs.rollups import rebuild
+from dashboard.cache import bump_version
+
+FIRST_NAMES = ['Budi', 'Citra', 'Dewi', 'Eko', 'Fitri', 'Agus', 'Rina', 'Joko', 'Sari', 'Hendra', 'Wulan', 'Bayu', 'Indah', 'Rizky', 'Putri', 'Dimas']
+LAST_NAMES = ['Santoso', 'Wijaya', 'Lestari', 'Prasetyo', 'Handayani', 'Saputra', 'Kusuma', 'Hidayat', 'Nugroho', 'Permata', 'Siregar', 'Gunawan']
+
+# The first sites are real ones around Bandung; any more are scattered around them
+SITES_DATA = [
+    {'name': 'Data Center Gedebage', 'lat': -6.9452, 'lon': 107.7013},
+    {'name': 'Server Room Pasteur', 'lat': -6.8922, 'lon': 107.5898},
+    {'name': 'Network Hub Dago', 'lat': -6.8833, 'lon': 107.6143},
+    {'name': 'IT Office Asia Afrika', 'lat': -6.9218, 'lon': 107.6071},
+]
+
+CATEGORIES_DATA = {
+    'Pemeriksaan Fisik & Lingkungan': ['Suhu & Kelembapan', 'Sistem Pendingin (AC)', 'UPS & Daya Listrik', 'Kebersihan & Kerapian', 'Pencegahan Bencana'],
+    'Pemeriksaan Perangkat Keras (Hardware)': ['Server', 'Perangkat Jaringan', 'Sistem Penyimpanan'],
+    'Instalasi, Perawatan, & Konfigurasi': ['Instalasi/Pelepasan Fisik', 'Penggantian/Upgrade Komponen', 'Manajemen Kabel', 'Akses Konsol Fisik', 'Manajemen Backup Fisik'],
+    'Keamanan & Aktivitas Lainnya': ['Verifikasi Keamanan', 'Inventarisasi', 'Mendampingi Pihak Ketiga'],
+}
+
+POSES = ['front.jpg', 'left.jpg', 'right.jpg']
+
+
+def parse_weights(value):
+    """Parses 'Completed=70,Denied=8' into {'Completed': 70.0, 'Denied': 8.0}."""
+    try:
+        weights = {key.strip(): float(weight) for key, weight in (item.split('=') for item in value.split(','))}
+    except ValueError:
+        raise CommandError(f"Expected NAME=WEIGHT pairs separated by commas, got {value!r}")
+    unknown = set(weights) - {status for status, _ in ServerRoomAccessLog.STATUS_CHOICES}
+    if unknown:
+        raise CommandError(f"Unknown statuses: {', '.join(sorted(unknown))}")
+    return weights
+
+
+def parse_range(value):
+    """Parses '30-180' into (30, 180)."""
+    try:
+        low, high = (int(part) for part in value.split('-'))
+    except ValueError:
+        raise CommandError(f"Expected a range like 30-180, got {value!r}")
+    if low > high:
+        raise CommandError(f"Empty range {value!r}")
+    return low, high
+
+
+def parse_hours(value):
+    """Parses '8-11,13-16' into the set of hours those ranges cover, ends included."""
+    hours = set()
+    for item in value.split(','):
+        low, high = parse_range(item)
+        hours.update(range(low, high + 1))
+    if not hours <= set(range(24)):
+        raise CommandError(f"Hours must be between 0 and 23, got {value!r}")
+    return sorted(hours)
+
 
 class Command(BaseCommand):
     help = 'Populates the database with dummy data for the server room access app.'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--logs', type=int, default=50, help='Access logs to create.')
+        parser.add_argument('--users', type=int, default=5, help='Vendor users to create.')
+        parser.add_argument('--pics', type=int, default=3, help='PIC (staff) users to create.')
+        parser.add_argument('--sites', type=int, default=4, help='Sites to create.')
+        parser.add_argument('--days', type=int, default=30, help='How far back request timestamps go.')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, so runs are reproducible.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT.')
+        parser.add_argument('--status-weights', type=parse_weights,
+                            default='Completed=70,Denied=8,Pending=7,Approved=10,Checked-In=5',
+                            help='Relative frequency of each status, e.g. Completed=70,Denied=8.')
+        parser.add_argument('--peak-hours', type=parse_hours, default='8-11,13-16', help='Busy request hours, e.g. 8-11,13-16.')
+        parser.add_argument('--peak-share', type=float, default=0.8, help='Share of requests made during peak hours.')
+        parser.add_argument('--duration-minutes', type=parse_range, default='30-180', help='Range of visit lengths.')
+        parser.add_argument('--max-activities', type=int, default=4, help='Most detailed activities ticked per request.')
+        parser.add_argument('--max-group-size', type=int, default=3, help='Most extra group members per request.')
+        parser.add_argument('--gallery', nargs='?', const='', default=None, metavar='PATH',
+                            help='Also write fake face embeddings for every user to the face service gallery '
+                                 '(default PATH: face_recognition/face_db/gallery).')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
         self.stdout.write("Deleting old data...")
-        # Clean up old data to prevent duplicates
-        ServerRoomAccessLog.objects.all().delete()
-        ActivitySubCategory.objects.all().delete()
-        ActivityCategory.objects.all().delete()
-        ServerLocation.objects.all().delete()
-        CustomUser.objects.filter(is_superuser=False).delete()
+        self.delete_old_data()
 
         self.stdout.write("Creating new data...")
+        with transaction.atomic():
+            pics, users = self.create_users(options)
+            sites = self.create_sites(options, pics)
+            categories = self.create_categories()
+        self.create_logs(options, pics + users, sites, categories)
 
-        # --- 1. Create Users ---
-        pics = []
-        for i in range(1, 4):
-            pic, _ = CustomUser.objects.get_or_create(
-                username=f'pic{i}',
-                defaults={'first_name': f'PIC', 'last_name': f'User {i}', 'email': f'pic{i}@pln.co.id', 'department': 'IT Operations', 'is_staff': True}
-            )
-            pic.set_password('password123')
-            pic.save()
-            pics.append(pic)
+        # bulk_create skips the signal handlers, so derive the rollup and occupancy tables in one pass each
+        self.stdout.write("Rebuilding rollups and occupancy...")
+        rebuild()
+        self.rebuild_occupancy()
+        bump_version()
+
+        if options['gallery'] is not None:
+            self.create_gallery(options, pics + users)
+
+        self.stdout.write(self.style.SUCCESS('Successfully populated the database!'))
+
+    def delete_old_data(self):
+        # Deleting logs through the ORM would send a signal per row; these tables
+        # are cleared wholesale instead, children first.
+        with transaction.atomic(), connection.cursor() as cursor:
+            for model in (SiteOccupancy, DailyAccessRollup, ServerRoomAccessLog, ArchivedAccessLog):
+                cursor.execute(f"DELETE FROM {connection.ops.quote_name(model._meta.db_table)}")
+            ActivitySubCategory.objects.all().delete()
+            ActivityCategory.objects.all().delete()
+            ServerLocation.objects.all().delete()
+            CustomUser.objects.filter(is_superuser=False).delete()
+
+    # --- 1. Create Users ---
+
+    def create_users(self, options):
+        password = make_password('password123')
+        enrolled = options['gallery'] is not None
+
+        pics = CustomUser.objects.bulk_create([
+            CustomUser(username=f'pic{i}', first_name='PIC', last_name=f'User {i}', email=f'pic{i}@pln.co.id',
+                       department='IT Operations', is_staff=True, password=password, is_face_enrolled=enrolled)
+            for i in range(1, options['pics'] + 1)
+        ], batch_size=options['batch_size'])
 
         users = []
-        user_names = [('Budi', 'Santoso'), ('Citra', 'Wijaya'), ('Dewi', 'Lestari'), ('Eko', 'Prasetyo'), ('Fitri', 'Handayani')]
-        for first, last in user_names:
-            user, _ = CustomUser.objects.get_or_create(
-                username=first.lower(),
-                defaults={'first_name': first, 'last_name': last, 'email': f'{first.lower()}@vendor.com', 'department': 'Vendor Services'}
-            )
-            user.set_password('password123')
-            user.save()
-            users.append(user)
-        
-        all_users = pics + users
-
-        # --- 2. Create Sites with Coordinates (around Bandung) ---
-        sites_data = [
-            {'name': 'Data Center Gedebage', 'lat': -6.9452, 'lon': 107.7013},
-            {'name': 'Server Room Pasteur', 'lat': -6.8922, 'lon': 107.5898},
-            {'name': 'Network Hub Dago', 'lat': -6.8833, 'lon': 107.6143},
-            {'name': 'IT Office Asia Afrika', 'lat': -6.9218, 'lon': 107.6071}
-        ]
+        for i in range(1, options['users'] + 1):
+            first, last = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+            users.append(CustomUser(username=f'{first.lower()}{i}', first_name=first, last_name=last,
+                                    email=f'{first.lower()}{i}@vendor.com', department='Vendor Services',
+                                    password=password, is_face_enrolled=enrolled))
+        users = CustomUser.objects.bulk_create(users, batch_size=options['batch_size'])
+        self.stdout.write(f"Created {len(pics)} PICs and {len(users)} users.")
+        return pics, users
+
+    # --- 2. Create Sites with Coordinates (around Bandung) ---
+
+    def create_sites(self, options, pics):
+        if not pics:
+            raise CommandError("At least one PIC is needed to own the sites.")
         sites = []
-        for site_info in sites_data:
-            site = ServerLocation.objects.create(
-                name=site_info['name'],
-                address=f'Jl. {site_info["name"].split(" ")[-1]} No. {random.randint(1, 100)}, Bandung',
-                pic=random.choice(pics),
-                latitude=site_info['lat'],
-                longitude=site_info['lon']
-            )
-            sites.append(site)
+        for i in range(options['sites']):
+            if i < len(SITES_DATA):
+                name, lat, lon = SITES_DATA[i]['name'], SITES_DATA[i]['lat'], SITES_DATA[i]['lon']
+            else:
+                base = SITES_DATA[i % len(SITES_DATA)]
+                name = f"Server Room {i + 1}"
+                lat, lon = base['lat'] + self.rng.uniform(-0.05, 0.05), base['lon'] + self.rng.uniform(-0.05, 0.05)
+            sites.append(ServerLocation(
+                name=name,
+                address=f'Jl. {name.split(" ")[-1]} No. {self.rng.randint(1, 100)}, Bandung',
+                pic=pics[i % len(pics)],
+                latitude=lat,
+                longitude=lon,
+            ))
+        sites = ServerLocation.objects.bulk_create(sites, batch_size=options['batch_size'])
         self.stdout.write(f"Created {len(sites)} sites with coordinates.")
+        return sites
 
-        # --- 3. Create Categories ---
-        categories_data = {
-            'Pemeriksaan Fisik & Lingkungan': ['Suhu & Kelembapan', 'Sistem Pendingin (AC)', 'UPS & Daya Listrik', 'Kebersihan & Kerapian', 'Pencegahan Bencana'],
-            'Pemeriksaan Perangkat Keras (Hardware)': ['Server', 'Perangkat Jaringan', 'Sistem Penyimpanan'],
-            'Instalasi, Perawatan, & Konfigurasi': ['Instalasi/Pelepasan Fisik', 'Penggantian/Upgrade Komponen', 'Manajemen Kabel', 'Akses Konsol Fisik', 'Manajemen Backup Fisik'],
-            'Keamanan & Aktivitas Lainnya': ['Verifikasi Keamanan', 'Inventarisasi', 'Mendampingi Pihak Ketiga'],
-        }
-        categories = []
-        for cat_name, sub_cats in categories_data.items():
-            category = ActivityCategory.objects.create(name=cat_name)
-            categories.append(category)
-            for sub_cat_name in sub_cats:
-                ActivitySubCategory.objects.create(category=category, name=sub_cat_name)
-
-        # --- 4. Create Logs ---
-        # ... (The log creation part is the same as before) ...
-        statuses = ['Pending', 'Approved', 'Denied', 'Checked-In', 'Completed']
-        outcomes = ['Success', 'Partial', 'Failed']
-        for _ in range(50):
-            log_user = random.choice(all_users)
-            log_site = random.choice(sites)
-            log_category = random.choice(categories)
-            log_subcategory = random.choice(log_category.subcategories.all())
-            log_status = random.choice(statuses)
-            
-            request_time = timezone.now() - timedelta(days=random.randint(0, 30), hours=random.randint(0, 23))
-            
-            log = ServerRoomAccessLog.objects.create(
-                user=log_user,
-                location=log_site,
-                category=log_category,
-                subcategory=log_subcategory,
-                notes=f'Dummy request for {log_subcategory.name}.',
-                request_timestamp=request_time,
-                status=log_status,
-            )
+    # --- 3. Create Categories ---
+
+    def create_categories(self):
+        categories = ActivityCategory.objects.bulk_create([ActivityCategory(name=name) for name in CATEGORIES_DATA])
+        ActivitySubCategory.objects.bulk_create([
+            ActivitySubCategory(category=category, name=sub_cat_name)
+            for category in categories
+            for sub_cat_name in CATEGORIES_DATA[category.name]
+        ])
+        # Activity names per category, so building a log needs no queries
+        return [(category, CATEGORIES_DATA[category.name]) for category in categories]
+
+    # --- 4. Create Logs ---
 
-            if log_status != 'Pending':
-                log.approved_by = log_site.pic
-            
-            if log_status in ['Checked-In', 'Completed']:
-                log.entry_timestamp = request_time + timedelta(hours=random.randint(1, 5))
-
-            if log_status == 'Completed':
-                log.exit_timestamp = log.entry_timestamp + timedelta(minutes=random.randint(30, 180))
-                log.activity_report = f'Completed the {log_subcategory.name} task successfully.'
-                log.outcome = random.choice(outcomes)
-            
-            log.save()
-        
-        self.stdout.write("Created 50 dummy log entries.")
-        self.stdout.write(self.style.SUCCESS('Successfully populated the database!'))
\ No newline at end of file
+    def create_logs(self, options, users, sites, categories):
+        statuses, weights = zip(*options['status_weights'].items())
+        now = timezone.now()
+        created = 0
+        batch = []
+        for _ in range(options['logs']):
+            batch.append(self.build_log(options, now, self.rng.choices(statuses, weights)[0],
+                                        self.rng.choice(users), self.rng.choice(sites), self.rng.choice(categories)))
+            if len(batch) == options['batch_size']:
+                created += len(ServerRoomAccessLog.objects.bulk_create(batch))
+                batch = []
+                self.stdout.write(f"  {created} logs...")
+        created += len(ServerRoomAccessLog.objects.bulk_create(batch))
+        self.stdout.write(f"Created {created} dummy log entries.")
+
+    def request_time(self, options, now):
+        day = now.date() - timedelta(days=self.rng.randrange(max(options['days'], 1)))
+        if self.rng.random() < options['peak_share']:
+            hour = self.rng.choice(options['peak_hours'])
+        else:
+            hour = self.rng.randrange(24)
+        moment = timezone.make_aware(datetime.combine(day, time(hour, self.rng.randrange(60), self.rng.randrange(60))))
+        # Today's late hours haven't happened yet
+        return min(moment, now - timedelta(minutes=self.rng.randrange(1, 60)))
+
+    def build_log(self, options, now, status, user, site, category):
+        category, activities = category
+        ticked = self.rng.sample(activities, self.rng.randint(1, min(options['max_activities'], len(activities))))
+        group = [f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}" for _ in range(self.rng.randint(0, options['max_group_size']))]
+        log = ServerRoomAccessLog(
+            user=user,
+            location=site,
+            category=category,
+            detailed_activities=ticked,
+            group_members="\n".join(group),
+            notes=f'Dummy request for {ticked[0]}.',
+            status=status,
+        )
+
+        low, high = options['duration_minutes']
+        if status == 'Checked-In':
+            # Whoever is inside right now arrived within the last visit length
+            log.entry_timestamp = now - timedelta(minutes=self.rng.randint(1, high))
+            log.request_timestamp = log.entry_timestamp - timedelta(hours=self.rng.randint(1, 5))
+        else:
+            log.request_timestamp = self.request_time(options, now)
+        if status != 'Pending':
+            log.approved_by_id = site.pic_id
+        if status == 'Completed':
+            log.entry_timestamp = log.request_timestamp + timedelta(hours=self.rng.randint(1, 5))
+            log.exit_timestamp = log.entry_timestamp + timedelta(minutes=self.rng.randint(low, high))
+            log.activity_report = f'Completed the {ticked[0]} task successfully.'
+            log.outcome = self.rng.choice(['Success', 'Success', 'Success', 'Partial', 'Failed'])
+        return log
+
+    def rebuild_occupancy(self):
+        checked_in = ServerRoomAccessLog.objects.filter(status='Checked-In').values_list('id', 'location_id', 'user_id', 'entry_timestamp')
+        SiteOccupancy.objects.bulk_create(
+            (SiteOccupancy(log_id=log_id, location_id=location_id, user_id=user_id, checked_in_at=entry)
+             for log_id, location_id, user_id, entry in checked_in.iterator()),
+            batch_size=1000,
+        )
+
+    # --- 5. Create Face Gallery (optional) ---
+
+    def create_gallery(self, options, users):
+        face_dir = settings.BASE_DIR / 'face_recognition'
+        sys.path.insert(0, str(face_dir))
+        try:
+            import numpy as np
+            from gallery_store import GalleryStore
+        except ImportError as e:
+            raise CommandError(f"--gallery needs the face service's dependencies: {e}")
+
+        # Same model and dimension as face_recognition/service.py
+        store = GalleryStore(options['gallery'] or str(face_dir / 'face_db' / 'gallery'), 'Facenet512', 512)
+        np_rng = np.random.default_rng(options['seed'])
+        for start in range(0, len(users), 1000):
+            chunk = users[start:start + 1000]
+            # One random identity per user, with each pose a small perturbation of it
+            identities = np_rng.standard_normal((len(chunk), 1, store.dim)).astype(np.float32)
+            poses = identities + 0.1 * np_rng.standard_normal((len(chunk), len(POSES), store.dim)).astype(np.float32)
+            poses /= np.linalg.norm(poses, axis=2, keepdims=True)
+            store.append(
+                {(str(user.id), pose): poses[i, j] for i, user in enumerate(chunk) for j, pose in enumerate(POSES)},
+                remove_users=[str(user.id) for user in chunk],
+            )
+        store.compact()
+        self.stdout.write(f"Wrote {len(users) * len(POSES)} fake face templates to {store.path}.")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from dashboard.cache import bump_version
+from logs.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the daily access rollup from the access logs table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rollup rows inserted per query.')
+
+    def handle(self, *args, **options):
+        self.stdout.write("Rebuilding daily access rollups...")
+        buckets = rebuild(batch_size=options['batch_size'])
+        bump_version()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {buckets} rollup rows."))
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def backfill_rollups(apps, schema_editor):
+    # A frozen copy of logs.rollups.rebuild() as it was when this migration was written
+    ServerRoomAccessLog = apps.get_model('logs', 'ServerRoomAccessLog')
+    DailyAccessRollup = apps.get_model('logs', 'DailyAccessRollup')
+    grouped = (
+        ServerRoomAccessLog.objects
+        .annotate(day=TruncDate('request_timestamp', tzinfo=timezone.get_default_timezone()))
+        .values('day', 'location_id', 'category_id', 'status')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    DailyAccessRollup.objects.bulk_create((DailyAccessRollup(**row) for row in grouped.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0004_remove_serverroomaccesslog_subcategory_and_more'),
+        ('sites', '0002_serverlocation_latitude_serverlocation_longitude'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAccessRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('Pending', 'Pending Approval'), ('Approved', 'Approved'), ('Denied', 'Denied'), ('Checked-In', 'Checked-In'), ('Completed', 'Completed')], max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='logs.activitycategory')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sites.serverlocation')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'location', 'category', 'status'), name='unique_daily_access_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
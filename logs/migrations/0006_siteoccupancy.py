@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_occupancy(apps, schema_editor):
+    ServerRoomAccessLog = apps.get_model('logs', 'ServerRoomAccessLog')
+    SiteOccupancy = apps.get_model('logs', 'SiteOccupancy')
+    checked_in = (
+        ServerRoomAccessLog.objects.filter(status='Checked-In')
+        .annotate(checked_in_at=Coalesce('entry_timestamp', 'request_timestamp'))
+        .values_list('id', 'location_id', 'user_id', 'checked_in_at')
+    )
+    SiteOccupancy.objects.bulk_create(
+        (
+            SiteOccupancy(log_id=log_id, location_id=location_id, user_id=user_id, checked_in_at=checked_in_at)
+            for log_id, location_id, user_id, checked_in_at in checked_in.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0005_dailyaccessrollup'),
+        ('sites', '0002_serverlocation_latitude_serverlocation_longitude'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checked_in_at', models.DateTimeField()),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupants', to='sites.serverlocation')),
+                ('log', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='logs.serverroomaccesslog')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'site occupancies',
+            },
+        ),
+        migrations.RunPython(backfill_occupancy, migrations.RunPython.noop),
+    ]
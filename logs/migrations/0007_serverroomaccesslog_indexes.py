@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0006_siteoccupancy'),
+        ('sites', '0002_serverlocation_latitude_serverlocation_longitude'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='serverroomaccesslog',
+            index=models.Index(fields=['user', '-request_timestamp'], name='log_user_requested_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='serverroomaccesslog',
+            index=models.Index(fields=['-request_timestamp', '-id'], name='log_requested_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='serverroomaccesslog',
+            index=models.Index(fields=['status', 'request_timestamp'], name='log_status_requested_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='serverroomaccesslog',
+            index=models.Index(fields=['location', 'status', 'request_timestamp'], name='log_location_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='serverroomaccesslog',
+            index=models.Index(condition=models.Q(('status', 'Pending')), fields=['request_timestamp'], name='log_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='serverroomaccesslog',
+            index=models.Index(condition=models.Q(('status', 'Pending')), fields=['location', 'request_timestamp'], name='log_location_pending_idx'),
+        ),
+    ]
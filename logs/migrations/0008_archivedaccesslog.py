@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0007_serverroomaccesslog_indexes'),
+        ('sites', '0002_serverlocation_latitude_serverlocation_longitude'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAccessLog',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('group_members', models.TextField(blank=True)),
+                ('request_timestamp', models.DateTimeField()),
+                ('entry_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('exit_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('detailed_activities', models.JSONField(blank=True, null=True)),
+                ('notes', models.TextField()),
+                ('status', models.CharField(choices=[('Pending', 'Pending Approval'), ('Approved', 'Approved'), ('Denied', 'Denied'), ('Checked-In', 'Checked-In'), ('Completed', 'Completed')], max_length=20)),
+                ('activity_report', models.TextField(blank=True)),
+                ('outcome', models.CharField(blank=True, choices=[('Success', 'Success'), ('Partial', 'Partial Success'), ('Failed', 'Failed')], max_length=20)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('approved_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='logs.activitycategory')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sites.serverlocation')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['request_timestamp', 'id'], name='archived_log_requested_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:40
+
+import datetime
+from django.db import migrations, models
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def backfill_visit_durations(apps, schema_editor):
+    # Recounts every bucket from both log tables, like logs.rollups.rebuild() did when this was written
+    DailyAccessRollup = apps.get_model('logs', 'DailyAccessRollup')
+    timed = Q(entry_timestamp__isnull=False, exit_timestamp__isnull=False)
+    duration = ExpressionWrapper(F('exit_timestamp') - F('entry_timestamp'), output_field=DurationField())
+    totals = {}
+    for model_name in ('ServerRoomAccessLog', 'ArchivedAccessLog'):
+        grouped = (
+            apps.get_model('logs', model_name).objects
+            .annotate(day=TruncDate('request_timestamp', tzinfo=timezone.get_default_timezone()))
+            .values('day', 'location_id', 'category_id', 'status')
+            .annotate(count=Count('id'), timed_count=Count('id', filter=timed), visit_duration=Sum(duration, filter=timed))
+            .order_by()
+        )
+        for row in grouped.iterator():
+            key = (row['day'], row['location_id'], row['category_id'], row['status'])
+            count, timed_count, visit_duration = totals.get(key, (0, 0, datetime.timedelta()))
+            totals[key] = (count + row['count'], timed_count + row['timed_count'],
+                           visit_duration + (row['visit_duration'] or datetime.timedelta()))
+    DailyAccessRollup.objects.all().delete()
+    DailyAccessRollup.objects.bulk_create(
+        (
+            DailyAccessRollup(day=day, location_id=location_id, category_id=category_id, status=status,
+                              count=count, timed_count=timed_count, visit_duration=visit_duration)
+            for (day, location_id, category_id, status), (count, timed_count, visit_duration) in totals.items()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0008_archivedaccesslog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyaccessrollup',
+            name='timed_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dailyaccessrollup',
+            name='visit_duration',
+            field=models.DurationField(default=datetime.timedelta),
+        ),
+        migrations.RunPython(backfill_visit_durations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0009_dailyaccessrollup_visit_duration'),
+        ('sites', '0002_serverlocation_latitude_serverlocation_longitude'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='serverroomaccesslog',
+            name='log_user_requested_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='serverroomaccesslog',
+            name='log_pending_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='serverroomaccesslog',
+            name='log_location_pending_idx',
+        ),
+        migrations.AddIndex(
+            model_name='serverroomaccesslog',
+            index=models.Index(fields=['user', '-request_timestamp', '-id'], name='log_user_requested_idx'),
+        ),
+    ]
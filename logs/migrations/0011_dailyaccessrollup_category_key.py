@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:04
+
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def fill_category_keys(apps, schema_editor):
+    # Uncategorized buckets (including those of deleted categories) keep key 0 and are merged into one per day, site and status
+    DailyAccessRollup = apps.get_model('logs', 'DailyAccessRollup')
+    DailyAccessRollup.objects.filter(category__isnull=False).update(category_key=F('category_id'))
+    duplicated = (
+        DailyAccessRollup.objects.filter(category_key=0)
+        .values('day', 'location_id', 'status').annotate(buckets=Count('id')).filter(buckets__gt=1).order_by()
+    )
+    for group in list(duplicated):
+        first, *rest = DailyAccessRollup.objects.filter(
+            category_key=0, day=group['day'], location_id=group['location_id'], status=group['status']
+        ).order_by('id')
+        for bucket in rest:
+            first.count += bucket.count
+            first.timed_count += bucket.timed_count
+            first.visit_duration += bucket.visit_duration
+        first.save()
+        DailyAccessRollup.objects.filter(id__in=[bucket.id for bucket in rest]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0010_serverroomaccesslog_index_cleanup'),
+        ('sites', '0002_serverlocation_latitude_serverlocation_longitude'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='dailyaccessrollup',
+            name='unique_daily_access_rollup',
+        ),
+        migrations.AddField(
+            model_name='dailyaccessrollup',
+            name='category_key',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_category_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dailyaccessrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'location', 'category_key', 'status'), name='unique_daily_access_rollup'),
+        ),
+    ]
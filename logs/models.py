@@ -1,6 +1,8 @@
 from django.db import models
 
 # Create your models here.# logs/models.py
+from datetime import timedelta
+
 from django.db import models
 from django.utils import timezone
 from users.models import CustomUser
@@ -59,5 +61,106 @@ class ServerRoomAccessLog(models.Model):
     activity_report = models.TextField(blank=True, help_text="Summary of activities performed.")
     outcome = models.CharField(max_length=20, choices=OUTCOME_CHOICES, blank=True)
 
+    class Meta:
+        indexes = [
+            # access_history: one user's (request_timestamp, id) keyset pages, newest first
+            models.Index(fields=['user', '-request_timestamp', '-id'], name='log_user_requested_idx'),
+            # dashboard: time range filter and the (request_timestamp, id) keyset pages
+            models.Index(fields=['-request_timestamp', '-id'], name='log_requested_idx'),
+            # dashboard status filters and the manage_logs approval queue, in request order
+            models.Index(fields=['status', 'request_timestamp'], name='log_status_requested_idx'),
+            # manage_logs for a PIC: their sites' logs, by status and in request order
+            models.Index(fields=['location', 'status', 'request_timestamp'], name='log_location_status_idx'),
+        ]
+
+    def __str__(self):
+        # Only use the related names if they're already loaded; __str__ shouldn't cost two queries
+        user = self.user.username if self._meta.get_field('user').is_cached(self) else f"user {self.user_id}"
+        location = self.location.name if self._meta.get_field('location').is_cached(self) else f"site {self.location_id}"
+        return f"Request from {user} for {location} [{self.status}]"
+
+class DailyAccessRollup(models.Model):
+    """Number of access logs per request day, site, category and status.
+
+    Kept up to date by the signal handlers in logs/signals.py as logs are
+    created and move through their workflow, so dashboard statistics and
+    charts never have to scan ServerRoomAccessLog. `timed_count` and
+    `visit_duration` cover the logs with both an entry and an exit time, for
+    average visit lengths. `rebuild_access_rollups` recomputes it from
+    scratch after bulk writes that bypass signals.
+
+    `category_key` is the category's id, or 0 for uncategorized logs. Unlike
+    the nullable `category`, it lets the unique constraint cover those
+    buckets too (NULLs never clash), so there is one bucket per key.
+    """
+    day = models.DateField()
+    location = models.ForeignKey(ServerLocation, on_delete=models.CASCADE, related_name='+')
+    category = models.ForeignKey(ActivityCategory, on_delete=models.SET_NULL, null=True, related_name='+')
+    category_key = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=ServerRoomAccessLog.STATUS_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+    timed_count = models.PositiveIntegerField(default=0)
+    visit_duration = models.DurationField(default=timedelta)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'location', 'category_key', 'status'], name='unique_daily_access_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.location_id}/{self.category_id} [{self.status}]: {self.count}"
+
+
+
+class SiteOccupancy(models.Model):
+    """One row per log that is currently checked in: who is inside which room.
+
+    Rows are added and removed by the signal handlers in logs/signals.py as
+    logs move in and out of 'Checked-In', so listing a site's occupants is
+    an indexed lookup instead of a scan of its logs.
+    """
+    location = models.ForeignKey(ServerLocation, on_delete=models.CASCADE, related_name='occupants')
+    log = models.OneToOneField(ServerRoomAccessLog, on_delete=models.CASCADE, related_name='occupancy')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    checked_in_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = 'site occupancies'
+
+    def __str__(self):
+        return f"{self.user_id} in {self.location_id} since {self.checked_in_at}"
+
+
+class ArchivedAccessLog(models.Model):
+    """Completed and Denied access logs past LOG_RETENTION_DAYS, moved out of ServerRoomAccessLog.
+
+    Rows keep their original id and are written once by
+    `archive_access_logs` (logs/archive.py), so the hot table and its
+    indexes only hold recent and still-open logs. They stay counted in
+    DailyAccessRollup and are included in exports; their entry photos are
+    deleted when they are archived.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    location = models.ForeignKey(ServerLocation, on_delete=models.CASCADE, related_name='+')
+    group_members = models.TextField(blank=True)
+    request_timestamp = models.DateTimeField()
+    entry_timestamp = models.DateTimeField(null=True, blank=True)
+    exit_timestamp = models.DateTimeField(null=True, blank=True)
+    category = models.ForeignKey(ActivityCategory, on_delete=models.SET_NULL, null=True, related_name='+')
+    detailed_activities = models.JSONField(null=True, blank=True)
+    notes = models.TextField()
+    status = models.CharField(max_length=20, choices=ServerRoomAccessLog.STATUS_CHOICES)
+    approved_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    activity_report = models.TextField(blank=True)
+    outcome = models.CharField(max_length=20, choices=ServerRoomAccessLog.OUTCOME_CHOICES, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Exports read the archive oldest first, usually for a date range
+            models.Index(fields=['request_timestamp', 'id'], name='archived_log_requested_idx'),
+        ]
+
     def __str__(self):
-        return f"Request from {self.user.username} for {self.location.name} [{self.status}]"
\ No newline at end of file
+        return f"Archived request {self.id} from user {self.user_id} for site {self.location_id} [{self.status}]"
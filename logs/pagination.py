@@ -0,0 +1,66 @@
+# logs/pagination.py
+"""Keyset ("seek") pagination for access log listings.
+
+Pages are ordered on (request_timestamp, id), newest first unless asked
+otherwise, and the cursor carries the last row's key, so fetching page N
+costs the same as page 1 instead of scanning and discarding N * page_size
+rows like OFFSET does.
+"""
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(log):
+    raw = json.dumps([log.request_timestamp.isoformat(), log.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Returns the (request_timestamp, id) key a cursor points after."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, log_id = json.loads(raw)
+        timestamp = parse_datetime(timestamp)
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if timestamp is None or not isinstance(log_id, int):
+        raise InvalidCursor(cursor)
+    return timestamp, log_id
+
+
+def read_page_size(params, default=PAGE_SIZE):
+    page_size = params.get('page_size', '')
+    if not page_size.isdigit():
+        return default
+    return max(1, min(int(page_size), MAX_PAGE_SIZE))
+
+
+def paginate(logs, cursor=None, page_size=PAGE_SIZE, newest_first=True):
+    """Returns (rows, next_cursor) for the page of `logs` after `cursor`.
+
+    `next_cursor` is None on the last page. Raises InvalidCursor for a
+    cursor that was not produced by `encode_cursor`. A cursor only makes
+    sense with the `newest_first` it was produced under.
+    """
+    if newest_first:
+        logs, after = logs.order_by('-request_timestamp', '-id'), 'lt'
+    else:
+        logs, after = logs.order_by('request_timestamp', 'id'), 'gt'
+    if cursor:
+        timestamp, log_id = decode_cursor(cursor)
+        logs = logs.filter(Q(**{f'request_timestamp__{after}': timestamp}) | Q(request_timestamp=timestamp, **{f'id__{after}': log_id}))
+
+    # One extra row tells us whether another page exists without a COUNT(*)
+    rows = list(logs[:page_size + 1])
+    next_cursor = encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
@@ -0,0 +1,187 @@
+# logs/rollups.py
+"""Incremental maintenance and querying of DailyAccessRollup."""
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .filters import date_bounds, start_of_range
+from .models import ArchivedAccessLog, DailyAccessRollup, ServerRoomAccessLog
+
+# A visit is timed once it has both an entry and an exit timestamp
+TIMED = Q(entry_timestamp__isnull=False, exit_timestamp__isnull=False)
+VISIT_DURATION = ExpressionWrapper(F('exit_timestamp') - F('entry_timestamp'), output_field=DurationField())
+
+
+def rollup_day(timestamp):
+    # Days are counted in the project time zone, not the request's active one
+    return timezone.localtime(timestamp, timezone.get_default_timezone()).date()
+
+
+def rollup_key(log):
+    """Returns the (day, location_id, category_id, status) bucket a log is counted in."""
+    return (rollup_day(log.request_timestamp), log.location_id, log.category_id, log.status)
+
+
+def rollup_entry(log):
+    """Returns (bucket key, visit duration or None): everything a log adds to the rollup."""
+    duration = None
+    if log.entry_timestamp and log.exit_timestamp:
+        duration = log.exit_timestamp - log.entry_timestamp
+    return rollup_key(log), duration
+
+
+def adjust(key, delta, timed=0, duration=timedelta()):
+    """Adds `delta` logs, `timed` of them timed and lasting `duration` in total, to one rollup bucket."""
+    day, location_id, category_id, status = key
+    buckets = DailyAccessRollup.objects.filter(day=day, location_id=location_id, category_key=category_id or 0, status=status)
+    changes = {'count': F('count') + delta}
+    if timed:
+        changes.update(timed_count=F('timed_count') + timed, visit_duration=F('visit_duration') + duration)
+    if buckets.update(**changes) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            DailyAccessRollup.objects.create(day=day, location_id=location_id, category_id=category_id, category_key=category_id or 0,
+                                             status=status, count=delta, timed_count=timed, visit_duration=duration)
+    except IntegrityError:
+        # Another request created the bucket first
+        buckets.update(**changes)
+
+
+def move(old_entry, new_entry):
+    """Moves one log's `rollup_entry` to a new one, e.g. after a status change or a check-out."""
+    if old_entry == new_entry:
+        return
+    with transaction.atomic():
+        if old_entry is not None:
+            key, duration = old_entry
+            adjust(key, -1, -1 if duration is not None else 0, -(duration or timedelta()))
+        if new_entry is not None:
+            key, duration = new_entry
+            adjust(key, 1, 1 if duration is not None else 0, duration or timedelta())
+
+
+def move_many(moves):
+    """Applies a Counter of {(old_key, new_key): number_of_logs} in one transaction.
+
+    For writes that bypass the signal handlers, such as QuerySet.update(),
+    on logs without visit times (e.g. pending requests).
+    """
+    with transaction.atomic():
+        for (old_key, new_key), n in moves.items():
+            if old_key != new_key:
+                adjust(old_key, -n)
+                adjust(new_key, n)
+
+
+def uncategorize(category_id):
+    """Merges a category's buckets into the uncategorized ones, as its logs lose it when it is deleted."""
+    with transaction.atomic():
+        buckets = DailyAccessRollup.objects.filter(category_key=category_id)
+        for bucket in buckets.select_for_update():
+            adjust((bucket.day, bucket.location_id, None, bucket.status), bucket.count, bucket.timed_count, bucket.visit_duration)
+        buckets.delete()
+
+
+def rebuild(batch_size=1000):
+    """Recomputes every rollup bucket from the logs and archive tables; returns the number of buckets."""
+    totals = {}
+    for model in (ServerRoomAccessLog, ArchivedAccessLog):
+        grouped = (
+            model.objects
+            .annotate(day=TruncDate('request_timestamp', tzinfo=timezone.get_default_timezone()))
+            .values('day', 'location_id', 'category_id', 'status')
+            .annotate(count=Count('id'), timed_count=Count('id', filter=TIMED), visit_duration=Sum(VISIT_DURATION, filter=TIMED))
+            .order_by()
+        )
+        for row in grouped.iterator():
+            key = (row['day'], row['location_id'], row['category_id'], row['status'])
+            count, timed_count, visit_duration = totals.get(key, (0, 0, timedelta()))
+            totals[key] = (count + row['count'], timed_count + row['timed_count'], visit_duration + (row['visit_duration'] or timedelta()))
+    with transaction.atomic():
+        DailyAccessRollup.objects.all().delete()
+        buckets = DailyAccessRollup.objects.bulk_create(
+            (
+                DailyAccessRollup(day=day, location_id=location_id, category_id=category_id, category_key=category_id or 0,
+                                  status=status, count=count, timed_count=timed_count, visit_duration=visit_duration)
+                for (day, location_id, category_id, status), (count, timed_count, visit_duration) in totals.items()
+            ),
+            batch_size=batch_size,
+        )
+    return len(buckets)
+
+
+def _aggregate(filters, fields, totals, now=None):
+    """Sums `totals` ({name: (rollup aggregate, log aggregate)}) over the logs matching `filters`, grouped by `fields`.
+
+    Whole days come from the rollup; for a rolling time range the partial
+    first day is read from the logs themselves, which touches at most one
+    day of rows. Returns {tuple of field values: {name: total}}.
+    """
+    rollups = DailyAccessRollup.objects.all()
+    logs = None
+    start_date = start_of_range(filters['time_filter'], now)
+    if start_date:
+        first_full_day = rollup_day(start_date) + timedelta(days=1)
+        rollups = rollups.filter(day__gte=first_full_day)
+        day_start = timezone.make_aware(datetime.combine(first_full_day, time.min), timezone.get_default_timezone())
+        logs = (
+            ServerRoomAccessLog.objects.filter(request_timestamp__gte=start_date, request_timestamp__lt=day_start)
+            .annotate(day=TruncDate('request_timestamp', tzinfo=timezone.get_default_timezone()))
+        )
+
+    # Date range filters cover whole days, so the rollup answers them exactly
+    if filters['date_from']:
+        rollups = rollups.filter(day__gte=filters['date_from'])
+    if filters['date_to']:
+        rollups = rollups.filter(day__lte=filters['date_to'])
+    date_start, date_end = date_bounds(filters)
+    if logs is not None and date_start:
+        logs = logs.filter(request_timestamp__gte=date_start)
+    if logs is not None and date_end:
+        logs = logs.filter(request_timestamp__lt=date_end)
+
+    results = {}
+    for queryset, side in ((rollups, 0), (logs, 1)):
+        if queryset is None:
+            continue
+        if filters['status']:
+            queryset = queryset.filter(status=filters['status'])
+        if filters['site']:
+            queryset = queryset.filter(location_id=filters['site'])
+        aggregates = {name: pair[side] for name, pair in totals.items()}
+        for row in queryset.values(*fields).annotate(**aggregates).order_by():
+            result = results.setdefault(tuple(row[field] for field in fields), {})
+            for name in totals:
+                if row[name] is not None:
+                    result[name] = result[name] + row[name] if name in result else row[name]
+    return results
+
+
+def count_by(filters, fields, now=None):
+    """Counts the logs matching `filters` (see logs.filters) grouped by `fields`.
+
+    `fields` are lookups that exist on both models, such as 'status',
+    'location__name', 'category__name' or 'day' (the request day in the
+    project time zone). Returns a Counter keyed by tuples of field values.
+    """
+    totals = {'count': (Sum('count'), Count('id'))}
+    return +Counter({key: row['count'] for key, row in _aggregate(filters, fields, totals, now).items()})
+
+
+def visits_by(filters, fields, now=None):
+    """Like count_by, but returns {key: (visits, timed visits, total visit duration)}."""
+    totals = {
+        'count': (Sum('count'), Count('id')),
+        'timed': (Sum('timed_count'), Count('id', filter=TIMED)),
+        'duration': (Sum('visit_duration'), Sum(VISIT_DURATION, filter=TIMED)),
+    }
+    return {
+        key: (row.get('count', 0), row.get('timed', 0), row.get('duration') or timedelta())
+        for key, row in _aggregate(filters, fields, totals, now).items()
+        if row.get('count')
+    }
@@ -0,0 +1,62 @@
+# logs/signals.py
+"""Keeps DailyAccessRollup and SiteOccupancy in step with ServerRoomAccessLog (and ActivityCategory) writes.
+
+QuerySet.update(), bulk_create() and raw SQL bypass these handlers; code
+that uses them must adjust the rollup itself or run rebuild_access_rollups.
+"""
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import rollups
+from .models import ActivityCategory, ServerRoomAccessLog, SiteOccupancy
+
+
+@receiver(pre_save, sender=ServerRoomAccessLog)
+def remember_stored_row(sender, instance, raw, **kwargs):
+    instance._stored_log = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    # Read the stored row rather than trusting the instance, which may be stale
+    old = (
+        sender.objects.filter(pk=instance.pk)
+        .values('request_timestamp', 'location_id', 'category_id', 'status', 'entry_timestamp', 'exit_timestamp')
+        .first()
+    )
+    if old:
+        instance._stored_log = sender(**old)
+
+
+@receiver(post_save, sender=ServerRoomAccessLog)
+def update_rollup_on_save(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_stored_log', None)
+    rollups.move(old and rollups.rollup_entry(old), rollups.rollup_entry(instance))
+
+
+@receiver(post_save, sender=ServerRoomAccessLog)
+def update_occupancy_on_save(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_stored_log', None)
+    if old and (old.status, old.location_id) == (instance.status, instance.location_id):
+        return
+    if instance.status == 'Checked-In':
+        SiteOccupancy.objects.update_or_create(log=instance, defaults={
+            'location_id': instance.location_id,
+            'user_id': instance.user_id,
+            'checked_in_at': instance.entry_timestamp or instance.request_timestamp,
+        })
+    elif not created:
+        SiteOccupancy.objects.filter(log=instance).delete()
+
+
+@receiver(post_delete, sender=ServerRoomAccessLog)
+def update_rollup_on_delete(sender, instance, **kwargs):
+    rollups.move(rollups.rollup_entry(instance), None)
+
+
+@receiver(pre_delete, sender=ActivityCategory)
+def uncategorize_rollup_on_category_delete(sender, instance, **kwargs):
+    # The category's logs become uncategorized (SET_NULL), so its buckets join those
+    rollups.uncategorize(instance.pk)
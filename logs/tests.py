@@ -1,3 +1,495 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import itertools
+import json
+import os
+import time
+from collections import Counter
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from access_control import face_client
+from access_control.testing import QueryBudgetMixin, TempMediaRootMixin
+from sites.models import ServerLocation
+from users.models import CustomUser
+from .filters import read_filters
+from .models import ActivityCategory, ArchivedAccessLog, DailyAccessRollup, ServerRoomAccessLog
+from . import export, rollups
+from .rollups import count_by
+
+PHOTO = b'\xff\xd8\xff\xe0 not really a jpeg'
+
+
+class SlowFaceService:
+    """Stands in for the async face-service client with a fixed inference latency."""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def verify(self, user_id, files):
+        await asyncio.sleep(self.latency)
+        return httpx.Response(200, json={'verified': True}, request=httpx.Request('POST', f'http://face/verify/{user_id}'))
+
+
+class ConcurrentCheckInLoadTest(TempMediaRootMixin, TestCase):
+    """Concurrent check-ins must overlap their face-service round trips, not queue behind each other."""
+
+    LATENCY = 0.5
+    CONCURRENCY = 8
+
+    @classmethod
+    def setUpTestData(cls):
+        location = ServerLocation.objects.create(name='Data Center Gedebage', address='Jl. Gedebage')
+        cls.logs = []
+        for i in range(cls.CONCURRENCY):
+            user = CustomUser.objects.create_user(username=f'vendor{i}', password='password123', is_face_enrolled=True)
+            cls.logs.append(ServerRoomAccessLog.objects.create(user=user, location=location, notes='Maintenance', status='Approved'))
+
+    async def check_in(self, log):
+        client = AsyncClient()
+        await client.aforce_login(log.user)
+        return await client.post(reverse('process_check_in', args=[log.id]), {'photo': SimpleUploadedFile('checkin.jpg', PHOTO, content_type='image/jpeg')})
+
+    async def test_concurrent_check_ins_do_not_queue(self):
+        with mock.patch.object(face_client, 'get_async_client', return_value=SlowFaceService(self.LATENCY)):
+            started = time.perf_counter()
+            responses = await asyncio.gather(*(self.check_in(log) for log in self.logs))
+            elapsed = time.perf_counter() - started
+
+        self.assertEqual([response.status_code for response in responses], [302] * self.CONCURRENCY)
+        self.assertEqual(await ServerRoomAccessLog.objects.filter(status='Checked-In').acount(), self.CONCURRENCY)
+        # Run one after another these would take CONCURRENCY * LATENCY seconds
+        self.assertLess(elapsed, self.LATENCY * self.CONCURRENCY / 2)
+
+
+class LogListQueryBudgetTest(QueryBudgetMixin, TestCase):
+    """The log lists load their relations up front, so their query count doesn't depend on the number of rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.pic = CustomUser.objects.create_user(username='pic', password='password123', is_staff=True)
+        cls.vendors = [CustomUser.objects.create_user(username=f'vendor{i}', password='password123') for i in range(3)]
+        cls.sites = [ServerLocation.objects.create(name=f'Site {i}', address='Jl. Gedebage', pic=cls.pic) for i in range(2)]
+        cls.category = ActivityCategory.objects.create(name='Maintenance')
+
+    def seed(self, users):
+        statuses = itertools.cycle(['Pending', 'Approved', 'Completed', 'Denied'])
+        now = timezone.now()
+
+        def create(count):
+            ServerRoomAccessLog.objects.bulk_create([
+                ServerRoomAccessLog(user=users[i % len(users)], location=self.sites[i % len(self.sites)], category=self.category,
+                                    notes='Maintenance', status=next(statuses), request_timestamp=now - timedelta(minutes=i))
+                for i in range(count)
+            ], batch_size=1000)
+        return create
+
+    def test_manage_logs(self):
+        self.client.force_login(self.pic)
+        self.assertQueryBudget(reverse('manage_logs'), 5, self.seed(self.vendors))
+
+    def test_access_history(self):
+        self.client.force_login(self.vendors[0])
+        self.assertQueryBudget(reverse('access_history'), 4, self.seed(self.vendors[:1]))
+
+    def test_manage_log_rows(self):
+        self.client.force_login(self.pic)
+        self.assertQueryBudget(reverse('manage_log_rows') + '?list=pending', 3, self.seed(self.vendors))
+        self.assertQueryBudget(reverse('manage_log_rows') + '?list=history', 3, self.seed(self.vendors))
+
+    def test_access_history_rows(self):
+        self.client.force_login(self.vendors[0])
+        self.assertQueryBudget(reverse('access_history_rows'), 3, self.seed(self.vendors[:1]))
+
+
+class LogPaginationTest(TestCase):
+    """The fragment endpoints walk a listing page by page without skipping or repeating rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.pic = CustomUser.objects.create_user(username='pic', password='password123', is_staff=True)
+        cls.vendor = CustomUser.objects.create_user(username='vendor', password='password123')
+        cls.site = ServerLocation.objects.create(name='Data Center Gedebage', address='Jl. Gedebage', pic=cls.pic)
+        now = timezone.now().replace(hour=12)
+        # Pairs of logs share a timestamp, so pages have to break ties on id
+        cls.logs = ServerRoomAccessLog.objects.bulk_create([
+            ServerRoomAccessLog(user=cls.vendor, location=cls.site, notes='Maintenance', status='Pending',
+                                request_timestamp=now - timedelta(days=i // 2))
+            for i in range(9)
+        ])
+
+    def walk(self, url, **params):
+        ids, cursor = [], ''
+        while True:
+            response = self.client.get(url, {**params, 'page_size': 2, 'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            ids += [log.id for log in response.context['log_rows']]
+            cursor = response['X-Next-Cursor']
+            if not cursor:
+                return ids
+
+    def test_history_is_newest_first(self):
+        self.client.force_login(self.vendor)
+        expected = [log.id for log in sorted(self.logs, key=lambda log: (log.request_timestamp, log.id), reverse=True)]
+        self.assertEqual(self.walk(reverse('access_history_rows')), expected)
+
+    def test_pending_queue_is_oldest_first(self):
+        self.client.force_login(self.pic)
+        expected = [log.id for log in sorted(self.logs, key=lambda log: (log.request_timestamp, log.id))]
+        self.assertEqual(self.walk(reverse('manage_log_rows'), list='pending'), expected)
+
+    def test_date_filters(self):
+        self.client.force_login(self.vendor)
+        day = timezone.localdate(self.logs[2].request_timestamp).isoformat()
+        ids = self.walk(reverse('access_history_rows'), date_from=day, date_to=day)
+        self.assertEqual(sorted(ids), [self.logs[2].id, self.logs[3].id])
+
+    def test_invalid_cursor(self):
+        self.client.force_login(self.vendor)
+        self.assertEqual(self.client.get(reverse('access_history_rows'), {'cursor': 'nonsense'}).status_code, 400)
+
+
+class RequestReviewTest(TestCase):
+    """Approving and denying only ever changes requests that are still pending and in the reviewer's sites."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.pic = CustomUser.objects.create_user(username='pic', password='password123', is_staff=True)
+        cls.other_pic = CustomUser.objects.create_user(username='other-pic', password='password123', is_staff=True)
+        cls.vendor = CustomUser.objects.create_user(username='vendor', password='password123', first_name='Budi', last_name='Santoso')
+        cls.site = ServerLocation.objects.create(name='Data Center Gedebage', address='Jl. Gedebage', pic=cls.pic)
+        cls.other_site = ServerLocation.objects.create(name='Server Room Pasteur', address='Jl. Pasteur', pic=cls.other_pic)
+
+    def setUp(self):
+        self.client.force_login(self.pic)
+
+    def request_log(self, site=None, status='Pending'):
+        return ServerRoomAccessLog.objects.create(user=self.vendor, location=site or self.site, notes='Maintenance', status=status)
+
+    def assertReviewed(self, log, status, approved_by=None):
+        log.refresh_from_db()
+        self.assertEqual(log.status, status)
+        self.assertEqual(log.approved_by, approved_by)
+
+    def post_messages(self, url, data=None):
+        response = self.client.post(url, data or {}, follow=True)
+        return [str(message) for message in response.context['messages']]
+
+    def test_single_review(self):
+        approved, denied = self.request_log(), self.request_log()
+
+        self.assertEqual(self.post_messages(reverse('approve_request', args=[approved.id])), ["Request for Budi Santoso has been approved."])
+        self.assertEqual(self.post_messages(reverse('deny_request', args=[denied.id])), ["Request for Budi Santoso has been denied."])
+        self.assertReviewed(approved, 'Approved', self.pic)
+        self.assertReviewed(denied, 'Denied', self.pic)
+        self.assertEqual(count_by(read_filters({}), ['status']), Counter({('Approved',): 1, ('Denied',): 1}))
+
+    def test_single_review_requires_post(self):
+        log = self.request_log()
+        self.assertEqual(self.client.get(reverse('approve_request', args=[log.id])).status_code, 405)
+        self.assertEqual(self.client.get(reverse('deny_request', args=[log.id])).status_code, 405)
+        self.assertReviewed(log, 'Pending')
+
+    def test_single_review_leaves_reviewed_requests_alone(self):
+        for status in ('Approved', 'Checked-In', 'Completed', 'Denied'):
+            log = self.request_log(status=status)
+            self.assertEqual(self.post_messages(reverse('deny_request' if status == 'Approved' else 'approve_request', args=[log.id])),
+                             ["Request for Budi Santoso is no longer pending and was left unchanged."])
+            self.assertReviewed(log, status)
+
+    def test_single_review_of_another_pics_site(self):
+        log = self.request_log(self.other_site)
+        self.assertEqual(self.client.post(reverse('approve_request', args=[log.id])).status_code, 403)
+        self.assertReviewed(log, 'Pending')
+
+    def test_second_reviewer_of_a_stale_page_is_skipped(self):
+        log = self.request_log()
+        admin = CustomUser.objects.create_superuser(username='admin', password='password123')
+        # Both reviewers loaded the queue while the request was pending
+        self.post_messages(reverse('approve_request', args=[log.id]))
+        self.client.force_login(admin)
+        self.assertEqual(self.post_messages(reverse('deny_request', args=[log.id])),
+                         ["Request for Budi Santoso is no longer pending and was left unchanged."])
+        self.post_messages(reverse('bulk_review_requests'), {'action': 'deny', 'log_ids': [log.id]})
+
+        self.assertReviewed(log, 'Approved', self.pic)
+        self.assertEqual(count_by(read_filters({}), ['status']), Counter({('Approved',): 1}))
+
+    def test_bulk_review(self):
+        pending = [self.request_log() for _ in range(3)]
+        reviewed = self.request_log(status='Denied')
+        elsewhere = self.request_log(self.other_site)
+
+        log_ids = [log.id for log in pending + [reviewed, elsewhere]] + ['not-an-id']
+        self.assertEqual(self.post_messages(reverse('bulk_review_requests'), {'action': 'approve', 'log_ids': log_ids}), [
+            "Approved 3 request(s): Budi Santoso, Budi Santoso, Budi Santoso.",
+            "2 selected request(s) were no longer pending or are not yours to review, and were left unchanged.",
+        ])
+        for log in pending:
+            self.assertReviewed(log, 'Approved', self.pic)
+        self.assertReviewed(reviewed, 'Denied')
+        self.assertReviewed(elsewhere, 'Pending')
+
+    def test_bulk_review_needs_an_action_and_requests(self):
+        log = self.request_log()
+        self.assertEqual(self.post_messages(reverse('bulk_review_requests'), {'action': 'delete', 'log_ids': [log.id]}),
+                         ["Select at least one request and an action."])
+        self.assertEqual(self.post_messages(reverse('bulk_review_requests'), {'action': 'approve'}),
+                         ["Select at least one request and an action."])
+        self.assertEqual(self.client.get(reverse('bulk_review_requests')).status_code, 405)
+        self.assertReviewed(log, 'Pending')
+
+
+class LogExportTest(TestCase):
+    """Exports stream every matching log in a fixed number of queries per chunk."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.pic = CustomUser.objects.create_user(username='pic', password='password123', is_staff=True)
+        cls.vendor = CustomUser.objects.create_user(username='vendor', password='password123', first_name='Budi', last_name='Santoso')
+        cls.site = ServerLocation.objects.create(name='Data Center Gedebage', address='Jl. Gedebage', pic=cls.pic)
+        cls.other_site = ServerLocation.objects.create(name='Server Room Pasteur', address='Jl. Pasteur')
+        category = ActivityCategory.objects.create(name='Maintenance')
+        now = timezone.now()
+        ServerRoomAccessLog.objects.bulk_create([
+            ServerRoomAccessLog(user=cls.vendor, location=cls.site if i % 5 else cls.other_site, category=category,
+                                notes='Maintenance, "quarterly"', group_members='Sari\nWulan', detailed_activities=['Inventarisasi'],
+                                status='Completed', request_timestamp=now - timedelta(hours=i))
+            for i in range(25)
+        ])
+
+    def export(self, **params):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('export_logs'), params)
+            body = b''.join(response.streaming_content).decode()
+        return response, body, len(captured)
+
+    def test_csv_streams_in_chunks(self):
+        self.client.force_login(self.pic)
+        with override_settings(LOG_EXPORT_CHUNK_SIZE=7):
+            response, body, queries = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(body)))
+        # A PIC gets their own sites' logs, oldest first
+        self.assertEqual(len(rows), 20)
+        self.assertEqual(rows, sorted(rows, key=lambda row: row['request_timestamp']))
+        self.assertEqual(rows[0]['user_full_name'], 'Budi Santoso')
+        self.assertEqual(rows[0]['group_members'], 'Sari\nWulan')
+        self.assertEqual(json.loads(rows[0]['detailed_activities']), ['Inventarisasi'])
+        # Session, user, then one query per table: SQLite reads the chunks from a single cursor
+        self.assertEqual(queries, 4)
+
+    async def test_asgi_export_is_read_as_it_is_sent(self):
+        read, stream = [], export.stream
+
+        def spy(*args):
+            for piece in stream(*args):
+                read.append(piece)
+                yield piece
+
+        client = AsyncClient()
+        await client.aforce_login(self.pic)
+        with override_settings(LOG_EXPORT_CHUNK_SIZE=7), mock.patch.object(export, 'stream', spy):
+            response = await client.get(reverse('export_logs'))
+            self.assertTrue(response.is_async)
+            pieces = aiter(response.streaming_content)
+            first = await anext(pieces)
+            # The header and the first 6 rows; the rest of the export hasn't been read yet
+            self.assertEqual(len(read), 1)
+            body = first + b''.join([piece async for piece in pieces])
+        self.assertEqual(len(read), 3)
+        self.assertEqual(len(list(csv.DictReader(io.StringIO(body.decode())))), 20)
+
+    def test_ndjson_with_filters(self):
+        self.client.force_login(self.pic)
+        response, body, _ = self.export(format='ndjson', time_filter='day', site=self.site.id)
+        records = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual({record['location'] for record in records}, {'Data Center Gedebage'})
+        self.assertEqual(len(records), 19)
+
+    def test_staff_only(self):
+        self.client.force_login(self.vendor)
+        self.assertEqual(self.client.get(reverse('export_logs')).status_code, 403)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('export_access_logs', format='ndjson', status='Completed', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 25)
+
+
+class ArchiveTest(TempMediaRootMixin, TestCase):
+    """Archiving moves old finished logs out of the hot table without changing any count or export."""
+
+    def setUp(self):
+        vendor = CustomUser.objects.create_user(username='vendor', password='password123')
+        site = ServerLocation.objects.create(name='Data Center Gedebage', address='Jl. Gedebage')
+        old = timezone.now() - timedelta(days=400)
+
+        def log(status, requested, photo=None):
+            entry = ServerRoomAccessLog(user=vendor, location=site, notes='Maintenance', status=status, request_timestamp=requested)
+            if photo:
+                entry.entry_photo = SimpleUploadedFile(photo, PHOTO, content_type='image/jpeg')
+            entry.save()
+            return entry
+
+        self.old_completed = [log('Completed', old + timedelta(hours=i), photo=f'old{i}.jpg') for i in range(3)]
+        self.old_denied = log('Denied', old)
+        self.old_checked_in = log('Checked-In', old, photo='inside.jpg')
+        self.recent = log('Completed', timezone.now())
+
+    def archive(self, **options):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('archive_access_logs', stdout=io.StringIO(), **options)
+
+    def test_moves_old_finished_logs(self):
+        counts = count_by(read_filters({}), ['status'])
+        export = io.StringIO()
+        call_command('export_access_logs', format='ndjson', stdout=export)
+
+        self.archive(batch_size=2)
+
+        archived = [*self.old_completed, self.old_denied]
+        self.assertEqual(set(ArchivedAccessLog.objects.values_list('id', flat=True)), {entry.id for entry in archived})
+        self.assertEqual(set(ServerRoomAccessLog.objects.values_list('id', flat=True)), {self.old_checked_in.id, self.recent.id})
+        # Archived logs stay counted and exported, in the same order
+        self.assertEqual(count_by(read_filters({}), ['status']), counts)
+        after = io.StringIO()
+        call_command('export_access_logs', format='ndjson', stdout=after)
+        self.assertEqual(after.getvalue(), export.getvalue())
+        # Photos go with their logs; a checked-in visitor's stays
+        self.assertFalse(any(default_storage.exists(entry.entry_photo.name) for entry in self.old_completed))
+        self.assertTrue(default_storage.exists(self.old_checked_in.entry_photo.name))
+
+    def test_sweeps_unreferenced_photos(self):
+        stray = default_storage.save('access_photos/check_in/stray.jpg', io.BytesIO(PHOTO))
+        new_stray = default_storage.save('access_photos/check_in/new_stray.jpg', io.BytesIO(PHOTO))
+        long_ago = (timezone.now() - timedelta(days=400)).timestamp()
+        for name in (stray, self.old_checked_in.entry_photo.name):
+            os.utime(default_storage.path(name), (long_ago, long_ago))
+
+        self.archive(sweep_photos=True)
+
+        self.assertFalse(default_storage.exists(stray))
+        self.assertTrue(default_storage.exists(new_stray))
+        self.assertTrue(default_storage.exists(self.old_checked_in.entry_photo.name))
+
+    def test_retention_must_outlast_dashboard_ranges(self):
+        with self.assertRaises(CommandError):
+            self.archive(days=30)
+
+
+class RollupMaintenanceTest(TestCase):
+    """The signal handlers and the bulk review keep DailyAccessRollup equal to counting the logs."""
+
+    def setUp(self):
+        self.pic = CustomUser.objects.create_user(username='pic', password='password123', is_staff=True, is_superuser=True)
+        self.vendor = CustomUser.objects.create_user(username='vendor', password='password123')
+        self.sites = [ServerLocation.objects.create(name=f'Site {i}', address='Jl. Gedebage') for i in range(2)]
+        self.categories = [ActivityCategory.objects.create(name=name) for name in ('Maintenance', 'Audit')]
+        now = timezone.now()
+        self.logs = [
+            ServerRoomAccessLog.objects.create(user=self.vendor, location=self.sites[i % 2], category=self.categories[i % 2],
+                                               notes='Maintenance', status='Pending', request_timestamp=now - timedelta(days=i))
+            for i in range(6)
+        ]
+
+    def assertRollupMatchesLogs(self):
+        expected = {}
+        for log in ServerRoomAccessLog.objects.all():
+            key, duration = rollups.rollup_entry(log)
+            count, timed, total = expected.get(key, (0, 0, timedelta()))
+            expected[key] = (count + 1, timed + (duration is not None), total + (duration or timedelta()))
+        stored = {
+            (row.day, row.location_id, row.category_id, row.status): (row.count, row.timed_count, row.visit_duration)
+            for row in DailyAccessRollup.objects.all()
+        }
+        self.assertEqual({key: value for key, value in stored.items() if value != (0, 0, timedelta())}, expected)
+
+    def test_create(self):
+        self.assertRollupMatchesLogs()
+        self.assertEqual(sum(DailyAccessRollup.objects.values_list('count', flat=True)), 6)
+
+    def test_status_and_bucket_changes(self):
+        log = self.logs[0]
+        for status in ('Approved', 'Checked-In', 'Completed'):
+            log.status = status
+            if status == 'Checked-In':
+                log.entry_timestamp = timezone.now()
+            if status == 'Completed':
+                log.exit_timestamp = log.entry_timestamp + timedelta(minutes=45)
+            log.save()
+            self.assertRollupMatchesLogs()
+        self.assertEqual(DailyAccessRollup.objects.get(status='Completed').visit_duration, timedelta(minutes=45))
+
+        log.exit_timestamp += timedelta(minutes=15)
+        log.save()
+        self.assertRollupMatchesLogs()
+
+        log.location = self.sites[1]
+        log.category = None
+        log.request_timestamp -= timedelta(days=10)
+        log.save()
+        self.assertRollupMatchesLogs()
+
+    def test_stale_instance_is_moved_from_its_stored_bucket(self):
+        stale = ServerRoomAccessLog.objects.get(pk=self.logs[0].pk)
+        self.logs[0].status = 'Approved'
+        self.logs[0].save()
+        stale.status = 'Denied'
+        stale.save()
+        self.assertRollupMatchesLogs()
+
+    def test_delete(self):
+        self.logs[0].delete()
+        self.assertRollupMatchesLogs()
+        ServerRoomAccessLog.objects.filter(location=self.sites[1]).delete()
+        self.assertRollupMatchesLogs()
+        self.assertEqual(sum(DailyAccessRollup.objects.values_list('count', flat=True)), 2)
+
+    def test_deleted_categories_join_the_uncategorized_buckets(self):
+        today = self.logs[0].request_timestamp
+        for category in self.categories:
+            ServerRoomAccessLog.objects.create(user=self.vendor, location=self.sites[0], category=category,
+                                               notes='Maintenance', status='Pending', request_timestamp=today)
+        ActivityCategory.objects.all().delete()
+        ServerRoomAccessLog.objects.create(user=self.vendor, location=self.sites[0], notes='Maintenance',
+                                           status='Pending', request_timestamp=today)
+        self.assertRollupMatchesLogs()
+        self.assertEqual(sum(DailyAccessRollup.objects.values_list('count', flat=True)), ServerRoomAccessLog.objects.count())
+        self.assertEqual(DailyAccessRollup.objects.filter(category__isnull=True, location=self.sites[0], day=rollups.rollup_day(today)).count(), 1)
+
+    def test_one_uncategorized_bucket_per_key(self):
+        bucket = DailyAccessRollup.objects.first()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            for _ in range(2):
+                DailyAccessRollup.objects.create(day=bucket.day, location_id=bucket.location_id, status='Denied', count=1)
+
+    def test_bulk_review(self):
+        self.client.force_login(self.pic)
+        self.client.post(reverse('bulk_review_requests'), {'action': 'approve', 'log_ids': [log.id for log in self.logs[:4]]})
+        self.assertRollupMatchesLogs()
+        # Already reviewed requests are skipped, so reviewing them again changes nothing
+        self.client.post(reverse('bulk_review_requests'), {'action': 'deny', 'log_ids': [log.id for log in self.logs]})
+        self.assertRollupMatchesLogs()
+        self.assertEqual(count_by(read_filters({}), ['status']), Counter({('Approved',): 4, ('Denied',): 2}))
+
+    def test_rebuild_agrees(self):
+        self.logs[0].status = 'Approved'
+        self.logs[0].save()
+        self.logs[1].delete()
+        maintained = set(DailyAccessRollup.objects.filter(count__gt=0).values_list('day', 'location_id', 'category_id', 'status', 'count'))
+
+        rollups.rebuild()
+        self.assertEqual(set(DailyAccessRollup.objects.values_list('day', 'location_id', 'category_id', 'status', 'count')), maintained)
@@ -5,10 +5,14 @@ from . import views
 urlpatterns = [
     path("request/", views.request_access, name="request_access"),
     path("history/", views.access_history, name="access_history"),
+    path("history/rows/", views.access_history_rows, name="access_history_rows"),
     
     path("manage/", views.manage_logs, name="manage_logs"), # Change this line
+    path("manage/rows/", views.manage_log_rows, name="manage_log_rows"),
+    path("export/", views.export_logs, name="export_logs"),
     path("approve/<int:log_id>/", views.approve_request, name="approve_request"),
     path("deny/<int:log_id>/", views.deny_request, name="deny_request"),
+    path("review/", views.bulk_review_requests, name="bulk_review_requests"),
     
     path("check-in/<int:log_id>/", views.process_check_in, name="process_check_in"),
     path("check-out/<int:log_id>/", views.process_check_out, name="process_check_out"), # <-- ADD THIS LINE
@@ -1,17 +1,33 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
+from asgiref.sync import sync_to_async
+from collections import Counter
 import json
 from django.contrib import messages
-from .models import ServerRoomAccessLog
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from .models import ArchivedAccessLog, ServerRoomAccessLog
 from .forms import AccessRequestForm, CheckInVerificationForm
-import requests
-from django.conf import settings
-import base64
-from django.core.files.base import ContentFile
+from .filters import apply_filters, read_filters
+from .pagination import InvalidCursor, paginate, read_page_size
+from . import export, rollups
+from sites.models import ServerLocation
+from access_control import face_client
+from access_control.shortcuts import arender
+from dashboard.cache import bump_version
+from django.db import transaction
 from django.utils import timezone
 from django.core.exceptions import PermissionDenied
 from .forms import AccessRequestForm, CheckInVerificationForm, CheckOutForm
 
+
+@sync_to_async
+def _save_check_in(log):
+    # The status change and the site's occupancy row (logs/signals.py) commit together
+    with transaction.atomic():
+        log.save()
+
 # --- REQUEST AND APPROVAL VIEWS ---
 
 @login_required
@@ -40,112 +56,247 @@ def manage_logs(request):
     if not request.user.is_staff:
         raise PermissionDenied
 
-    # Base queryset for all logs
-    log_history = ServerRoomAccessLog.objects.select_related('user', 'location', 'approved_by').all()
-    
-    if request.user.is_superuser:
-        # Superusers see everything
-        pending_requests = ServerRoomAccessLog.objects.filter(status='Pending').order_by('request_timestamp')
-    else:
-        # PICs see logs related to their sites
-        pending_requests = ServerRoomAccessLog.objects.filter(
-            status='Pending',
-            location__pic=request.user
-        ).order_by('request_timestamp')
-        log_history = log_history.filter(location__pic=request.user)
-    
+    filters = read_filters(request.GET)
+    pending_requests, log_history = _reviewable_logs(request, filters)
+    page_size = read_page_size(request.GET)
+    pending_rows, pending_cursor = paginate(pending_requests, page_size=page_size, newest_first=False)
+    history_rows, history_cursor = paginate(log_history, page_size=page_size)
+
+    sites = ServerLocation.objects.all()
+    if not request.user.is_superuser:
+        sites = sites.filter(pic=request.user)
     context = {
-        'pending_requests': pending_requests,
-        'log_history': log_history.order_by('-request_timestamp'),
+        'pending_rows': pending_rows,
+        'pending_cursor': pending_cursor,
+        'history_rows': history_rows,
+        'history_cursor': history_cursor,
+        'all_sites': sites.only('id', 'name').order_by('name'),
+        'filters': filters,
     }
     return render(request, 'logs/manage_logs.html', context)
+
+@login_required
+def manage_log_rows(request):
+    """The next page of manage_logs' pending queue (?list=pending) or log history (?list=history), as HTML rows."""
+    if not request.user.is_staff:
+        raise PermissionDenied
+
+    pending_requests, log_history = _reviewable_logs(request, read_filters(request.GET))
+    if request.GET.get('list') == 'pending':
+        return _rows_response(request, 'logs/_pending_rows.html', pending_requests, newest_first=False)
+    if request.GET.get('list') == 'history':
+        return _rows_response(request, 'logs/_manage_history_rows.html', log_history)
+    return HttpResponseBadRequest("Unknown list.")
+
+@login_required
+def export_logs(request):
+    """Streams the log history manage_logs shows plus its archived logs, narrowed by the dashboard filters, as ?format=csv or ndjson."""
+    if not request.user.is_staff:
+        raise PermissionDenied
+
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in export.FORMATS:
+        return HttpResponseBadRequest("Unknown format.")
+    filters = read_filters(request.GET)
+    _, log_history = _reviewable_logs(request, filters)
+    archived = apply_filters(ArchivedAccessLog.objects.all(), filters)
+    if not request.user.is_superuser:
+        archived = archived.filter(location__pic=request.user)
+    _, content_type, extension = export.FORMATS[export_format]
+    # Under ASGI a sync iterator would be read to the end before the first byte is sent
+    stream = export.astream if isinstance(request, ASGIRequest) else export.stream
+    response = StreamingHttpResponse(stream([log_history, archived], export_format), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="access-logs-{timezone.localdate():%Y%m%d}.{extension}"'
+    return response
+
+def _reviewable_logs(request, filters):
+    """Returns the (pending requests, log history) querysets a staff member sees, narrowed to `filters`."""
+    pending_requests = ServerRoomAccessLog.objects.filter(status='Pending')
+    log_history = ServerRoomAccessLog.objects.all()
+    if not request.user.is_superuser:
+        # PICs see logs related to their sites
+        pending_requests = pending_requests.filter(location__pic=request.user)
+        log_history = log_history.filter(location__pic=request.user)
+    # The status filter only applies to the history; the queue is pending by definition
+    pending_requests = apply_filters(pending_requests, {**filters, 'status': ''})
+    log_history = apply_filters(log_history, filters)
+    return pending_requests.select_related('user', 'location'), log_history.select_related('user', 'location')
+
+def _rows_response(request, template, logs, newest_first=True):
+    """Renders the page of `logs` after ?cursor= as table rows, with the next cursor in the X-Next-Cursor header."""
+    try:
+        log_rows, next_cursor = paginate(logs, cursor=request.GET.get('cursor'),
+                                         page_size=read_page_size(request.GET), newest_first=newest_first)
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor.")
+    response = render(request, template, {'log_rows': log_rows})
+    response['X-Next-Cursor'] = next_cursor or ''
+    return response
 # logs/views.py
 
 @login_required
+@require_POST
 def approve_request(request, log_id):
-    log = get_object_or_404(ServerRoomAccessLog, id=log_id)
-    if not (request.user.is_superuser or log.location.pic == request.user):
+    return _review_request(request, log_id, 'Approved')
+
+@login_required
+@require_POST
+def deny_request(request, log_id):
+    return _review_request(request, log_id, 'Denied')
+
+def _review_request(request, log_id, new_status):
+    log = get_object_or_404(ServerRoomAccessLog.objects.select_related('location', 'user'), id=log_id)
+    if not (request.user.is_superuser or log.location.pic_id == request.user.id):
         raise PermissionDenied
 
-    log.status = 'Approved'
-    log.approved_by = request.user
-    log.save()
-    messages.success(request, f"Request for {log.user.get_full_name()} has been approved.")
-    return redirect('manage_logs') # <-- FIX THIS LINE
+    if not _review(request, [log.id], new_status):
+        messages.warning(request, f"Request for {log.user.get_full_name()} is no longer pending and was left unchanged.")
+    elif new_status == 'Approved':
+        messages.success(request, f"Request for {log.user.get_full_name()} has been approved.")
+    else:
+        messages.warning(request, f"Request for {log.user.get_full_name()} has been denied.")
+    return redirect('manage_logs')
+
+BULK_ACTIONS = {'approve': 'Approved', 'deny': 'Denied'}
 
 @login_required
-def deny_request(request, log_id):
-    log = get_object_or_404(ServerRoomAccessLog, id=log_id)
-    if not (request.user.is_superuser or log.location.pic == request.user):
+@require_POST
+def bulk_review_requests(request):
+    """Approves or denies the selected pending requests with a single conditional UPDATE.
+
+    Only requests that are still pending and, for PICs, belong to their sites
+    are changed; anything another approver got to first is reported as skipped.
+    """
+    if not request.user.is_staff:
         raise PermissionDenied
 
-    log.status = 'Denied'
-    log.approved_by = request.user
-    log.save()
-    messages.warning(request, f"Request for {log.user.get_full_name()} has been denied.")
-    return redirect('manage_logs') # <-- FIX THIS LINE
+    new_status = BULK_ACTIONS.get(request.POST.get('action'))
+    log_ids = {int(log_id) for log_id in request.POST.getlist('log_ids') if log_id.isdigit()}
+    if new_status is None or not log_ids:
+        messages.error(request, "Select at least one request and an action.")
+        return redirect('manage_logs')
+
+    changed = _review(request, log_ids, new_status)
+    if changed:
+        names = ", ".join(f"{row['user__first_name']} {row['user__last_name']}".strip() for row in changed)
+        messages.success(request, f"{new_status} {len(changed)} request(s): {names}.")
+    skipped = len(log_ids) - len(changed)
+    if skipped:
+        messages.warning(request, f"{skipped} selected request(s) were no longer pending or are not yours to review, and were left unchanged.")
+    return redirect('manage_logs')
+
+def _review(request, log_ids, new_status):
+    """Sets the requests among `log_ids` that are still pending and the user may review to `new_status`.
+
+    Returns the rows that changed. A request another approver got to first
+    is left alone, however stale the page it was reviewed from.
+    """
+    pending = ServerRoomAccessLog.objects.filter(id__in=log_ids, status='Pending')
+    if not request.user.is_superuser:
+        pending = pending.filter(location__pic=request.user)
+
+    with transaction.atomic():
+        # Lock the rows first so a concurrent approver waits and then finds them no longer pending
+        changed = list(
+            pending.select_for_update(of=('self',))
+            .values('id', 'request_timestamp', 'location_id', 'category_id', 'status', 'user__first_name', 'user__last_name')
+        )
+        ServerRoomAccessLog.objects.filter(id__in=[row['id'] for row in changed], status='Pending').update(
+            status=new_status, approved_by=request.user
+        )
+
+        # update() skips the signal handlers, so keep the rollup and dashboard cache current here
+        moves = Counter()
+        for row in changed:
+            old_key = rollups.rollup_key(ServerRoomAccessLog(**{field: row[field] for field in ('request_timestamp', 'location_id', 'category_id', 'status')}))
+            moves[old_key, old_key[:3] + (new_status,)] += 1
+        rollups.move_many(moves)
+        transaction.on_commit(bump_version)
+    return changed
 
 # --- USER WORKFLOW VIEWS ---
 
 @login_required
 def access_history(request):
-    logs = ServerRoomAccessLog.objects.filter(user=request.user).order_by('-request_timestamp')
-    return render(request, 'logs/history.html', {'logs': logs})
+    filters = read_filters(request.GET)
+    log_rows, next_cursor = paginate(_own_logs(request, filters), page_size=read_page_size(request.GET))
+    context = {
+        'log_rows': log_rows,
+        'next_cursor': next_cursor,
+        'all_sites': ServerLocation.objects.only('id', 'name').order_by('name'),
+        'filters': filters,
+    }
+    return render(request, 'logs/history.html', context)
+
+@login_required
+def access_history_rows(request):
+    """The next page of access_history, as HTML rows."""
+    return _rows_response(request, 'logs/_history_rows.html', _own_logs(request, read_filters(request.GET)))
+
+def _own_logs(request, filters):
+    return apply_filters(ServerRoomAccessLog.objects.filter(user=request.user), filters).select_related('location')
 
 @login_required
-def process_check_in(request, log_id):
-    log = get_object_or_404(ServerRoomAccessLog, id=log_id, user=request.user, status='Approved')
+async def process_check_in(request, log_id):
+    # Async so the worker is free while the face service runs inference;
+    # ORM access and template rendering go through their async/sync_to_async forms.
+    user = await request.auser()
+    log = await aget_object_or_404(
+        ServerRoomAccessLog.objects.select_related('location', 'category'),
+        id=log_id, user=user, status='Approved'
+    )
     
     if request.method == 'POST':
-        form = CheckInVerificationForm(request.POST)
+        form = CheckInVerificationForm(request.POST, request.FILES)
         if form.is_valid():
-            photo_data = form.cleaned_data.get('photo_data')
+            photo = form.cleaned_data.get('photo')
 
-            if not photo_data:
+            if not photo:
                 messages.error(request, "Photo is missing. Please capture a photo.")
-                return render(request, 'logs/process_check_in.html', {'form': form, 'log': log})
+                return await arender(request, 'logs/process_check_in.html', {'form': form, 'log': log})
 
             # --- Face Verification Logic ---
             verified = False
             try:
-                # Decode the Base64 image from the form
-                format, imgstr = photo_data.split(';base64,')
-                ext = format.split('/')[-1]
-                photo_file = ContentFile(base64.b64decode(imgstr), name=f'checkin_{request.user.id}.{ext}')
+                # Pass the uploaded bytes straight through to the face service
+                content_type = photo.content_type or 'image/jpeg'
+                photo.name = f"checkin_{user.id}.{content_type.split('/')[-1]}"
                 
-                # Send the photo to the face recognition service
-                files = {'file': (photo_file.name, photo_file.read(), f'image/{ext}')}
-                response = requests.post(f"{settings.FACE_SERVICE_URL}/recognize", files=files)
+                # Verify the photo against this user's enrolled templates only (1:1)
+                files = {'file': (photo.name, photo.read(), content_type)}
+                response = await face_client.get_async_client().verify(user.id, files)
+                if response.status_code == 404:
+                    messages.error(request, "Verification Failed: No enrolled face profile was found for your account.")
+                    return await arender(request, 'logs/process_check_in.html', {'form': form, 'log': log})
                 response.raise_for_status()
                 data = response.json()
                 
-                # Check if the current user's ID is in the list of recognized faces
-                if str(request.user.id) in data.get('recognized_ids', []):
+                if data.get('verified'):
                     verified = True
                 else:
                     # If the face is not a match, show an error and stop.
                     messages.error(request, "Verification Failed: Your face does not match the enrolled profile.")
-                    return render(request, 'logs/process_check_in.html', {'form': form, 'log': log})
+                    return await arender(request, 'logs/process_check_in.html', {'form': form, 'log': log})
 
-            except requests.exceptions.RequestException:
+            except face_client.FACE_SERVICE_ERRORS:
                 messages.error(request, "Could not connect to the verification service.")
-                return render(request, 'logs/process_check_in.html', {'form': form, 'log': log})
+                return await arender(request, 'logs/process_check_in.html', {'form': form, 'log': log})
             except Exception:
                 messages.error(request, "An error occurred while processing the verification photo.")
-                return render(request, 'logs/process_check_in.html', {'form': form, 'log': log})
+                return await arender(request, 'logs/process_check_in.html', {'form': form, 'log': log})
             
             # --- If verification is successful, complete the check-in ---
             if verified:
                 log.status = 'Checked-In'
                 log.entry_timestamp = timezone.now()
-                log.entry_photo = photo_file # Save the verification photo
-                log.save()
+                log.entry_photo = photo # Save the verification photo
+                await _save_check_in(log)
                 messages.success(request, "Verification successful. You are now checked in.")
                 return redirect('access_history')
     else:
         form = CheckInVerificationForm()
 
-    return render(request, 'logs/process_check_in.html', {'form': form, 'log': log})
+    return await arender(request, 'logs/process_check_in.html', {'form': form, 'log': log})
 
 @login_required
 def process_check_out(request, log_id):
@@ -158,7 +309,9 @@ def process_check_out(request, log_id):
             checkout_log = form.save(commit=False)
             checkout_log.status = 'Completed'
             checkout_log.exit_timestamp = timezone.now()
-            checkout_log.save()
+            # Frees the site's occupancy row in the same transaction
+            with transaction.atomic():
+                checkout_log.save()
             messages.success(request, "You have been successfully checked out.")
             return redirect('access_history')
     else:
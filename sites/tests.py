@@ -1,3 +1,127 @@
-from django.test import TestCase
+import itertools
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from asgiref.sync import sync_to_async
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncClient, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from access_control import face_client
+from access_control.testing import QueryBudgetMixin, TempMediaRootMixin
+from logs.models import ServerRoomAccessLog, SiteOccupancy
+from users.models import CustomUser
+from .models import ServerLocation
+
+
+class SiteListQueryBudgetTest(QueryBudgetMixin, TestCase):
+    """The site list loads PICs and occupants up front, so its query count doesn't depend on the number of sites."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.pic = CustomUser.objects.create_user(username='pic', password='password123', first_name='Site', last_name='PIC', is_staff=True)
+        cls.vendor = CustomUser.objects.create_user(username='vendor', password='password123', first_name='Vendor')
+
+    def setUp(self):
+        self.names = (f'Site {i}' for i in itertools.count())
+        self.client.force_login(self.vendor)
+
+    def seed(self, count):
+        # Every site gets a PIC and someone checked in
+        sites = ServerLocation.objects.bulk_create([
+            ServerLocation(name=name, address='Jl. Gedebage', pic=self.pic) for name in itertools.islice(self.names, count)
+        ], batch_size=1000)
+        now = timezone.now()
+        logs = ServerRoomAccessLog.objects.bulk_create([
+            ServerRoomAccessLog(user=self.vendor, location=site, notes='Maintenance', status='Checked-In', entry_timestamp=now)
+            for site in sites
+        ], batch_size=1000)
+        SiteOccupancy.objects.bulk_create([
+            SiteOccupancy(location_id=log.location_id, log=log, user=self.vendor, checked_in_at=now) for log in logs
+        ], batch_size=1000)
+
+    def test_site_list(self):
+        self.assertQueryBudget(reverse('site_list'), 4, self.seed)
+
+
+class FaceServiceMatch:
+    """Stands in for the async face-service client, verifying every probe."""
+
+    async def verify(self, user_id, files):
+        return httpx.Response(200, json={'verified': True}, request=httpx.Request('POST', f'http://face/verify/{user_id}'))
+
+
+class SiteOccupancyTest(TempMediaRootMixin, TestCase):
+    """Check-in and check-out keep SiteOccupancy, and with it the site list, in step with the logs."""
+
+    def setUp(self):
+        self.vendors = [
+            CustomUser.objects.create_user(username=f'vendor{i}', password='password123', first_name=f'Vendor{i}', is_face_enrolled=True)
+            for i in range(2)
+        ]
+        self.sites = [ServerLocation.objects.create(name=f'Site {i}', address='Jl. Gedebage') for i in range(2)]
+        self.logs = [
+            ServerRoomAccessLog.objects.create(user=vendor, location=self.sites[0], notes='Maintenance', status='Approved')
+            for vendor in self.vendors
+        ]
+
+    async def check_in(self, log):
+        client = AsyncClient()
+        await client.aforce_login(log.user)
+        with mock.patch.object(face_client, 'get_async_client', return_value=FaceServiceMatch()):
+            return await client.post(reverse('process_check_in', args=[log.id]),
+                                     {'photo': SimpleUploadedFile('checkin.jpg', b'jpeg', content_type='image/jpeg')})
+
+    def check_out(self, log):
+        self.client.force_login(log.user)
+        return self.client.post(reverse('process_check_out', args=[log.id]), {'activity_report': 'Done', 'outcome': 'Success'})
+
+    def occupants(self, site):
+        self.client.force_login(self.vendors[0])
+        sites = self.client.get(reverse('site_list')).context['sites']
+        return [occupant.user.first_name for occupant in next(s for s in sites if s.id == site.id).occupants.all()]
+
+    async def test_check_in_and_out_through_the_views(self):
+        for log in self.logs:
+            response = await self.check_in(log)
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(await sync_to_async(self.occupants)(self.sites[0]), ['Vendor0', 'Vendor1'])
+
+        response = await sync_to_async(self.check_out)(self.logs[0])
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(await sync_to_async(self.occupants)(self.sites[0]), ['Vendor1'])
+
+    def test_check_out_frees_the_site(self):
+        for log in self.logs:
+            log.status = 'Checked-In'
+            log.entry_timestamp = timezone.now()
+            log.save()
+        self.assertEqual(self.occupants(self.sites[0]), ['Vendor0', 'Vendor1'])
+
+        self.assertEqual(self.check_out(self.logs[0]).status_code, 302)
+        self.assertEqual(self.occupants(self.sites[0]), ['Vendor1'])
+        self.check_out(self.logs[1])
+        self.assertEqual(self.occupants(self.sites[0]), [])
+        self.assertFalse(SiteOccupancy.objects.exists())
+
+    def test_occupancy_follows_the_log(self):
+        log = self.logs[0]
+        log.status = 'Checked-In'
+        log.entry_timestamp = timezone.now()
+        log.save()
+        self.assertEqual(SiteOccupancy.objects.get().checked_in_at, log.entry_timestamp)
+
+        log.location = self.sites[1]
+        log.save()
+        self.assertEqual(self.occupants(self.sites[0]), [])
+        self.assertEqual(self.occupants(self.sites[1]), ['Vendor0'])
+
+        log.delete()
+        self.assertEqual(SiteOccupancy.objects.count(), 0)
+
+    def test_approval_alone_does_not_occupy(self):
+        log = ServerRoomAccessLog.objects.create(user=self.vendors[0], location=self.sites[1], notes='Maintenance', status='Pending')
+        log.status = 'Approved'
+        log.save()
+        self.assertEqual(SiteOccupancy.objects.count(), 0)
@@ -3,12 +3,14 @@ from django.shortcuts import render
 # Create your views here.
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
+from django.db.models import Prefetch
+from logs.models import SiteOccupancy
 from .models import ServerLocation
 
 @login_required
 def site_list(request):
-    sites = ServerLocation.objects.all()
-    for site in sites:
-        # Find the active log by looking for a 'Checked-In' status
-        site.active_log = site.serverroomaccesslog_set.filter(status='Checked-In').first()
+    # Who is inside each room comes from the occupancy table in one extra query, not one per site
+    sites = ServerLocation.objects.select_related('pic').prefetch_related(
+        Prefetch('occupants', queryset=SiteOccupancy.objects.select_related('user').order_by('checked_in_at'))
+    )
     return render(request, 'sites/list.html', {'sites': sites})
\ No newline at end of file
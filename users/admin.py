@@ -24,6 +24,7 @@ admin.site.register(CustomUser, CustomUserAdmin)
 
 class FaceChangeRequestAdmin(admin.ModelAdmin):
     list_display = ('user', 'status', 'requested_at')
+    list_select_related = ('user',)
     list_filter = ('status',)
     readonly_fields = ('user', 'requested_at', 'reviewed_by')
 
@@ -1,3 +1,182 @@
-from django.test import TestCase
+import itertools
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import requests
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncClient, TestCase, override_settings
+from django.urls import reverse
+
+from access_control import face_client
+from access_control.testing import QueryBudgetMixin
+from .models import CustomUser, FaceChangeRequest
+
+
+class UserListQueryBudgetTest(QueryBudgetMixin, TestCase):
+    """The user lists load their relations up front, so their query count doesn't depend on the number of rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user(username='pic', password='password123', is_staff=True)
+
+    def setUp(self):
+        self.usernames = (f'vendor{i}' for i in itertools.count())
+        self.client.force_login(self.staff)
+
+    def create_users(self, count):
+        # No password hashing: 10,000 hashes would take minutes
+        return CustomUser.objects.bulk_create([
+            CustomUser(username=username, first_name='Vendor', last_name=username, department='Operations', password='!')
+            for username in itertools.islice(self.usernames, count)
+        ], batch_size=1000)
+
+    def test_face_approval_queue(self):
+        def seed(count):
+            FaceChangeRequest.objects.bulk_create([FaceChangeRequest(user=user) for user in self.create_users(count)], batch_size=1000)
+        self.assertQueryBudget(reverse('face_approval_queue'), 3, seed)
+
+    def test_search_users(self):
+        self.assertQueryBudget(reverse('search_users') + '?q=vendor', 3, self.create_users)
+
+
+class FaceService:
+    """Stands in for the async face-service client, answering enrollments with `status` or raising `error`."""
+
+    def __init__(self, status=200, error=None):
+        self.status = status
+        self.error = error
+        self.enrolled = []
+
+    async def enroll_poses(self, user_id, files):
+        if self.error:
+            raise self.error
+        self.enrolled.append((user_id, sorted(files)))
+        return httpx.Response(self.status, json={}, request=httpx.Request('POST', f'http://face/enroll/{user_id}/poses'))
+
+
+def pose_photos():
+    return {f'photo_{pose}': SimpleUploadedFile(f'{pose}.jpg', b'jpeg', content_type='image/jpeg') for pose in ('front', 'left', 'right')}
+
+
+class FaceEnrollmentTest(TestCase):
+    """Enrollment goes through the face service; re-enrollment waits for a reviewer first."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='vendor', password='password123')
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir, ignore_errors=True)
+
+    async def post(self, url, data, face_service):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        with mock.patch.object(face_client, 'get_async_client', return_value=face_service), \
+                override_settings(BASE_DIR=self.base_dir):
+            return await client.post(url, data)
+
+    async def test_enroll(self):
+        face_service = FaceService()
+        response = await self.post(reverse('face_enroll'), pose_photos(), face_service)
+
+        self.assertRedirects(response, reverse('site_list'), fetch_redirect_response=False)
+        self.assertEqual(face_service.enrolled, [(self.user.id, ['front', 'left', 'right'])])
+        await self.user.arefresh_from_db()
+        self.assertTrue(self.user.is_face_enrolled)
+
+    async def test_enroll_rejected_by_the_face_service(self):
+        response = await self.post(reverse('face_enroll'), pose_photos(), FaceService(status=422))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([str(m) for m in response.context['messages']], ['Error: Could not connect to the verification service.'])
+        await self.user.arefresh_from_db()
+        self.assertFalse(self.user.is_face_enrolled)
+
+    async def test_enroll_while_the_face_service_is_unavailable(self):
+        face_service = FaceService(error=face_client.FaceServiceUnavailable("circuit open"))
+        response = await self.post(reverse('face_enroll'), pose_photos(), face_service)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([str(m) for m in response.context['messages']], ['Error: Could not connect to the verification service.'])
+        await self.user.arefresh_from_db()
+        self.assertFalse(self.user.is_face_enrolled)
+
+    async def test_enroll_needs_every_pose(self):
+        face_service = FaceService()
+        photos = pose_photos()
+        del photos['photo_left']
+        response = await self.post(reverse('face_enroll'), photos, face_service)
+
+        self.assertEqual([str(m) for m in response.context['messages']], ['All three photos are required for enrollment.'])
+        self.assertEqual(face_service.enrolled, [])
+
+    async def test_re_enroll_waits_for_review(self):
+        face_service = mock.Mock()
+        response = await self.post(reverse('re_enroll_face'), pose_photos(), face_service)
+
+        self.assertRedirects(response, reverse('user_settings'), fetch_redirect_response=False)
+        self.assertEqual(await FaceChangeRequest.objects.filter(user=self.user, status='Pending').acount(), 1)
+        pending_dir = os.path.join(self.base_dir, 'face_db_pending', str(self.user.id))
+        self.assertEqual(sorted(os.listdir(pending_dir)), ['front.jpeg', 'left.jpeg', 'right.jpeg'])
+        # The face service only sees the new photos once a reviewer approves them
+        self.assertEqual(face_service.mock_calls, [])
+
+
+class FaceChangeReviewTest(TestCase):
+    """Approving a face change swaps the user's templates on the face service before clearing the request."""
+
+    def setUp(self):
+        self.staff = CustomUser.objects.create_user(username='pic', password='password123', is_staff=True)
+        self.user = CustomUser.objects.create_user(username='vendor', password='password123', is_face_enrolled=True)
+        self.change_request = FaceChangeRequest.objects.create(user=self.user)
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir, ignore_errors=True)
+        settings_override = override_settings(BASE_DIR=self.base_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.pending_dir = os.path.join(self.base_dir, 'face_db_pending', str(self.user.id))
+        os.makedirs(self.pending_dir)
+        for pose in ('front', 'left', 'right'):
+            with open(os.path.join(self.pending_dir, f'{pose}.jpeg'), 'wb') as f:
+                f.write(b'jpeg')
+        self.client.force_login(self.staff)
+
+    def approve(self, status=200):
+        response = requests.Response()
+        response.status_code = status
+        face_service = mock.Mock()
+        face_service.replace_user.return_value = response
+        with mock.patch.object(face_client, 'get_client', return_value=face_service):
+            self.client.post(reverse('approve_face_change', args=[self.change_request.id]))
+        self.change_request.refresh_from_db()
+        return face_service
+
+    def test_approve(self):
+        face_service = self.approve()
+
+        face_service.replace_user.assert_called_once()
+        user_id, files = face_service.replace_user.call_args.args
+        self.assertEqual(user_id, self.user.id)
+        self.assertEqual([name for _, (name, _, _) in files], ['front.jpeg', 'left.jpeg', 'right.jpeg'])
+        self.assertEqual((self.change_request.status, self.change_request.reviewed_by), ('Approved', self.staff))
+        self.assertFalse(os.path.exists(self.pending_dir))
+
+    def test_failed_replace_keeps_the_request(self):
+        self.approve(status=502)
+        self.assertEqual(self.change_request.status, 'Pending')
+        self.assertEqual(len(os.listdir(self.pending_dir)), 3)
+
+    def test_review_requires_post(self):
+        with mock.patch.object(face_client, 'get_client') as get_client:
+            for name in ('approve_face_change', 'deny_face_change'):
+                self.assertEqual(self.client.get(reverse(name, args=[self.change_request.id])).status_code, 405)
+        get_client.assert_not_called()
+        self.change_request.refresh_from_db()
+        self.assertEqual(self.change_request.status, 'Pending')
+
+    def test_deny(self):
+        self.client.post(reverse('deny_face_change', args=[self.change_request.id]))
+        self.change_request.refresh_from_db()
+        self.assertEqual(self.change_request.status, 'Denied')
+        self.assertFalse(os.path.exists(self.pending_dir))
@@ -1,17 +1,23 @@
 # users/views.py
+import mimetypes
 import os
 import shutil
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
 from .forms import CustomUserCreationForm, CustomAuthenticationForm, UserProfileUpdateForm
 from .models import CustomUser, FaceChangeRequest
 import requests
 from django.conf import settings
-import base64
+from access_control import face_client
+from access_control.shortcuts import arender
 from django.shortcuts import render, redirect, get_object_or_404
-from django.core.files.base import ContentFile
+from django.core.exceptions import PermissionDenied
+from django.db.models import Q
+from django.http import JsonResponse
+from asgiref.sync import sync_to_async
 
 def app_view(request):
     return render(request, 'app.html')
@@ -52,50 +58,44 @@ def user_logout(request):
 
 
 @login_required
-def face_enroll(request):
+async def face_enroll(request):
+    # Async so the worker is free while the face service embeds the photos
     if request.method == 'POST':
-        # Get the three image data strings from the form
-        photo_front_data = request.POST.get('photo_front', '')
-        photo_left_data = request.POST.get('photo_left', '')
-        photo_right_data = request.POST.get('photo_right', '')
+        # Get the three photos uploaded by the browser
+        photos = {pose: request.FILES.get(f'photo_{pose}') for pose in ('front', 'left', 'right')}
 
-        if not (photo_front_data and photo_left_data and photo_right_data):
+        if not all(photos.values()):
             messages.error(request, "All three photos are required for enrollment.")
-            return render(request, 'users/face_enroll.html')
+            return await arender(request, 'users/face_enroll.html')
 
         try:
-            photos_to_enroll = {
-                'front.png': photo_front_data,
-                'left.png': photo_left_data,
-                'right.png': photo_right_data
-            }
-
-            # Loop through and send each photo to the face service
-            for filename, data_url in photos_to_enroll.items():
-                format, imgstr = data_url.split(';base64,')
-                ext = format.split('/')[-1]
-                image_file = ContentFile(base64.b64decode(imgstr), name=filename)
-
-                files = {'file': (image_file.name, image_file.read(), f'image/{ext}')}
-                enroll_url = f"{settings.FACE_SERVICE_URL}/enroll/{request.user.id}"
-                response = requests.post(enroll_url, files=files)
-                response.raise_for_status()
-
-            # If all uploads succeed, update the user profile
-            request.user.is_face_enrolled = True
-            request.user.save()
+            user = await request.auser()
+
+            # Send all three poses in one request; the face service enrolls all of them or none.
+            # The uploaded bytes are passed through as-is, without decoding or re-encoding.
+            files = {}
+            for pose, upload in photos.items():
+                content_type = upload.content_type or 'image/jpeg'
+                files[pose] = (f"{pose}.{content_type.split('/')[-1]}", upload.read(), content_type)
+
+            response = await face_client.get_async_client().enroll_poses(user.id, files)
+            response.raise_for_status()
+
+            # If the enrollment succeeds, update the user profile
+            user.is_face_enrolled = True
+            await user.asave(update_fields=['is_face_enrolled'])
 
             messages.success(request, 'Face enrollment successful! You can now request access.')
             return redirect('site_list')
 
-        except requests.exceptions.RequestException:
+        except face_client.FACE_SERVICE_ERRORS:
             messages.error(request, 'Error: Could not connect to the verification service.')
-            return render(request, 'users/face_enroll.html')
+            return await arender(request, 'users/face_enroll.html')
         except Exception as e:
             messages.error(request, f'An unknown error occurred: {e}')
-            return render(request, 'users/face_enroll.html')
+            return await arender(request, 'users/face_enroll.html')
             
-    return render(request, 'users/face_enroll.html')
+    return await arender(request, 'users/face_enroll.html')
 
 @login_required
 def search_users(request):
@@ -103,10 +103,10 @@ def search_users(request):
     if query:
         # Search for users by first name, last name, or username
         users = CustomUser.objects.filter(
-            models.Q(first_name__icontains=query) |
-            models.Q(last_name__icontains=query) |
-            models.Q(username__icontains=query)
-        ).exclude(id=request.user.id)[:5] # Exclude self, limit to 5 results
+            Q(first_name__icontains=query) |
+            Q(last_name__icontains=query) |
+            Q(username__icontains=query)
+        ).exclude(id=request.user.id).only('id', 'first_name', 'last_name')[:5] # Exclude self, limit to 5 results
 
         results = [{'id': user.id, 'name': user.get_full_name()} for user in users]
         return JsonResponse(results, safe=False)
@@ -138,23 +138,33 @@ def face_approval_queue(request):
     return render(request, 'users/face_approval_queue.html', context)
 
 @login_required
+@require_POST
 def approve_face_change(request, request_id):
     if not request.user.is_staff:
         raise PermissionDenied
 
     change_request = get_object_or_404(FaceChangeRequest, id=request_id)
     user_to_update = change_request.user
-    
-    # Define paths
     pending_dir = os.path.join(settings.BASE_DIR, 'face_db_pending', str(user_to_update.id))
-    final_dir = os.path.join(settings.BASE_DIR, 'face_recognition', 'face_db', str(user_to_update.id))
 
-    # 1. Remove old photos if they exist
-    if os.path.exists(final_dir):
-        shutil.rmtree(final_dir)
-        
-    # 2. Move new photos from pending to final destination
-    shutil.move(pending_dir, final_dir)
+    # 1. Send the new photos to the face service, which swaps the user's templates atomically
+    try:
+        files = []
+        for filename in sorted(os.listdir(pending_dir)):
+            with open(os.path.join(pending_dir, filename), 'rb') as f:
+                content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                files.append(('files', (filename, f.read(), content_type)))
+        response = face_client.get_client().replace_user(user_to_update.id, files)
+        response.raise_for_status()
+    except requests.exceptions.RequestException:
+        messages.error(request, 'Error: Could not update the face profile on the verification service.')
+        return redirect('face_approval_queue')
+    except OSError:
+        messages.error(request, f"The new photos for {user_to_update.get_full_name()} could not be found.")
+        return redirect('face_approval_queue')
+
+    # 2. The pending photos are no longer needed
+    shutil.rmtree(pending_dir)
 
     # 3. Update the request status
     change_request.status = 'Approved'
@@ -166,6 +176,7 @@ def approve_face_change(request, request_id):
 
 
 @login_required
+@require_POST
 def deny_face_change(request, request_id):
     if not request.user.is_staff:
         raise PermissionDenied
@@ -185,40 +196,37 @@ def deny_face_change(request, request_id):
     messages.warning(request, f"Face change for {change_request.user.get_full_name()} has been denied.")
     return redirect('face_approval_queue')
 
+def _save_pending_photos(pending_dir, photos):
+    # Start from an empty directory so photos from an earlier request don't linger
+    if os.path.exists(pending_dir):
+        shutil.rmtree(pending_dir)
+    os.makedirs(pending_dir)
+
+    # Save each uploaded photo to the pending directory as-is
+    for pose, upload in photos.items():
+        content_type = upload.content_type or 'image/jpeg'
+        with open(os.path.join(pending_dir, f"{pose}.{content_type.split('/')[-1]}"), 'wb') as f:
+            for chunk in upload.chunks():
+                f.write(chunk)
+
 @login_required
-def re_enroll_face(request):
+async def re_enroll_face(request):
     if request.method == 'POST':
-        photo_front_data = request.POST.get('photo_front', '')
-        photo_left_data = request.POST.get('photo_left', '')
-        photo_right_data = request.POST.get('photo_right', '')
+        photos = {pose: request.FILES.get(f'photo_{pose}') for pose in ('front', 'left', 'right')}
 
-        if not (photo_front_data and photo_left_data and photo_right_data):
+        if not all(photos.values()):
             messages.error(request, "All three photos are required.")
-            return render(request, 'users/re_enroll.html')
+            return await arender(request, 'users/re_enroll.html')
 
         try:
+            user = await request.auser()
             # Define the temporary pending directory
-            pending_dir = os.path.join(settings.BASE_DIR, 'face_db_pending', str(request.user.id))
-            
-            # Create the directory if it doesn't exist
-            os.makedirs(pending_dir, exist_ok=True)
-
-            photos_to_save = {
-                'front.png': photo_front_data,
-                'left.png': photo_left_data,
-                'right.png': photo_right_data
-            }
-
-            # Loop through, decode, and save each photo to the pending directory
-            for filename, data_url in photos_to_save.items():
-                format, imgstr = data_url.split(';base64,')
-                image_data = base64.b64decode(imgstr)
-                with open(os.path.join(pending_dir, filename), 'wb') as f:
-                    f.write(image_data)
+            pending_dir = os.path.join(settings.BASE_DIR, 'face_db_pending', str(user.id))
+            await sync_to_async(_save_pending_photos)(pending_dir, photos)
             
             # Create or update the request object in the database
-            change_request, created = FaceChangeRequest.objects.update_or_create(
-                user=request.user,
+            change_request, created = await FaceChangeRequest.objects.aupdate_or_create(
+                user=user,
                 defaults={'status': 'Pending'}
             )
             
@@ -227,4 +235,4 @@ def re_enroll_face(request):
         except Exception as e:
             messages.error(request, f"An error occurred: {e}")
 
-    return render(request, 'users/re_enroll.html')
\ No newline at end of file
+    return await arender(request, 'users/re_enroll.html')